@@ -1,85 +1,69 @@
 from crewai import Agent, Task, Crew
 from embeddings import EmbeddingHandler
-from vector_store import VectorStore
+from vector_store import create_vector_store
 from llm_config import get_llm
 from keywords import KEYWORDS
+from text_features import (
+    MATCHER, MAJORS, MAJORS_LOWER, SEARCH_EXPANSIONS, PROMPT_EXPANSIONS, detect_topics, expand_keywords,
+    query_weights, keyword_scores, is_majors_list_question
+)
+from training_program import TRAINING_PROGRAM
+from context_builder import ContextBuilder, CONTEXT_TOKEN_BUDGET
+from answer_cache import SemanticAnswerCache
+from scoring import ScoringSessions
+from chat_history import create_chat_history
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import asyncio
+import os
 import re
 
+# Câu trả lời của LLM khi context không có thông tin (xem create_task)
+NOT_FOUND_ANSWER = "Không tìm thấy thông tin"
+
+
 class ChatBotAgent:
-    def __init__(self):
-        self.embedding_handler = EmbeddingHandler()
-        self.vector_store = VectorStore()
-        self.llm = get_llm()
+    def __init__(self, vector_store=None, embedding_handler=None, llm=None, answer_cache=None):
+        self.embedding_handler = embedding_handler or EmbeddingHandler(cache_path=os.getenv("EMBEDDING_CACHE_PATH"))
+        # Tải model trong nền trong khi khởi tạo Qdrant client và LLM
+        self.embedding_handler.warmup(background=True)
+        self.vector_store = vector_store or create_vector_store()
+        # Bật tìm kiếm kết hợp dense + BM25 (collection phải có sparse vectors)
+        self.use_hybrid_search = os.getenv("HYBRID_SEARCH", "0") == "1"
+        self.llm = llm or get_llm()
         self.keywords = KEYWORDS
+        # Giới hạn token của context đưa vào prompt (CONTEXT_TOKEN_BUDGET)
+        self.context_builder = ContextBuilder(token_budget=CONTEXT_TOKEN_BUDGET)
+        # Thống kê context của câu hỏi đang xử lý, riêng cho từng luồng
+        self._local = threading.local()
+        # Cache câu trả lời theo độ tương đồng câu hỏi (ANSWER_CACHE_ENABLED, ANSWER_CACHE_THRESHOLD,
+        # ANSWER_CACHE_TTL)
+        self.answer_cache = answer_cache or SemanticAnswerCache()
 
-        # Khởi tạo độ ưu tiên cho các chủ đề
-        self.priority_weights = {
-            "khoa": 5,
-            "ngành học": 5,
-            "học phí": 5,
-            "xếp loại học lực": 2,
-            "xếp hạng học lực": 2,
-            "đăng nhập": 1,
-            "đổi mật khẩu": 1,
-            "đăng ký học": 1,
-            "thanh toán học phí": 1,
-            "hoạt động ngoại khóa": 1,
-            "xem lịch thi": 1,
-            "tra cứu điểm": 1,
-            "hủy học phần": 1,
-            "gửi tin nhắn": 1,
-            "tổng số tín chỉ": 2,
-        }
-        # Lưu trữ độ ưu tiên cao nhất từ các câu hỏi trước
-        self.max_priority = 0
-        # Đếm số lượng câu hỏi để reset max_priority nếu cần
-        self.query_count = 0
-        # Thêm danh sách để lưu trữ lịch sử chat không giới hạn
-        self.chat_history = []  # Danh sách lưu trữ các cặp (query, response)
+        # Độ ưu tiên chủ đề theo từng phiên; mỗi câu hỏi dùng một ScoringContext riêng
+        self.scoring_sessions = ScoringSessions()
+        # Lịch sử chat theo phiên, giới hạn số lượt và xóa phiên không hoạt động
+        # (CHAT_HISTORY_BACKEND, CHAT_HISTORY_TURNS, CHAT_HISTORY_IDLE_TTL)
+        self.chat_history = create_chat_history()
 
         # Lưu trữ bảng chương trình đào tạo đại trà
-        self.training_program = {
-            "II: Nghệ thuật": {
-                "majors": ["Thiết kế đồ họa"],
-                "Khóa 17": 372000,
-                "Khóa 18-19": 369200,
-                "Khóa 20-21": 387000
-            },
-            "III: Kinh doanh và quản lý, pháp luật": {
-                "majors": ["Hệ thống thông tin quản lý", "Quản trị văn phòng", "Thương mại điện tử", "Kinh tế số"],
-                "Khóa 17": 387500,
-                "Khóa 18-19": 384600,
-                "Khóa 20-21": 403200
-            },
-            "V: Máy tính và công nghệ thông tin, Công nghệ kỹ thuật…": {
-                "majors": [
-                    "Công nghệ thông tin", "Khoa học máy tính", "Truyền thông và mạng máy tính", "Kỹ thuật phần mềm",
-                    "Hệ thống thông tin", "An toàn thông tin", "Công nghệ kỹ thuật điện, điện tử",
-                    "Công nghệ ô tô và Giao thông thông minh", "Công nghệ kỹ thuật điều khiển và tự động hóa",
-                    "Công nghệ kỹ thuật máy tính", "Công nghệ kỹ thuật điện tử, viễn thông", "Kỹ thuật y sinh",
-                    "Kỹ thuật cơ điện tử thông minh và robot"
-                ],
-                "Khóa 17": 453000,
-                "Khóa 18-19": 450000,
-                "Khóa 20-21": 467700
-            },
-            "VII: Báo chí và thông tin…": {
-                "majors": ["Truyền thông đa phương tiện", "Công nghệ truyền thông"],
-                "Khóa 17": 372000,
-                "Khóa 18-19": 369200,
-                "Khóa 20-21": 387000
-            }
-        }
+        self.training_program = TRAINING_PROGRAM
         # print("🔍 self.training_program:", self.training_program)
 
-        self.agent = Agent(
+        # Agent mẫu (vai trò, mục tiêu); mỗi câu hỏi chạy trên một Agent riêng
+        # từ new_agent vì crewai thay đổi trạng thái của Agent trong lúc kickoff
+        self.agent = self.new_agent()
+
+    def new_agent(self):
+        """Agent mới cho một câu hỏi, dùng chung LLM."""
+        return Agent(
             role="ICTU Handbook Assistant",
             goal="Truy xuất và diễn giải thông tin từ sổ tay ICTU để trả lời câu hỏi của sinh viên",
             backstory="Tôi là trợ lý ảo hỗ trợ sinh viên ICTU, truy xuất thông tin từ sổ tay sinh viên và cung cấp câu trả lời chính xác, ngắn gọn.",
             verbose=True,
             llm=self.llm
         )
-        
+
     def is_true_false_question(self, query):
         """Kiểm tra xem câu hỏi có phải dạng đúng/sai không"""
         true_false_keywords = ["đúng không", "có phải", "không phải", "có đúng", "có thật", "thật không"]
@@ -307,235 +291,164 @@ class ChatBotAgent:
         # Nếu không tìm thấy thông tin khớp, trả về Sai
         return False, f"Sai, không tìm thấy thông tin xác nhận cho {statement}. (Nguồn: Dữ liệu chương trình đào tạo)"
 
-    def search_data(self, query, top_k=50):
+    def retrieve(self, query, query_embedding, top_k, topics=None):
+        """Lấy ứng viên từ vector store: tìm kiếm dense hoặc kết hợp dense + BM25."""
+        if self.use_hybrid_search:
+            return self.vector_store.hybrid_search(query_embedding, query, top_k=top_k, topics=topics)
+        return self.vector_store.search(query_embedding, top_k=top_k, topics=topics)
+
+    async def aretrieve(self, query, query_embedding, top_k, topics=None):
+        """Phiên bản asyncio của retrieve."""
+        if self.use_hybrid_search:
+            return await self.vector_store.ahybrid_search(query_embedding, query, top_k=top_k, topics=topics)
+        return await self.vector_store.asearch(query_embedding, top_k=top_k, topics=topics)
+
+    @staticmethod
+    def query_topics(query):
+        """(từ khóa, chủ đề) của câu hỏi; chủ đề dùng để lọc ứng viên trong vector store."""
+        query_hits = MATCHER.find(query.lower())
+        return query_hits, detect_topics(query, query_hits)
+
+    @staticmethod
+    def merge_candidates(filtered, unfiltered):
+        """Ứng viên lọc theo chủ đề, bổ sung bằng ứng viên tìm không lọc (bỏ trùng ID); rescore
+        xếp hạng lại toàn bộ."""
+        seen = {result.id for result in filtered}
+        return list(filtered) + [result for result in unfiltered if result.id not in seen]
+
+    def retrieve_candidates(self, query, query_embedding, top_k):
+        """Bước tìm kiếm của search_data: trả về (từ khóa của câu hỏi, ứng viên chưa chấm lại điểm)."""
+        # Lọc ứng viên theo chủ đề của câu hỏi ngay trong vector store; nếu chưa đủ top_k (chủ đề
+        # nhận nhầm hoặc ít đoạn) thì bổ sung bằng tìm kiếm không lọc
+        query_hits, topics = self.query_topics(query)
+        search_results = self.retrieve(query, query_embedding, top_k, topics) if topics else []
+        if len(search_results) < top_k:
+            search_results = self.merge_candidates(search_results, self.retrieve(query, query_embedding, top_k))
+        return query_hits, search_results
+
+    async def aretrieve_candidates(self, query, query_embedding, top_k):
+        """Phiên bản asyncio của retrieve_candidates."""
+        query_hits, topics = self.query_topics(query)
+        search_results = await self.aretrieve(query, query_embedding, top_k, topics) if topics else []
+        if len(search_results) < top_k:
+            search_results = self.merge_candidates(search_results,
+                                                   await self.aretrieve(query, query_embedding, top_k))
+        return query_hits, search_results
+
+    def search_data(self, query, top_k=50, session_id=None, query_embedding=None):
+        """Tìm và chấm lại điểm các đoạn liên quan; trả về (kết quả, lỗi). Truyền query_embedding
+        nếu đã encode câu hỏi (ví dụ để tra cache câu trả lời) để không encode lại."""
         try:
-            query_embedding = self.embedding_handler.generate_embeddings([query])[0]
-            search_results = self.vector_store.search(query_embedding, top_k=top_k)
-            
-            if not search_results:
-                return None, "🙁 Không tìm thấy thông tin liên quan trong sổ tay ICTU."
-
-            # Đếm số lượng câu hỏi và reset max_priority nếu cần
-            self.query_count += 1
-            if self.query_count > 10:  # Reset sau 10 câu hỏi để tránh độ ưu tiên tăng quá cao
-                self.max_priority = 0
-                self.query_count = 0
-
-            query_lower = query.lower()
-            relevant_keywords = []
-            for topic, keywords in self.keywords.items():
-                if any(keyword in query_lower for keyword in keywords):
-                    relevant_keywords.extend(keywords)
-                    break
+            if query_embedding is None:
+                query_embedding = self.embedding_handler.encode_query(query)
+            query_hits, search_results = self.retrieve_candidates(query, query_embedding, top_k)
+            return self.rescore(query_hits, search_results, top_k, session_id)
+        except Exception as e:
+            return None, f"❌ Lỗi khi tìm kiếm dữ liệu: {str(e)}"
 
-            # Thêm từ khóa và tăng độ ưu tiên cho các chủ đề
-            if "khoa" in query_lower or "ngành học" in query_lower or "liệt kê" in query_lower:
-                relevant_keywords.extend([
-                    "khoa", "ngành học", "cơ cấu tổ chức", "khoa học cơ bản", "công nghệ thông tin",
-                    "công nghệ điện tử và truyền thông", "hệ thống thông tin kinh tế", "công nghệ tự động hóa",
-                    "truyền thông đa phương tiện", "thương mại điện tử"
-                ])
-                self.priority_weights["khoa"] = max(self.priority_weights["khoa"] + 2, self.max_priority)
-                self.priority_weights["ngành học"] = max(self.priority_weights["ngành học"] + 2, self.max_priority)
-                self.max_priority = max(self.max_priority, self.priority_weights["khoa"], self.priority_weights["ngành học"])
-
-            # Thêm từ khóa cho các ngành học từ bảng chương trình đào tạo
-            majors = []
-            for block in self.training_program.values():
-                majors.extend(block["majors"])
-            for major in majors:
-                if major.lower() in query_lower:
-                    relevant_keywords.append(major)
-
-            # Thêm từ khóa cho học phí và khóa học
-            if "học phí" in query_lower or "mỗi tín chỉ" in query_lower or "bao nhiêu tiền" in query_lower:
-                relevant_keywords.extend(["học phí", "đồng/tín chỉ", "mỗi tín chỉ", "khóa 17", "khóa 18-19", "khóa 20-21"])
-                self.priority_weights["học phí"] = max(self.priority_weights["học phí"] + 2, self.max_priority)
-                self.max_priority = max(self.max_priority, self.priority_weights["học phí"])
-            if "khóa 17" in query_lower:
-                relevant_keywords.append("khóa 17")
-            if "khóa 18" in query_lower or "khóa 19" in query_lower or "khóa 18-19" in query_lower:
-                relevant_keywords.extend(["khóa 18", "khóa 19", "khóa 18-19"])
-            if "khóa 20" in query_lower or "khóa 21" in query_lower or "khóa 20-21" in query_lower:
-                relevant_keywords.extend(["khóa 20", "khóa 21", "khóa 20-21"])
-
-            # Mở rộng từ khóa cho các chủ đề khác
-            if "điều 3" in query_lower:
-                relevant_keywords.extend(["điều 3", "chương trình đào tạo", "kỹ sư", "trình độ bậc 7", "cử nhân"])
-            if "cử nhân" in query_lower:
-                relevant_keywords.extend(["cử nhân", "chương trình đào tạo", "đại học"])
-            if "kỹ sư" in query_lower:
-                relevant_keywords.extend(["kỹ sư", "trình độ bậc 7", "chương trình đào tạo", "tín chỉ", "khối lượng học tập"])
-            if "xếp loại học lực" in query_lower:
-                relevant_keywords.extend(["xếp loại học lực", "xuất sắc", "giỏi", "khá", "trung bình", "yếu", "kém", "điểm trung bình tích lũy"])
-                self.priority_weights["xếp loại học lực"] = max(self.priority_weights["xếp loại học lực"] + 1, self.max_priority)
-                self.max_priority = max(self.max_priority, self.priority_weights["xếp loại học lực"])
-            if "xếp hạng học lực" in query_lower:
-                relevant_keywords.extend(["xếp hạng học lực", "hạng bình thường", "hạng yếu", "điểm trung bình tích lũy"])
-                self.priority_weights["xếp hạng học lực"] = max(self.priority_weights["xếp hạng học lực"] + 1, self.max_priority)
-                self.max_priority = max(self.max_priority, self.priority_weights["xếp hạng học lực"])
-            if "đăng nhập" in query_lower:
-                relevant_keywords.extend(["đăng nhập", "mã sinh viên", "mật khẩu", "ngày tháng năm sinh", "viết hoa", "hệ thống"])
-                self.priority_weights["đăng nhập"] = max(self.priority_weights["đăng nhập"] + 1, self.max_priority)
-                self.max_priority = max(self.max_priority, self.priority_weights["đăng nhập"])
-            if "đổi mật khẩu" in query_lower:
-                relevant_keywords.extend(["đổi mật khẩu", "thay đổi mật khẩu", "cập nhật mật khẩu", "quản lý tài khoản", "phòng đào tạo", "hệ thống"])
-                self.priority_weights["đổi mật khẩu"] = max(self.priority_weights["đổi mật khẩu"] + 1, self.max_priority)
-                self.max_priority = max(self.max_priority, self.priority_weights["đổi mật khẩu"])
-            if "đăng ký học" in query_lower:
-                relevant_keywords.extend(["đăng ký học", "học phần", "hệ thống", "đăng ký tín chỉ"])
-                self.priority_weights["đăng ký học"] = max(self.priority_weights["đăng ký học"] + 1, self.max_priority)
-                self.max_priority = max(self.max_priority, self.priority_weights["đăng ký học"])
-            if "thanh toán học phí" in query_lower or "nộp tiền trước" in query_lower:
-                relevant_keywords.extend(["thanh toán học phí", "online", "đăng ký học kỳ tới", "nộp tiền trước", "chức năng thanh toán", "hệ thống"])
-                self.priority_weights["thanh toán học phí"] = max(self.priority_weights["thanh toán học phí"] + 1, self.max_priority)
-                self.max_priority = max(self.max_priority, self.priority_weights["thanh toán học phí"])
-            if "hoạt động ngoại khóa" in query_lower:
-                relevant_keywords.extend(["hoạt động ngoại khóa", "điểm ngoại khóa", "tham gia hoạt động", "đánh giá hoạt động"])
-                self.priority_weights["hoạt động ngoại khóa"] = max(self.priority_weights["hoạt động ngoại khóa"] + 1, self.max_priority)
-                self.max_priority = max(self.max_priority, self.priority_weights["hoạt động ngoại khóa"])
-            if "xem lịch thi" in query_lower:
-                relevant_keywords.extend(["xem lịch thi", "học kỳ", "đợt học"])
-                self.priority_weights["xem lịch thi"] = max(self.priority_weights["xem lịch thi"] + 1, self.max_priority)
-                self.max_priority = max(self.max_priority, self.priority_weights["xem lịch thi"])
-            if "tra cứu điểm" in query_lower:
-                relevant_keywords.extend(["tra cứu điểm", "học kỳ"])
-                self.priority_weights["tra cứu điểm"] = max(self.priority_weights["tra cứu điểm"] + 1, self.max_priority)
-                self.max_priority = max(self.max_priority, self.priority_weights["tra cứu điểm"])
-            if "hủy học phần" in query_lower:
-                relevant_keywords.extend(["hủy học phần", "đăng ký nhầm"])
-                self.priority_weights["hủy học phần"] = max(self.priority_weights["hủy học phần"] + 1, self.max_priority)
-                self.max_priority = max(self.max_priority, self.priority_weights["hủy học phần"])
-            if "gửi tin nhắn" in query_lower:
-                relevant_keywords.extend(["gửi tin nhắn", "người quản trị"])
-                self.priority_weights["gửi tin nhắn"] = max(self.priority_weights["gửi tin nhắn"] + 1, self.max_priority)
-                self.max_priority = max(self.max_priority, self.priority_weights["gửi tin nhắn"])
-            if "tổng số tín chỉ" in query_lower or "khối lượng học tập tối thiểu" in query_lower:
-                relevant_keywords.extend(["tổng số tín chỉ", "khối lượng học tập tối thiểu", "chương trình đào tạo", "kỹ sư", "trình độ bậc 7", "cử nhân", "điều 3"])
-                self.priority_weights["tổng số tín chỉ"] = max(self.priority_weights["tổng số tín chỉ"] + 1, self.max_priority)
-                self.max_priority = max(self.max_priority, self.priority_weights["tổng số tín chỉ"])
-
-            filtered_results = []
-            for result in search_results:
-                result_text = result.payload["text"].lower()
-                keyword_score = sum(1 for keyword in relevant_keywords if keyword in result_text)
-                
-                # Áp dụng độ ưu tiên theo chủ đề
-                if "khoa" in query_lower and "khoa" in result_text:
-                    keyword_score += self.priority_weights["khoa"]
-                if "ngành học" in query_lower and any(major.lower() in result_text for major in majors):
-                    keyword_score += self.priority_weights["ngành học"]
-                if "liệt kê" in query_lower and "khoa" in result_text:
-                    keyword_score += self.priority_weights["khoa"]
-                if "cơ cấu tổ chức" in result_text:
-                    keyword_score += 10  # Ưu tiên cao cho các đoạn văn chứa danh sách khoa
-                if "học phí" in query_lower and "đồng/tín chỉ" in result_text:
-                    keyword_score += self.priority_weights["học phí"]
-                if "xếp loại học lực" in query_lower and "điểm trung bình tích lũy" in result_text:
-                    keyword_score += self.priority_weights["xếp loại học lực"]
-                if "xếp hạng học lực" in query_lower and "điểm trung bình tích lũy" in result_text:
-                    keyword_score += self.priority_weights["xếp hạng học lực"]
-                if "đăng nhập" in query_lower and "hệ thống" in result_text:
-                    keyword_score += self.priority_weights["đăng nhập"]
-                if "đổi mật khẩu" in query_lower and "quản lý tài khoản" in result_text:
-                    keyword_score += self.priority_weights["đổi mật khẩu"]
-                if "đăng ký học" in query_lower and "hệ thống" in result_text:
-                    keyword_score += self.priority_weights["đăng ký học"]
-                if "thanh toán học phí" in query_lower and "hệ thống" in result_text:
-                    keyword_score += self.priority_weights["thanh toán học phí"]
-                if "tổng số tín chỉ" in result_text or "khối lượng học tập tối thiểu" in result_text:
-                    keyword_score += self.priority_weights["tổng số tín chỉ"]
-                if "trình độ bậc 7 kỹ sư" in result_text and "tín chỉ" in result_text:
-                    keyword_score += 3
-
-                combined_score = result.score + (keyword_score * 0.7)
-                if combined_score >= 0.1:  # Giảm ngưỡng từ 0.3 xuống 0.1
-                    filtered_results.append({
-                        "id": result.id,
-                        "text": result.payload["text"],
-                        "metadata": result.payload["metadata"],
-                        "score": combined_score
-                    })
-
-            filtered_results = sorted(filtered_results, key=lambda x: x["score"], reverse=True)
-            if not filtered_results:
-                return None, "🙁 Không tìm thấy thông tin liên quan trong sổ tay ICTU (score quá thấp)."
-            return filtered_results[:top_k], None
+    async def asearch_data(self, query, top_k=50, session_id=None, query_embedding=None):
+        """Phiên bản asyncio của search_data: encode ngoài event loop, tìm kiếm bằng client async."""
+        try:
+            if query_embedding is None:
+                query_embedding = await self.embedding_handler.aencode_query(query)
+            query_hits, search_results = await self.aretrieve_candidates(query, query_embedding, top_k)
+            return self.rescore(query_hits, search_results, top_k, session_id)
         except Exception as e:
             return None, f"❌ Lỗi khi tìm kiếm dữ liệu: {str(e)}"
 
+    def retrieve_batch(self, queries, query_embeddings, top_k, topics=None):
+        """retrieve cho nhiều câu hỏi trong một lần gọi vector store."""
+        if self.use_hybrid_search:
+            return self.vector_store.hybrid_search_batch(query_embeddings, queries, top_k=top_k, topics=topics)
+        return self.vector_store.search_batch(query_embeddings, top_k=top_k, topics=topics)
+
+    def search_data_batch(self, queries, top_k=50, session_id=None, query_embeddings=None):
+        """search_data cho nhiều câu hỏi: encode một lần, tìm kiếm batch; trả về danh sách
+        (kết quả, lỗi) theo thứ tự câu hỏi."""
+        try:
+            if query_embeddings is None:
+                query_embeddings = self.embedding_handler.encode_queries(queries)
+            query_topics = [self.query_topics(query) for query in queries]
+            query_hits = [hits for hits, _ in query_topics]
+            topics = [topics for _, topics in query_topics]
+            search_results = [[] for _ in queries]
+            # Lọc theo chủ đề, sau đó bổ sung bằng tìm kiếm không lọc cho các câu hỏi chưa đủ top_k
+            rows = [i for i, t in enumerate(topics) if t]
+            if rows:
+                batch = self.retrieve_batch([queries[i] for i in rows], [query_embeddings[i] for i in rows], top_k,
+                                            [topics[i] for i in rows])
+                for i, results in zip(rows, batch):
+                    search_results[i] = results
+            rows = [i for i, results in enumerate(search_results) if len(results) < top_k]
+            if rows:
+                batch = self.retrieve_batch([queries[i] for i in rows], [query_embeddings[i] for i in rows], top_k)
+                for i, results in zip(rows, batch):
+                    search_results[i] = self.merge_candidates(search_results[i], results)
+        except Exception as e:
+            return [(None, f"❌ Lỗi khi tìm kiếm dữ liệu: {str(e)}")] * len(queries)
+
+        outputs = []
+        for hits, results in zip(query_hits, search_results):
+            try:
+                outputs.append(self.rescore(hits, results, top_k, session_id))
+            except Exception as e:
+                outputs.append((None, f"❌ Lỗi khi tìm kiếm dữ liệu: {str(e)}"))
+        return outputs
+
+    def rescore(self, query_hits, search_results, top_k, session_id=None):
+        """Chấm lại điểm các ứng viên theo từ khóa của câu hỏi; trả về (kết quả, lỗi)."""
+        if not search_results:
+            return None, "🙁 Không tìm thấy thông tin liên quan trong sổ tay ICTU."
+
+        # Mở rộng từ khóa và tăng độ ưu tiên cho các chủ đề xuất hiện trong câu hỏi
+        # (chỉ trong phạm vi phiên, không ảnh hưởng câu hỏi của người khác)
+        relevant_keywords, boosts = expand_keywords(query_hits, SEARCH_EXPANSIONS)
+        scoring = self.scoring_sessions.context_for(session_id, boosts)
+
+        # Đặc trưng từ khóa của mỗi đoạn đã được tính khi ingest; chấm điểm cả danh sách
+        # ứng viên bằng một phép nhân ma trận
+        weights = query_weights(query_hits, relevant_keywords, scoring.priority_weights)
+        scores = keyword_scores([result.payload for result in search_results], weights)
+
+        filtered_results = []
+        for result, keyword_score in zip(search_results, scores):
+            combined_score = result.score + float(keyword_score) * 0.7
+            # Kết quả tìm kiếm kết hợp có score RRF chuẩn hóa (đoạn đầu luôn 1.0) nên lọc theo
+            # cosine thật dense_score; tìm kiếm dense thì score chính là cosine
+            relevance = getattr(result, "dense_score", result.score) + float(keyword_score) * 0.7
+            if relevance >= 0.1:  # Giảm ngưỡng từ 0.3 xuống 0.1
+                filtered_results.append({
+                    "id": result.id,
+                    "text": result.payload["text"],
+                    "metadata": result.payload["metadata"],
+                    "score": combined_score
+                })
+
+        filtered_results = sorted(filtered_results, key=lambda x: x["score"], reverse=True)
+        if not filtered_results:
+            return None, "🙁 Không tìm thấy thông tin liên quan trong sổ tay ICTU (score quá thấp)."
+        return filtered_results[:top_k], None
+
     def create_task(self, query, search_results):
         query_lower = query.lower()
-        context = "\n\n".join([result["text"] for result in search_results]) if search_results else ""
-        context = context.replace("Tải về:", "").replace(".xlsm", "")
-        for page in ["133", "134", "135", "136", "137", "138", "139", "140", "141", "142"]:
-            context = context.replace(page, "")
-
-        # Thu thập từ khóa liên quan
-        relevant_keywords = []
-        for topic, keywords in self.keywords.items():
-            if any(keyword in query_lower for keyword in keywords):
-                relevant_keywords.extend(keywords)
-                break
+        agent = self.new_agent()
 
-        majors = [m for block in self.training_program.values() for m in block["majors"]]
-        if "khoa" in query_lower or "ngành học" in query_lower or "liệt kê" in query_lower:
-            relevant_keywords.extend([
-                "khoa", "ngành học", "cơ cấu tổ chức", "khoa học cơ bản", "công nghệ thông tin",
-                "công nghệ điện tử và truyền thông", "hệ thống thông tin kinh tế", "công nghệ tự động hóa",
-                "truyền thông đa phương tiện", "thương mại điện tử"
-            ])
-        for major in majors:
-            if major.lower() in query_lower:
-                relevant_keywords.append(major)
-        if "học phí" in query_lower or "mỗi tín chỉ" in query_lower or "bao nhiêu tiền" in query_lower:
-            relevant_keywords.extend(["học phí", "đồng/tín chỉ", "mỗi tín chỉ", "khóa 17", "khóa 18-19", "khóa 20-21"])
-        if "khóa 17" in query_lower:
-            relevant_keywords.append("khóa 17")
-        if "khóa 18" in query_lower or "khóa 19" in query_lower or "khóa 18-19" in query_lower:
-            relevant_keywords.extend(["khóa 18", "khóa 19", "khóa 18-19"])
-        if "khóa 20" in query_lower or "khóa 21" in query_lower or "khóa 20-21" in query_lower:
-            relevant_keywords.extend(["khóa 20", "khóa 21", "khóa 20-21"])
-        if "nội trú" in query_lower or "ngoại trú" in query_lower:
-            relevant_keywords.extend(["nội trú", "ngoại trú", "ký túc xá", "thuê trọ", "ở trong trường", "ở ngoài trường"])
-        if "điều kiện nhập học" in query_lower:
-            relevant_keywords.extend(["điều kiện nhập học", "yêu cầu nhập học", "điểm chuẩn", "xét tuyển"])
-        if "chương trình đào tạo" in query_lower:
-            relevant_keywords.extend(["chương trình đào tạo", "tín chỉ", "môn học", "kỹ sư", "cử nhân"])
-        if "hoạt động ngoại khóa" in query_lower:
-            relevant_keywords.extend(["hoạt động ngoại khóa", "điểm ngoại khóa", "sự kiện sinh viên"])
-
-        def has_relevant_content(keywords, context_lower, search_results):
-            for keyword in keywords:
-                if keyword in context_lower:
-                    return True
-            for result in search_results:
-                result_text = result["text"].lower()
-                if "khoa" in query_lower and "khoa" in result_text:
-                    return True
-                if "ngành học" in query_lower and any(major.lower() in result_text for major in majors):
-                    return True
-                if "điểm trung bình tích lũy" in result_text and ("xếp loại học lực" in query_lower or "xếp hạng học lực" in query_lower):
-                    return True
-                if "hệ thống" in result_text and ("đăng nhập" in query_lower or "đổi mật khẩu" in query_lower or "đăng ký học" in query_lower or "thanh toán học phí" in query_lower):
-                    return True
-                if "quản lý tài khoản" in result_text and "đổi mật khẩu" in query_lower:
-                    return True
-                if any(major.lower() in result_text for major in majors) and "đồng/tín chỉ" in result_text:
-                    return True
-                if ("nội trú" in query_lower or "ngoại trú" in query_lower) and ("ký túc xá" in result_text or "thuê trọ" in result_text):
-                    return True
-                if "điều kiện nhập học" in query_lower and any(k in result_text for k in ["điều kiện nhập học", "yêu cầu nhập học", "điểm chuẩn"]):
-                    return True
-                if "chương trình đào tạo" in query_lower and any(k in result_text for k in ["chương trình đào tạo", "tín chỉ", "môn học"]):
-                    return True
-                if "hoạt động ngoại khóa" in query_lower and any(k in result_text for k in ["hoạt động ngoại khóa", "điểm ngoại khóa"]):
-                    return True
-            return False
+        def clean(text):
+            text = text.replace("Tải về:", "").replace(".xlsm", "")
+            for page in ["133", "134", "135", "136", "137", "138", "139", "140", "141", "142"]:
+                text = text.replace(page, "")
+            return text
+
+        # Chỉ đưa vào prompt các đoạn điểm cao nhất, không trùng lặp, trong giới hạn token
+        context, self._local.context_stats = self.context_builder.build(search_results, clean)
+
+        # Thu thập từ khóa liên quan (một lần duyệt câu hỏi cho mọi cụm từ)
+        query_hits = MATCHER.find(query_lower)
+        relevant_keywords, _ = expand_keywords(query_hits, PROMPT_EXPANSIONS)
 
         # Xử lý câu hỏi so sánh
         if self.is_comparison_question(query):
-            if "học phí" in query_lower:
+            if "học phí" in query_hits:
                 return Task(
                     description=f"""
                         So sánh học phí dựa trên câu hỏi: '{query}'.
@@ -559,10 +472,10 @@ class ChatBotAgent:
                         - Đảm bảo thứ tự: ngành A (đầu tiên trong câu hỏi) luôn được liệt kê và so sánh trước ngành B.
                         Chỉ trả lời bằng tiếng Việt.
                     """,
-                    agent=self.agent,
+                    agent=agent,
                     expected_output=self.compare_tuition_fees(query)
                 )
-            elif "nội trú" in query_lower or "ngoại trú" in query_lower:
+            elif "nội trú" in query_hits or "ngoại trú" in query_hits:
                 return Task(
                     description=f"""
                         So sánh sinh viên nội trú và ngoại trú dựa trên câu hỏi: '{query}' từ nội dung sau:
@@ -584,10 +497,10 @@ class ChatBotAgent:
                         - Không thêm thông tin ngoài nội dung cung cấp.
                         Chỉ trả lời bằng tiếng Việt.
                     """,
-                    agent=self.agent,
+                    agent=agent,
                     expected_output=self.compare_resident_nonresident(query, search_results)
                 )
-            elif "điều kiện nhập học" in query_lower:
+            elif "điều kiện nhập học" in query_hits:
                 return Task(
                     description=f"""
                         So sánh điều kiện nhập học dựa trên câu hỏi: '{query}' từ nội dung sau:
@@ -606,10 +519,10 @@ class ChatBotAgent:
                         - Không thêm thông tin ngoài nội dung cung cấp.
                         Chỉ trả lời bằng tiếng Việt.
                     """,
-                    agent=self.agent,
+                    agent=agent,
                     expected_output=self.compare_generic(query, search_results, "điều kiện nhập học")
                 )
-            elif "chương trình đào tạo" in query_lower:
+            elif "chương trình đào tạo" in query_hits:
                 return Task(
                     description=f"""
                         So sánh chương trình đào tạo dựa trên câu hỏi: '{query}' từ nội dung sau:
@@ -628,10 +541,10 @@ class ChatBotAgent:
                         - Không thêm thông tin ngoài nội dung cung cấp.
                         Chỉ trả lời bằng tiếng Việt.
                     """,
-                    agent=self.agent,
+                    agent=agent,
                     expected_output=self.compare_generic(query, search_results, "chương trình đào tạo")
                 )
-            elif "hoạt động ngoại khóa" in query_lower:
+            elif "hoạt động ngoại khóa" in query_hits:
                 return Task(
                     description=f"""
                         So sánh hoạt động ngoại khóa dựa trên câu hỏi: '{query}' từ nội dung sau:
@@ -650,19 +563,16 @@ class ChatBotAgent:
                         - Không thêm thông tin ngoài nội dung cung cấp.
                         Chỉ trả lời bằng tiếng Việt.
                     """,
-                    agent=self.agent,
+                    agent=agent,
                     expected_output=self.compare_generic(query, search_results, "hoạt động ngoại khóa")
                 )
 
         # Xử lý câu hỏi học phí đơn lẻ
-        if any(major.lower() in query_lower for major in majors) and ("học phí" in query_lower or "mỗi tín chỉ" in query_lower or "bao nhiêu tiền" in query_lower):
-            for major in majors:
-                if major.lower() in query_lower:
-                    selected_major = major
-                    break
+        selected_major = next((major for major in MAJORS if major.lower() in query_hits), None)
+        if selected_major and ("học phí" in query_hits or "mỗi tín chỉ" in query_hits or "bao nhiêu tiền" in query_hits):
             for block_name, block in self.training_program.items():
                 if selected_major in block["majors"]:
-                    if "khóa 17" in query_lower:
+                    if "khóa 17" in query_hits:
                         tuition_fee = block["Khóa 17"]
                         return Task(
                             description=f"""
@@ -673,10 +583,10 @@ class ChatBotAgent:
                                 - Chỉ sử dụng dữ liệu từ self.training_program.
                                 Chỉ trả lời bằng tiếng Việt.
                             """,
-                            agent=self.agent,
+                            agent=agent,
                             expected_output=f"Ngành {selected_major} Khóa 17: {tuition_fee:,} đồng/tín chỉ."
                         )
-                    elif "khóa 18-19" in query_lower or "khóa 18" in query_lower or "khóa 19" in query_lower:
+                    elif "khóa 18-19" in query_hits or "khóa 18" in query_hits or "khóa 19" in query_hits:
                         tuition_fee = block["Khóa 18-19"]
                         return Task(
                             description=f"""
@@ -687,10 +597,10 @@ class ChatBotAgent:
                                 - Chỉ sử dụng dữ liệu từ self.training_program.
                                 Chỉ trả lời bằng tiếng Việt.
                             """,
-                            agent=self.agent,
+                            agent=agent,
                             expected_output=f"Ngành {selected_major} Khóa 18-19: {tuition_fee:,} đồng/tín chỉ."
                         )
-                    elif "khóa 20-21" in query_lower or "khóa 20" in query_lower or "khóa 21" in query_lower:
+                    elif "khóa 20-21" in query_hits or "khóa 20" in query_hits or "khóa 21" in query_hits:
                         tuition_fee = block["Khóa 20-21"]
                         return Task(
                             description=f"""
@@ -701,7 +611,7 @@ class ChatBotAgent:
                                 - Chỉ sử dụng dữ liệu từ self.training_program.
                                 Chỉ trả lời bằng tiếng Việt.
                             """,
-                            agent=self.agent,
+                            agent=agent,
                             expected_output=f"Ngành {selected_major} Khóa 20-21: {tuition_fee:,} đồng/tín chỉ."
                         )
                     else:
@@ -715,12 +625,12 @@ class ChatBotAgent:
                                 - Chỉ sử dụng dữ liệu từ self.training_program.
                                 Chỉ trả lời bằng tiếng Việt.
                             """,
-                            agent=self.agent,
+                            agent=agent,
                             expected_output=f"Ngành {selected_major}: {tuition_fee:,} đồng/tín chỉ (theo đơn giá Khóa 18-19 cho các khóa không xác định)."
                         )
 
         # Xử lý câu hỏi liệt kê các ngành học
-        if "liệt kê các ngành học" in query_lower or "danh sách ngành học" in query_lower:
+        if is_majors_list_question(query, query_hits):
             all_majors = []
             for block_name, block in self.training_program.items():
                 all_majors.extend(block["majors"])
@@ -738,7 +648,7 @@ class ChatBotAgent:
                     - Không thêm thông tin ngoài dữ liệu cung cấp.
                     Chỉ trả lời bằng tiếng Việt.
                 """,
-                agent=self.agent,
+                agent=agent,
                 expected_output=f"Danh sách các ngành học tại ICTU:\n{majors_list}"
             )
 
@@ -771,75 +681,435 @@ class ChatBotAgent:
         """
         task = Task(
             description=task_description,
-            agent=self.agent,
+            agent=agent,
             expected_output="Trích xuất nguyên văn thông tin liên quan từ đoạn văn, không tóm tắt, không diễn giải."
         )
         return task
     
-    def run(self, query, top_k=5):
+    def course_for_query(self, query_hits):
+        """Khóa được nêu trong câu hỏi, None nếu không có."""
+        if "khóa 17" in query_hits:
+            return "Khóa 17"
+        if "khóa 18-19" in query_hits or "khóa 18" in query_hits or "khóa 19" in query_hits:
+            return "Khóa 18-19"
+        if "khóa 20-21" in query_hits or "khóa 20" in query_hits or "khóa 21" in query_hits:
+            return "Khóa 20-21"
+        return None
+
+    def fast_answer(self, query):
+        """Câu trả lời tính sẵn từ self.training_program cho các câu hỏi học phí và danh sách ngành.
+
+        Trả về None nếu câu hỏi cần tìm kiếm trong sổ tay; khi có kết quả, câu trả lời giống hệt
+        expected_output mà create_task đưa cho LLM sao chép lại.
+        """
+        query_hits = MATCHER.find(query.lower())
+        query_majors = [major for major in MAJORS if major.lower() in query_hits]
+        is_tuition = "học phí" in query_hits or "mỗi tín chỉ" in query_hits or "bao nhiêu tiền" in query_hits
+
+        if self.is_comparison_question(query):
+            # Các câu so sánh khác (nội trú, điều kiện nhập học, ...) cần nội dung sổ tay
+            if "học phí" in query_hits and len(query_majors) >= 2:
+                return self.compare_tuition_fees(query)
+            return None
+
+        if query_majors and is_tuition:
+            selected_major = query_majors[0]
+            block = next(block for block in self.training_program.values() if selected_major in block["majors"])
+            course = self.course_for_query(query_hits)
+            if course is None:
+                return (f"Ngành {selected_major}: {block['Khóa 18-19']:,} đồng/tín chỉ "
+                        f"(theo đơn giá Khóa 18-19 cho các khóa không xác định).")
+            return f"Ngành {selected_major} {course}: {block[course]:,} đồng/tín chỉ."
+
+        if is_majors_list_question(query, query_hits):
+            majors_list = "\n".join([f"- {major}" for major in MAJORS])
+            return f"Danh sách các ngành học tại ICTU:\n{majors_list}"
+        return None
+
+    def fast_path(self, query, session_id=None):
+        """fast_answer kèm ghi lịch sử chat như mọi câu trả lời khác; None nếu câu hỏi cần đi hết
+        pipeline. Không qua cache câu trả lời: tra bảng rẻ hơn encode câu hỏi để tra cache, và
+        bảng chương trình đào tạo không đổi theo dữ liệu sổ tay."""
+        answer = self.fast_answer(query)
+        if answer is not None:
+            print("⚡ Trả lời trực tiếp từ dữ liệu chương trình đào tạo.")
+            self.chat_history.append(session_id, query, answer)
+        return answer
+
+    def answer_cache_version(self):
+        """Phiên bản dữ liệu hiện tại của vector store cho cache câu trả lời. Khi phiên bản đổi
+        (kể cả do sync ở tiến trình khác), chỉ bỏ các câu trả lời dùng đoạn đã đổi nếu store biết
+        các đoạn đó (changes_since), nếu không bỏ toàn bộ cache."""
+        version = getattr(self.vector_store, "generation", None)
+        previous = self.answer_cache.version
+        if version != previous:
+            changes_since = getattr(self.vector_store, "changes_since", None)
+            changes = changes_since(previous) if changes_since else None
+            changed_ids, added_ids = changes if changes is not None else (None, None)
+            self.answer_cache.set_version(version, changed_ids, previous, added_ids)
+        return version
+
+    def answer_cache_guard(self, query, top_k):
+        """Các thực thể (ngành, khóa) trong câu hỏi và top_k; câu trả lời chỉ được dùng lại khi
+        trùng khớp, vì top_k khác nhau thì context đưa cho LLM khác nhau."""
+        entities = frozenset(hit for hit in MATCHER.find(query.lower()) if hit in MAJORS_LOWER or hit.startswith("khóa "))
+        return entities, top_k
+
+    def cache_stats(self):
+        """Thống kê cache embeddings câu hỏi, cache câu trả lời và lịch sử chat."""
+        return {
+            "query_embeddings": self.embedding_handler.query_cache.stats() if self.embedding_handler.query_cache else None,
+            "answers": self.answer_cache.stats(),
+            "chat_history": self.chat_history.stats(),
+        }
+
+    @property
+    def last_context_stats(self):
+        """Thống kê context của lần gọi create_task gần nhất trong luồng hiện tại."""
+        return getattr(self._local, "context_stats", None)
+
+    def report_prompt_size(self, task):
+        """In kích thước prompt gửi tới LLM và thống kê context của câu hỏi hiện tại."""
+        stats = self.last_context_stats
+        prompt_tokens = self.context_builder.counter.count(task.description)
+        print(f"📏 Prompt: {prompt_tokens} token (context {stats['tokens']}/{stats['budget']} token, "
+              f"{stats['used']}/{stats['candidates']} đoạn, bỏ {stats['duplicates']} đoạn trùng lặp, "
+              f"{stats['over_budget']} đoạn vượt ngân sách)")
+        return prompt_tokens
+
+    def answer_true_false(self, query, search_results, session_id=None):
+        statement = self.extract_statement(query)
+        relevant_info = self.get_relevant_info(query)
+        is_true, explanation = self.verify_statement(statement, relevant_info, search_results)
+        self.chat_history.append(session_id, query, explanation)
+        return explanation
+
+    def cached_answer(self, query, query_embedding, cache_version, cache_guard, session_id=None):
+        """Câu trả lời đã lưu của một câu hỏi gần giống với cùng dữ liệu, hoặc None."""
+        if query_embedding is None:
+            return None
+        cached = self.answer_cache.get(query_embedding, cache_version, cache_guard)
+        if cached is None:
+            return None
+        print(f"⚡ Dùng lại câu trả lời của câu hỏi tương tự '{cached.query}' (cosine {cached.similarity:.3f}).")
+        self.chat_history.append(session_id, query, cached.answer)
+        return cached.answer
+
+    def print_search_results(self, search_results):
+        for i, result in enumerate(search_results):
+            print(f"\nKết quả {i + 1} (Score: {result['score']:.4f}):")
+            print(f"ID: {result['id']}")
+            print("Text (toàn bộ nội dung):")
+            print(result['text'])
+            print(f"Metadata: {result['metadata']}")
+
+    def build_task(self, query, search_results):
+        task = self.create_task(query, search_results)
+        self.report_prompt_size(task)
+        # Debug: In expected_output
+        print("\n🔍 Expected Output từ compare_tuition_fees:")
+        print(task.expected_output)
+        return task
+
+    @staticmethod
+    def crew_for_task(task):
+        """Crew chạy một task trên agent của task (dùng chung cho run, run_batch và stream_llm)."""
+        return Crew(agents=[task.agent], tasks=[task], verbose=2)
+
+    def build_crew(self, query, search_results):
+        return self.crew_for_task(self.build_task(query, search_results))
+
+    @staticmethod
+    def stream_prompt(task):
+        """Prompt gửi thẳng tới LLM khi stream, ghép từ chính các phần crewai dùng khi kickoff:
+        vai trò của agent (slice role_playing) và task.prompt() (mô tả + kết quả mong đợi).
+
+        Khác với run(): không có khung ReAct của crewai ("Thought: ... Final Answer: ..."), vì
+        khung đó sẽ lọt vào các token được stream; nội dung task và vai trò giữ nguyên."""
+        agent = task.agent
+        role_playing = agent.i18n.slice("role_playing").format(role=agent.role, backstory=agent.backstory,
+                                                                goal=agent.goal)
+        return f"{role_playing}\n\nCurrent Task: {task.prompt()}"
+
+    def stream_llm(self, task):
+        """Sinh từng phần câu trả lời từ LLM; nếu LLM không hỗ trợ stream thì chạy Crew và trả cả
+        câu trả lời một lần."""
+        if hasattr(self.llm, "stream"):
+            for chunk in self.llm.stream(self.stream_prompt(task)):
+                text = getattr(chunk, "content", chunk)
+                if text:
+                    yield text
+        else:
+            yield str(self.crew_for_task(task).kickoff())
+
+    @staticmethod
+    def retrieval_event(search_results):
+        return {
+            "type": "retrieval",
+            "results": [{"id": result["id"], "score": result["score"], "metadata": result["metadata"]}
+                        for result in search_results],
+        }
+
+    def finish_answer(self, query, result, search_results, query_embedding, cache_version, cache_guard,
+                      session_id=None):
+        """Lưu câu trả lời của LLM vào lịch sử chat và cache câu trả lời."""
+        # Lấy ID từ kết quả có nội dung khớp với câu trả lời
+        if search_results:
+            relevant_result = None
+            for res in search_results:
+                if result.strip() in res['text'].strip():
+                    relevant_result = res
+                    break
+            if not relevant_result:
+                for res in search_results:
+                    if "Đoàn thanh niên" in res['text'] and "Nhà điều hành C1" in res['text']:
+                        relevant_result = res
+                        break
+            if not relevant_result:
+                relevant_result = search_results[0]
+            result_with_id = result
+        else:
+            result_with_id = result
+        self.chat_history.append(session_id, query, result_with_id)
+        # Không cache câu trả lời "không tìm thấy": đoạn liên quan có thể được thêm sau đó
+        if query_embedding is not None and NOT_FOUND_ANSWER not in result_with_id:
+            self.answer_cache.put(query, query_embedding, result_with_id,
+                                  [res['id'] for res in search_results or []], cache_version, cache_guard)
+        return result_with_id
+
+    def run(self, query, top_k=5, session_id=None):
+        """Trả lời câu hỏi; session_id gom các câu hỏi của cùng một người dùng để tăng độ ưu tiên
+        các chủ đề họ hỏi nhiều (None: không lưu trạng thái giữa các câu hỏi)."""
         # Kiểm tra nếu câu hỏi là dạng đúng/sai
         if self.is_true_false_question(query):
-            statement = self.extract_statement(query)
-            search_results, error = self.search_data(query, top_k)
+            search_results, error = self.search_data(query, top_k, session_id)
             if error:
                 print(error)
                 return error
-            relevant_info = self.get_relevant_info(query)
-            is_true, explanation = self.verify_statement(statement, relevant_info, search_results)
-            self.chat_history.append((query, explanation))
-            return explanation
+            return self.answer_true_false(query, search_results, session_id)
+
+        # Câu hỏi trả lời được từ bảng chương trình đào tạo: bỏ qua embedding, tìm kiếm và LLM
+        answer = self.fast_path(query, session_id)
+        if answer is not None:
+            return answer
+
+        # Câu hỏi gần giống một câu đã trả lời với cùng dữ liệu: dùng lại câu trả lời
+        cache_version = self.answer_cache_version()
+        cache_guard = self.answer_cache_guard(query, top_k)
+        try:
+            query_embedding = self.embedding_handler.encode_query(query)
+        except Exception as e:
+            print(f"⚠️ Không tạo được embedding để tra cache câu trả lời: {e}")
+            query_embedding = None
+        answer = self.cached_answer(query, query_embedding, cache_version, cache_guard, session_id)
+        if answer is not None:
+            return answer
 
         # Xử lý các câu hỏi thông tin bình thường
-        search_results, error = self.search_data(query, top_k)
+        search_results, error = self.search_data(query, top_k, session_id, query_embedding)
         print("\n💬 Kết quả tìm kiếm từ Qdrant:")
         if error:
             print(error)
             return error
-        else:
-            for i, result in enumerate(search_results):
-                print(f"\nKết quả {i + 1} (Score: {result['score']:.4f}):")
-                print(f"ID: {result['id']}")
-                print("Text (toàn bộ nội dung):")
-                print(result['text'])
-                print(f"Metadata: {result['metadata']}")
+        self.print_search_results(search_results)
 
         print("\n📝 Diễn giải và trả lời câu hỏi bằng LLM...")
         try:
-            task = self.create_task(query, search_results)
-            # Debug: In expected_output
-            print("\n🔍 Expected Output từ compare_tuition_fees:")
-            print(task.expected_output)
-            crew = Crew(agents=[self.agent], tasks=[task], verbose=2)
+            crew = self.build_crew(query, search_results)
             result = crew.kickoff()
-            # Lấy ID từ kết quả có nội dung khớp với câu trả lời
-            if search_results:
-                relevant_result = None
-                for res in search_results:
-                    if result.strip() in res['text'].strip():
-                        relevant_result = res
-                        break
-                if not relevant_result:
-                    for res in search_results:
-                        if "Đoàn thanh niên" in res['text'] and "Nhà điều hành C1" in res['text']:
-                            relevant_result = res
-                            break
-                if not relevant_result:
-                    relevant_result = search_results[0]
-                result_with_id = result
+            return self.finish_answer(query, result, search_results, query_embedding, cache_version, cache_guard,
+                                      session_id)
+        except Exception as e:
+            error_msg = f"❌ Lỗi khi diễn giải dữ liệu: {str(e)}"
+            print(error_msg)
+            return error_msg
+
+    def run_batch(self, queries, top_k=5, session_id=None, max_workers=4):
+        """Trả lời nhiều câu hỏi (đánh giá offline, trả lời trước danh sách FAQ).
+
+        Các câu hỏi cần tìm kiếm được encode trong một lần gọi model và tìm kiếm trong một lần
+        gọi vector store; các lần gọi LLM chạy song song tối đa max_workers luồng. Trả về danh
+        sách {"query", "answer", "error"} theo đúng thứ tự đầu vào, lỗi của từng câu hỏi tách riêng.
+        """
+        results = [{"query": query, "answer": None, "error": None} for query in queries]
+        pending = []
+        for i, query in enumerate(queries):
+            if not self.is_true_false_question(query):
+                answer = self.fast_path(query, session_id)
+                if answer is not None:
+                    results[i]["answer"] = answer
+                    continue
+            pending.append(i)
+        if not pending:
+            return results
+
+        cache_version = self.answer_cache_version()
+        try:
+            embeddings = self.embedding_handler.encode_queries([queries[i] for i in pending])
+        except Exception as e:
+            for i in pending:
+                results[i]["error"] = f"❌ Lỗi khi tạo embedding: {str(e)}"
+            return results
+
+        to_search = []
+        guards = {}
+        for i, query_embedding in zip(pending, embeddings):
+            query = queries[i]
+            if not self.is_true_false_question(query):
+                guards[i] = self.answer_cache_guard(query, top_k)
+                answer = self.cached_answer(query, query_embedding, cache_version, guards[i], session_id)
+                if answer is not None:
+                    results[i]["answer"] = answer
+                    continue
+            to_search.append((i, query_embedding))
+
+        searched = self.search_data_batch([queries[i] for i, _ in to_search], top_k, session_id,
+                                          [query_embedding for _, query_embedding in to_search])
+        llm_jobs = []
+        for (i, query_embedding), (search_results, error) in zip(to_search, searched):
+            if error:
+                results[i]["error"] = error
+            elif self.is_true_false_question(queries[i]):
+                results[i]["answer"] = self.answer_true_false(queries[i], search_results, session_id)
             else:
-                result_with_id = result
-            self.chat_history.append((query, result_with_id))
-            return result_with_id
+                llm_jobs.append((i, query_embedding, search_results))
+
+        # Mỗi câu hỏi có Crew và Agent riêng (create_task tạo Agent mới), dựng trước ở luồng này;
+        # các luồng chỉ chạy kickoff nên không dùng chung trạng thái Agent nào của crewai
+        crews = {}
+        for i, _, search_results in llm_jobs:
+            try:
+                crews[i] = self.build_crew(queries[i], search_results)
+            except Exception as e:
+                results[i]["error"] = f"❌ Lỗi khi diễn giải dữ liệu: {str(e)}"
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [(executor.submit(crews[i].kickoff), i, query_embedding, search_results)
+                       for i, query_embedding, search_results in llm_jobs if i in crews]
+            for future, i, query_embedding, search_results in futures:
+                try:
+                    results[i]["answer"] = self.finish_answer(queries[i], future.result(), search_results,
+                                                              query_embedding, cache_version, guards[i], session_id)
+                except Exception as e:
+                    results[i]["error"] = f"❌ Lỗi khi diễn giải dữ liệu: {str(e)}"
+        return results
+
+    async def arun(self, query, top_k=5, session_id=None):
+        """Phiên bản asyncio của run: encode trong executor giới hạn, tìm kiếm bằng client async
+        và chờ LLM bằng await, nên một tiến trình xử lý được nhiều câu hỏi cùng lúc.
+        Các bước đồng bộ (đọc trạng thái collection, lịch sử hội thoại SQLite, cache) chạy qua
+        asyncio.to_thread để không chặn event loop."""
+        if self.is_true_false_question(query):
+            search_results, error = await self.asearch_data(query, top_k, session_id)
+            if error:
+                print(error)
+                return error
+            return await asyncio.to_thread(self.answer_true_false, query, search_results, session_id)
+
+        answer = await asyncio.to_thread(self.fast_path, query, session_id)
+        if answer is not None:
+            return answer
+
+        cache_version = await asyncio.to_thread(self.answer_cache_version)
+        cache_guard = self.answer_cache_guard(query, top_k)
+        try:
+            query_embedding = await self.embedding_handler.aencode_query(query)
+        except Exception as e:
+            print(f"⚠️ Không tạo được embedding để tra cache câu trả lời: {e}")
+            query_embedding = None
+        answer = await asyncio.to_thread(self.cached_answer, query, query_embedding, cache_version, cache_guard,
+                                         session_id)
+        if answer is not None:
+            return answer
+
+        search_results, error = await self.asearch_data(query, top_k, session_id, query_embedding)
+        print("\n💬 Kết quả tìm kiếm từ Qdrant:")
+        if error:
+            print(error)
+            return error
+        self.print_search_results(search_results)
+
+        print("\n📝 Diễn giải và trả lời câu hỏi bằng LLM...")
+        try:
+            crew = self.build_crew(query, search_results)
+            if hasattr(crew, "kickoff_async"):
+                result = await crew.kickoff_async()
+            else:
+                # crewai cũ không có kickoff_async: chạy kickoff trong luồng riêng
+                result = await asyncio.to_thread(crew.kickoff)
+            return await asyncio.to_thread(self.finish_answer, query, result, search_results, query_embedding,
+                                           cache_version, cache_guard, session_id)
         except Exception as e:
             error_msg = f"❌ Lỗi khi diễn giải dữ liệu: {str(e)}"
             print(error_msg)
             return error_msg
 
+    def run_stream(self, query, top_k=5, session_id=None, include_retrieval=True):
+        """Phiên bản stream của run, sinh các sự kiện dạng dict:
+            {"type": "retrieval", "results": [...]}  id, score, metadata các đoạn (nếu include_retrieval)
+            {"type": "token", "text": "..."}         từng phần câu trả lời ngay khi LLM sinh ra
+            {"type": "done", "answer": "..."}        câu trả lời đầy đủ
+            {"type": "error", "message": "..."}
+        """
+        if self.is_true_false_question(query):
+            search_results, error = self.search_data(query, top_k, session_id)
+            if error:
+                yield {"type": "error", "message": error}
+                return
+            if include_retrieval:
+                yield self.retrieval_event(search_results)
+            answer = self.answer_true_false(query, search_results, session_id)
+            yield {"type": "token", "text": answer}
+            yield {"type": "done", "answer": answer}
+            return
+
+        answer = self.fast_path(query, session_id)
+        if answer is not None:
+            yield {"type": "token", "text": answer}
+            yield {"type": "done", "answer": answer}
+            return
+
+        cache_version = self.answer_cache_version()
+        cache_guard = self.answer_cache_guard(query, top_k)
+        try:
+            query_embedding = self.embedding_handler.encode_query(query)
+        except Exception as e:
+            print(f"⚠️ Không tạo được embedding để tra cache câu trả lời: {e}")
+            query_embedding = None
+        answer = self.cached_answer(query, query_embedding, cache_version, cache_guard, session_id)
+        if answer is not None:
+            yield {"type": "token", "text": answer}
+            yield {"type": "done", "answer": answer}
+            return
+
+        search_results, error = self.search_data(query, top_k, session_id, query_embedding)
+        if error:
+            yield {"type": "error", "message": error}
+            return
+        if include_retrieval:
+            yield self.retrieval_event(search_results)
+
+        try:
+            task = self.build_task(query, search_results)
+            parts = []
+            for text in self.stream_llm(task):
+                parts.append(text)
+                yield {"type": "token", "text": text}
+            answer = self.finish_answer(query, "".join(parts), search_results, query_embedding,
+                                        cache_version, cache_guard, session_id)
+            yield {"type": "done", "answer": answer}
+        except Exception as e:
+            error_msg = f"❌ Lỗi khi diễn giải dữ liệu: {str(e)}"
+            print(error_msg)
+            yield {"type": "error", "message": error_msg}
+
 
 if __name__ == "__main__":
     print("🚀 Khởi động ChatBotAgent...")
     try:
         bot = ChatBotAgent()
+        # STREAM_ANSWERS=1: in câu trả lời ngay khi LLM sinh ra từng phần
+        stream_answers = os.getenv("STREAM_ANSWERS", "0") == "1"
         print("👋 Chào bạn! Tôi là trợ lý ảo hỗ trợ sinh viên ICTU.")
         print("Hãy nhập câu hỏi của bạn (nhập 'exit' để thoát):")
 
@@ -849,6 +1119,7 @@ if __name__ == "__main__":
 
             # Kiểm tra điều kiện thoát
             if query.lower() == "exit":
+                print(f"\n📊 Thống kê cache: {bot.cache_stats()}")
                 print("\n👋 Tạm biệt! Hẹn gặp lại bạn.")
                 break
 
@@ -859,9 +1130,18 @@ if __name__ == "__main__":
 
             # Xử lý câu hỏi và in phản hồi
             print(f"\n📝 Đang xử lý câu hỏi: {query}")
-            response = bot.run(query, top_k=12)
-            print("\n💬 Phản hồi từ trợ lý:")
-            print(response)
+            if stream_answers:
+                print("\n💬 Phản hồi từ trợ lý:")
+                for event in bot.run_stream(query, top_k=12, session_id="cli", include_retrieval=False):
+                    if event["type"] == "token":
+                        print(event["text"], end="", flush=True)
+                    elif event["type"] == "error":
+                        print(event["message"])
+                print()
+            else:
+                response = bot.run(query, top_k=12, session_id="cli")
+                print("\n💬 Phản hồi từ trợ lý:")
+                print(response)
             print("\n" + "="*50)
 
     except Exception as e:
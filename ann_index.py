@@ -0,0 +1,172 @@
+# ann_index.py
+"""Chỉ mục IVF (inverted file) bằng NumPy cho tìm kiếm gần đúng trên tập tài liệu lớn.
+
+Vectors được chuẩn hóa L2, phân cụm bằng spherical k-means; khi tìm kiếm chỉ quét
+nprobe cụm gần câu hỏi nhất. Chỉ mục lưu thành các file .npy để mở lại bằng mmap.
+"""
+import json
+import os
+import time
+import numpy as np
+
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.clip(norms, 1e-12, None)
+
+
+def _assign(vectors, centroids, block_size=8192):
+    # Gán từng vector vào cụm có cosine lớn nhất, xử lý theo khối để giới hạn bộ nhớ
+    labels = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), block_size):
+        labels[start:start + block_size] = np.argmax(vectors[start:start + block_size] @ centroids.T, axis=1)
+    return labels
+
+
+def _exact_top_k(vectors, queries, k):
+    scores = queries @ vectors.T
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    return [set(row.tolist()) for row in top]
+
+
+class IVFIndex:
+    """Chỉ mục IVF: centroids (nlist, d) và các danh sách vectors được sắp liên tục theo cụm.
+
+    fingerprint là fingerprint của embeddings dùng để xây dựng (embedding_store.embeddings_fingerprint),
+    để nhận biết chỉ mục đã cũ sau khi ingest lại.
+    """
+
+    def __init__(self, centroids, vectors, ids, offsets, nprobe=8, fingerprint=None):
+        self.centroids = centroids
+        self.vectors = vectors
+        self.ids = ids
+        self.offsets = offsets
+        self.nprobe = nprobe
+        self.fingerprint = fingerprint
+        self._positions = None  # id -> vị trí trong vectors, tạo khi cần lần đầu
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def nlist(self):
+        return len(self.centroids)
+
+    @classmethod
+    def build(cls, embeddings, nlist=None, nprobe=8, n_iter=20, seed=0, fingerprint=None):
+        """Phân cụm embeddings thành nlist cụm (mặc định khoảng 4 * sqrt(n))."""
+        vectors = _normalize(embeddings)
+        n = len(vectors)
+        if n == 0:
+            raise ValueError("Không có embeddings để xây dựng chỉ mục.")
+        nlist = min(nlist or max(1, int(4 * np.sqrt(n))), n)
+        rng = np.random.default_rng(seed)
+        centroids = vectors[rng.choice(n, nlist, replace=False)].copy()
+        for _ in range(n_iter):
+            labels = _assign(vectors, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, vectors)
+            counts = np.bincount(labels, minlength=nlist)
+            empty = counts == 0
+            if empty.any():
+                # Khởi tạo lại cụm rỗng bằng các vector ngẫu nhiên
+                sums[empty] = vectors[rng.choice(n, int(empty.sum()), replace=False)]
+            centroids = _normalize(sums)
+        labels = _assign(vectors, centroids)
+        order = np.argsort(labels, kind='stable')
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(labels, minlength=nlist))]).astype(np.int64)
+        return cls(centroids.astype(np.float32), vectors[order], order.astype(np.int64), offsets, nprobe, fingerprint)
+
+    def search(self, query, top_k=5, nprobe=None):
+        """Trả về (danh sách id, danh sách score) của top_k vectors gần nhất."""
+        query = _normalize(query)
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+        centroid_scores = self.centroids @ query
+        probes = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+        ranges = [(int(self.offsets[c]), int(self.offsets[c + 1])) for c in probes]
+        ranges = [(start, end) for start, end in ranges if end > start]
+        if not ranges:
+            return [], []
+        positions = np.concatenate([np.arange(start, end) for start, end in ranges])
+        scores = np.concatenate([self.vectors[start:end] @ query for start, end in ranges])
+        k = min(top_k, len(scores))
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best])]
+        return self.ids[positions[best]].tolist(), scores[best].tolist()
+
+    def scores(self, query, ids):
+        """Cosine chính xác giữa câu hỏi và các vector có id cho trước (kể cả ngoài các cụm đã quét)."""
+        if self._positions is None:
+            positions = np.empty(len(self.ids), dtype=np.int64)
+            positions[self.ids] = np.arange(len(self.ids))
+            self._positions = positions
+        rows = self._positions[np.asarray(ids, dtype=np.int64)]
+        return (self.vectors[rows] @ _normalize(query)).tolist() if len(rows) else []
+
+    def exact_neighbors(self, queries, k=10):
+        """Tập id của k láng giềng gần nhất tính chính xác (dùng để đo recall)."""
+        positions = _exact_top_k(self.vectors, _normalize(queries), min(k, len(self)))
+        return [set(self.ids[sorted(row)].tolist()) for row in positions]
+
+    def recall(self, queries, k=10, nprobe=None, truth=None):
+        """Recall@k so với tìm kiếm chính xác trên cùng tập vectors."""
+        k = min(k, len(self))
+        truth = truth or self.exact_neighbors(queries, k)
+        hits = sum(len(set(self.search(query, k, nprobe)[0]) & expected) for query, expected in zip(queries, truth))
+        return hits / (k * len(truth))
+
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, "centroids.npy"), self.centroids)
+        np.save(os.path.join(directory, "vectors.npy"), np.ascontiguousarray(self.vectors))
+        np.save(os.path.join(directory, "ids.npy"), self.ids)
+        np.save(os.path.join(directory, "offsets.npy"), self.offsets)
+        with open(os.path.join(directory, "index.json"), 'w', encoding='utf-8') as f:
+            json.dump({"type": "ivf", "nlist": self.nlist, "nprobe": self.nprobe,
+                       "count": len(self), "dim": int(self.centroids.shape[1]), "fingerprint": self.fingerprint}, f)
+
+    @classmethod
+    def load(cls, directory, nprobe=None, mmap_mode='r', count=None, fingerprint=None):
+        """Mở chỉ mục đã lưu; vectors được mmap nên không phải đọc hết vào RAM.
+
+        Truyền count/fingerprint của embeddings hiện tại để kiểm tra chỉ mục còn khớp; ném
+        ValueError nếu chỉ mục được xây dựng từ dữ liệu khác (ID sẽ trỏ sai đoạn văn).
+        """
+        with open(os.path.join(directory, "index.json"), 'r', encoding='utf-8') as f:
+            info = json.load(f)
+        if count is not None and info["count"] != count:
+            raise ValueError(f"Chỉ mục {directory} có {info['count']} vectors, embeddings hiện tại có {count}.")
+        if fingerprint is not None and info.get("fingerprint") != fingerprint:
+            raise ValueError(f"Chỉ mục {directory} được xây dựng từ embeddings khác.")
+        index = cls(
+            np.load(os.path.join(directory, "centroids.npy")),
+            np.load(os.path.join(directory, "vectors.npy"), mmap_mode=mmap_mode),
+            np.load(os.path.join(directory, "ids.npy"), mmap_mode=mmap_mode),
+            np.load(os.path.join(directory, "offsets.npy")),
+            nprobe or info["nprobe"],
+            info.get("fingerprint"),
+        )
+        if len(index) != info["count"] or int(index.offsets[-1]) != info["count"]:
+            raise ValueError(f"Chỉ mục {directory} không toàn vẹn.")
+        return index
+
+
+def build_index(embeddings, directory, nlist=None, nprobe=8, recall_queries=200, k=10, seed=0, fingerprint=None):
+    """Xây dựng, đánh giá recall@k so với tìm kiếm chính xác và lưu chỉ mục."""
+    started = time.perf_counter()
+    index = IVFIndex.build(embeddings, nlist=nlist, nprobe=nprobe, seed=seed, fingerprint=fingerprint)
+    print(f"✅ Đã xây dựng IVF với {index.nlist} cụm cho {len(index)} vectors trong {time.perf_counter() - started:.1f}s.")
+    rng = np.random.default_rng(seed)
+    sample = np.asarray(embeddings)[rng.choice(len(index), min(recall_queries, len(index)), replace=False)]
+    truth = index.exact_neighbors(sample, k)
+    for probe in sorted({1, nprobe // 2 or 1, nprobe, nprobe * 2}):
+        if probe > index.nlist:
+            continue
+        started = time.perf_counter()
+        recall = index.recall(sample, k=k, nprobe=probe, truth=truth)
+        latency = (time.perf_counter() - started) * 1000 / len(sample)
+        print(f"📊 nprobe={probe}: recall@{k} = {recall:.3f}, {latency:.2f} ms/câu hỏi")
+    index.save(directory)
+    print(f"✅ Đã lưu chỉ mục vào {directory}.")
+    return index
@@ -0,0 +1,172 @@
+# answer_cache.py
+"""Cache câu trả lời theo ngữ nghĩa: câu hỏi mới có cosine với một câu hỏi đã trả lời vượt
+ngưỡng thì dùng lại câu trả lời đó, bỏ qua tìm kiếm và LLM.
+
+Mỗi mục gắn với phiên bản dữ liệu (generation của vector store, đọc từ Qdrant nên thấy được
+cả lần ingest ở tiến trình khác). Khi phiên bản đổi, set_version chỉ xóa các câu trả lời dùng
+đoạn đã sửa hoặc xóa nếu biết các đoạn đó; nếu không biết, hoặc có đoạn mới được thêm (câu trả
+lời cũ có thể thiếu thông tin trong đoạn mới), thì xóa toàn bộ.
+"""
+from collections import OrderedDict, namedtuple
+import threading
+import time
+import os
+import numpy as np
+
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "1") == "1"
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+
+CachedAnswer = namedtuple("CachedAnswer", ["query", "answer", "chunk_ids", "similarity"])
+
+
+class _Entry:
+    __slots__ = ("query", "embedding", "answer", "chunk_ids", "guard", "created")
+
+    def __init__(self, query, embedding, answer, chunk_ids, guard):
+        self.query = query
+        self.embedding = embedding
+        self.answer = answer
+        self.chunk_ids = chunk_ids
+        self.guard = guard
+        self.created = time.monotonic()
+
+
+class SemanticAnswerCache:
+    """Cache LRU + TTL các câu trả lời, tra cứu bằng cosine giữa embedding câu hỏi.
+
+    guard là giá trị bắt buộc phải trùng khớp (ví dụ tên ngành, khóa trong câu hỏi), để hai
+    câu hỏi gần giống nhau nhưng khác thực thể không dùng chung câu trả lời.
+    Khi enabled=False, get luôn trả về None và put không lưu gì (không tốn chi phí tra cứu).
+    """
+
+    def __init__(self, threshold=ANSWER_CACHE_THRESHOLD, max_entries=256, ttl=ANSWER_CACHE_TTL,
+                 enabled=ANSWER_CACHE_ENABLED):
+        self.enabled = enabled
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.version = None
+        self._entries = OrderedDict()
+        self._next_key = 0
+        self._matrix = None  # Ma trận embeddings của các mục, tạo lại khi cache thay đổi
+        self._keys = []
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _normalize(embedding):
+        embedding = np.asarray(embedding, dtype=np.float32).ravel()
+        return embedding / max(float(np.linalg.norm(embedding)), 1e-12)
+
+    def _check_version(self, version):
+        # Dữ liệu đã được index lại: mọi câu trả lời cũ không còn đáng tin
+        if version != self.version:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._matrix = None
+            self.version = version
+
+    def set_version(self, version, changed_ids=None, previous=None, added_ids=None):
+        """Chuyển sang phiên bản dữ liệu version. Nếu cache đang ở phiên bản previous và biết
+        changed_ids (các đoạn đã đổi giữa hai phiên bản) thì chỉ xóa câu trả lời dùng các đoạn
+        đó, ngược lại xóa toàn bộ. Có đoạn mới thêm (added_ids) cũng xóa toàn bộ, vì không biết
+        câu trả lời nào lẽ ra đã dùng đoạn đó."""
+        with self._lock:
+            if version == self.version:
+                return
+            if changed_ids is None or previous != self.version or added_ids:
+                self._check_version(version)
+                return
+            self.version = version
+            self._remove(changed_ids)
+
+    def _expire(self):
+        if not self.ttl:
+            return
+        deadline = time.monotonic() - self.ttl
+        expired = [key for key, entry in self._entries.items() if entry.created < deadline]
+        for key in expired:
+            del self._entries[key]
+        if expired:
+            self.expirations += len(expired)
+            self._matrix = None
+
+    def get(self, embedding, version=None, guard=None):
+        """Trả về CachedAnswer của câu hỏi gần nhất vượt ngưỡng, hoặc None."""
+        if not self.enabled:
+            return None
+        query = self._normalize(embedding)
+        with self._lock:
+            self._check_version(version)
+            self._expire()
+            if not self._entries:
+                self.misses += 1
+                return None
+            if self._matrix is None:
+                self._keys = list(self._entries)
+                self._matrix = np.stack([self._entries[key].embedding for key in self._keys])
+            scores = self._matrix @ query
+            for row in np.argsort(-scores):
+                if scores[row] < self.threshold:
+                    break
+                key = self._keys[row]
+                entry = self._entries[key]
+                if entry.guard != guard:
+                    continue
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return CachedAnswer(entry.query, entry.answer, entry.chunk_ids, float(scores[row]))
+            self.misses += 1
+            return None
+
+    def put(self, query, embedding, answer, chunk_ids=(), version=None, guard=None):
+        """Lưu câu trả lời cho câu hỏi, loại bỏ mục ít dùng nhất khi vượt max_entries."""
+        if not self.enabled:
+            return
+        entry = _Entry(query, self._normalize(embedding), answer, list(chunk_ids), guard)
+        with self._lock:
+            self._check_version(version)
+            self._entries[self._next_key] = entry
+            self._next_key += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            self._matrix = None
+
+    def invalidate(self, chunk_ids=None):
+        """Xóa toàn bộ cache, hoặc chỉ các câu trả lời dùng một trong các chunk_ids."""
+        with self._lock:
+            return self._remove(chunk_ids)
+
+    def _remove(self, chunk_ids=None):
+        if chunk_ids is None:
+            removed = list(self._entries)
+        else:
+            chunk_ids = set(chunk_ids)
+            removed = [key for key, entry in self._entries.items() if chunk_ids & set(entry.chunk_ids)]
+        for key in removed:
+            del self._entries[key]
+        if removed:
+            self.invalidations += 1
+            self._matrix = None
+        return len(removed)
+
+    def stats(self):
+        """Thống kê số lần trúng/trượt và số mục bị loại bỏ."""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
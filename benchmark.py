@@ -0,0 +1,260 @@
+# benchmark.py
+"""Benchmark offline cho pipeline truy xuất và trả lời của ChatBotAgent.
+
+Dùng sổ tay tổng hợp (hoặc file JSON/JSONL truyền vào), LocalVectorStore thay cho Qdrant,
+encoder giả dạng băm (hoặc model thật với --encoder model) và LLM giả có độ trễ cấu hình
+được. Với mỗi kích thước corpus và top_k, đo p50/p95/p99 và throughput của từng bước:
+    encode      EmbeddingHandler.encode_query
+    search      ChatBotAgent.retrieve_candidates (bước tìm kiếm của search_data)
+    rescore     chấm lại điểm theo từ khóa (ChatBotAgent.rescore)
+    create_task ghép context và prompt (ChatBotAgent.create_task)
+    llm         sinh câu trả lời (LLM giả)
+    end_to_end  ChatBotAgent.run_stream từ câu hỏi đến câu trả lời đầy đủ
+Kết quả được ghi ra file JSON để so sánh giữa các lần chạy.
+
+    python benchmark.py --sizes 1000 10000 --top-k 5 20 --queries 200 --output benchmark.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import platform
+import random
+import sys
+import time
+import zlib
+import numpy as np
+from langchain_core.language_models.chat_models import SimpleChatModel
+from langchain_core.messages import AIMessageChunk
+from langchain_core.outputs import ChatGenerationChunk
+from keywords import KEYWORDS
+from text_features import MAJORS
+from sparse_index import tokenize
+from embeddings import EmbeddingHandler, iter_json_records, register_model, MODEL_NAME
+from vector_store import LocalVectorStore
+from agents import ChatBotAgent
+from answer_cache import SemanticAnswerCache
+
+HASH_ENCODER_NAME = "benchmark-hash-encoder"
+STAGES = ("encode", "search", "rescore", "create_task", "llm", "end_to_end")
+
+_FILLER = [
+    "sinh viên", "nhà trường", "quy định", "thực hiện", "theo", "của", "được", "trong", "học kỳ",
+    "phòng đào tạo", "thông báo", "đăng ký", "kết quả", "thời gian", "điều kiện", "hướng dẫn",
+]
+
+
+class HashEncoder:
+    """Encoder giả 768 chiều: tổng các vector ngẫu nhiên cố định của từng token (không cần tải model)."""
+
+    def __init__(self, dim=768, seed=0):
+        self.dim = dim
+        self.seed = seed
+        self._token_vectors = {}
+
+    def _token_vector(self, token):
+        vector = self._token_vectors.get(token)
+        if vector is None:
+            rng = np.random.default_rng(zlib.crc32(token.encode('utf-8')) + self.seed)
+            vector = self._token_vectors[token] = rng.standard_normal(self.dim).astype(np.float32)
+        return vector
+
+    def encode(self, texts, convert_to_tensor=False, **kwargs):
+        embeddings = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for token in tokenize(text, bigrams=False, fold_diacritics=False):
+                embeddings[row] += self._token_vector(token)
+        return embeddings
+
+
+class StubLLM(SimpleChatModel):
+    """LLM giả: sinh câu trả lời gồm `tokens` token trong khoảng `latency_ms` mili giây.
+
+    Là chat model của LangChain để crewai Agent nhận được (Agent gọi llm.bind khi khởi tạo).
+    """
+
+    latency_ms: float = 200.0
+    tokens: int = 40
+
+    def __init__(self, latency_ms=200.0, tokens=40, **kwargs):
+        super().__init__(latency_ms=latency_ms, tokens=tokens, **kwargs)
+
+    @property
+    def _llm_type(self):
+        return "benchmark-stub"
+
+    def _words(self):
+        delay = self.latency_ms / 1000 / max(self.tokens, 1)
+        for i in range(self.tokens):
+            time.sleep(delay)
+            yield f"từ{i} "
+
+    def _call(self, messages, stop=None, run_manager=None, **kwargs):
+        # Định dạng ReAct mà crewai chờ khi chạy qua Crew
+        return "Final Answer: " + "".join(self._words())
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        for word in self._words():
+            yield ChatGenerationChunk(message=AIMessageChunk(content=word))
+
+
+def synthetic_handbook(size, seed=0):
+    """Sổ tay tổng hợp: mỗi đoạn gồm một điều khoản và các câu ghép từ từ khóa thật của repo."""
+    rng = random.Random(seed)
+    vocabulary = [word for words in KEYWORDS.values() for word in words] + [major.lower() for major in MAJORS]
+    records = []
+    for i in range(size):
+        sentences = []
+        for _ in range(rng.randint(2, 6)):
+            words = rng.sample(vocabulary, 2) + rng.sample(_FILLER, 4)
+            rng.shuffle(words)
+            sentences.append(" ".join(words).capitalize() + ".")
+        records.append({"regulation": f"Điều {i % 300 + 1}", "content": " ".join(sentences)})
+    return records
+
+
+def load_handbook(path, size):
+    """Lấy size đoạn từ file JSON/JSONL (lặp lại nếu file ít hơn size đoạn)."""
+    records = list(iter_json_records(path))
+    if not records:
+        raise ValueError(f"File {path} không có dữ liệu.")
+    return [dict(records[i % len(records)]) for i in range(size)]
+
+
+def synthetic_queries(count, seed=1):
+    rng = random.Random(seed)
+    templates = ["{} là gì?", "Quy định về {} như thế nào?", "Cho tôi biết về {} và {}",
+                 "Sinh viên cần làm gì khi {}?", "{} của ngành {} ra sao?"]
+    vocabulary = [word for words in KEYWORDS.values() for word in words]
+    queries = []
+    for _ in range(count):
+        template = rng.choice(templates)
+        words = [rng.choice(vocabulary) for _ in range(template.count("{}"))]
+        if "ngành" in template:
+            words[-1] = rng.choice(MAJORS)
+        queries.append(template.format(*words))
+    return queries
+
+
+def summarize(latencies_ms):
+    latencies = np.asarray(latencies_ms, dtype=np.float64)
+    total_s = latencies.sum() / 1000
+    return {
+        "count": int(len(latencies)),
+        "mean_ms": float(latencies.mean()),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+        "max_ms": float(latencies.max()),
+        "throughput_per_s": len(latencies) / total_s if total_s > 0 else 0.0,
+    }
+
+
+def _timed(fn, *args, **kwargs):
+    started = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, (time.perf_counter() - started) * 1000
+
+
+def build_agent(records, encoder, llm_latency_ms, llm_tokens, quiet=True):
+    """Encode corpus, nạp vào LocalVectorStore và tạo ChatBotAgent dùng encoder/LLM giả."""
+    model_name = HASH_ENCODER_NAME if encoder == "hash" else MODEL_NAME
+    if encoder == "hash":
+        register_model(HASH_ENCODER_NAME, HashEncoder())
+    handler = EmbeddingHandler(cache_size=0, model_name=model_name, backend="torch")
+    texts = [f"{item.get('regulation', '')}\n{item.get('content', '')}" for item in records]
+    out = io.StringIO() if quiet else sys.stdout
+    with contextlib.redirect_stdout(out):
+        embeddings, ingest_ms = _timed(handler.generate_embeddings, texts)
+        store = LocalVectorStore()
+        _, upsert_ms = _timed(store.upsert_vectors, texts, np.asarray(embeddings), records,
+                              batch_size=max(len(texts), 1))
+        # Tắt cache câu trả lời để mọi câu hỏi đều đi hết pipeline
+        agent = ChatBotAgent(vector_store=store, embedding_handler=handler, llm=StubLLM(llm_latency_ms, llm_tokens),
+                             answer_cache=SemanticAnswerCache(enabled=False))
+    ingest = {"encode_ms": ingest_ms, "encode_docs_per_s": len(texts) / (ingest_ms / 1000) if ingest_ms else 0.0,
+              "upsert_ms": upsert_ms}
+    return agent, ingest
+
+
+def bench_queries(agent, queries, top_k, quiet=True):
+    """Đo từng bước và toàn bộ pipeline cho danh sách câu hỏi; trả về {bước: [độ trễ ms]}."""
+    latencies = {stage: [] for stage in STAGES}
+    out = io.StringIO() if quiet else sys.stdout
+    with contextlib.redirect_stdout(out):
+        for query in queries:
+            query_embedding, ms = _timed(agent.embedding_handler.encode_query, query)
+            latencies["encode"].append(ms)
+
+            (query_hits, search_results), ms = _timed(agent.retrieve_candidates, query, query_embedding, top_k)
+            latencies["search"].append(ms)
+
+            (results, error), ms = _timed(agent.rescore, query_hits, search_results, top_k)
+            latencies["rescore"].append(ms)
+            if error:
+                results = []
+
+            task, ms = _timed(agent.create_task, query, results)
+            latencies["create_task"].append(ms)
+
+            _, ms = _timed(lambda: "".join(agent.stream_llm(task)))
+            latencies["llm"].append(ms)
+
+            _, ms = _timed(lambda: list(agent.run_stream(query, top_k=top_k)))
+            latencies["end_to_end"].append(ms)
+    return latencies
+
+
+def run_benchmark(sizes, top_ks, query_count, encoder="hash", handbook=None, llm_latency_ms=200.0,
+                  llm_tokens=40, seed=0, quiet=True):
+    queries = synthetic_queries(query_count, seed + 1)
+    report = {
+        "config": {"sizes": sizes, "top_k": top_ks, "queries": query_count, "encoder": encoder,
+                   "handbook": handbook, "llm_latency_ms": llm_latency_ms, "llm_tokens": llm_tokens, "seed": seed},
+        "environment": {"python": platform.python_version(), "numpy": np.__version__,
+                        "platform": platform.platform(), "processor": platform.processor()},
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": [],
+    }
+    for size in sizes:
+        records = load_handbook(handbook, size) if handbook else synthetic_handbook(size, seed)
+        agent, ingest = build_agent(records, encoder, llm_latency_ms, llm_tokens, quiet)
+        print(f"📦 Corpus {size} đoạn: encode {ingest['encode_docs_per_s']:.0f} đoạn/giây, "
+              f"nạp vào store {ingest['upsert_ms']:.0f} ms.")
+        for top_k in top_ks:
+            latencies = bench_queries(agent, queries, top_k, quiet)
+            for stage in STAGES:
+                row = {"corpus_size": size, "top_k": top_k, "stage": stage, **summarize(latencies[stage])}
+                report["results"].append(row)
+                print(f"📊 n={size:<7} top_k={top_k:<3} {stage:<12} p50={row['p50_ms']:8.2f} ms  "
+                      f"p95={row['p95_ms']:8.2f} ms  p99={row['p99_ms']:8.2f} ms  "
+                      f"{row['throughput_per_s']:9.1f}/s")
+        report.setdefault("ingest", []).append({"corpus_size": size, **ingest})
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark offline pipeline truy xuất và trả lời.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000], help="Số đoạn của corpus")
+    parser.add_argument("--top-k", type=int, nargs="+", default=[5, 20, 50])
+    parser.add_argument("--queries", type=int, default=100, help="Số câu hỏi cho mỗi cấu hình")
+    parser.add_argument("--encoder", choices=["hash", "model"], default="hash",
+                        help="hash: encoder giả không cần tải model; model: model thật")
+    parser.add_argument("--handbook", help="File JSON/JSONL thay cho sổ tay tổng hợp")
+    parser.add_argument("--llm-latency-ms", type=float, default=200.0)
+    parser.add_argument("--llm-tokens", type=int, default=40)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--verbose", action="store_true", help="Hiện log của agent khi đo")
+    args = parser.parse_args(argv)
+
+    report = run_benchmark(args.sizes, args.top_k, args.queries, args.encoder, args.handbook,
+                           args.llm_latency_ms, args.llm_tokens, args.seed, quiet=not args.verbose)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"✅ Đã lưu kết quả vào {args.output}.")
+    return report
+
+
+if __name__ == "__main__":
+    main()
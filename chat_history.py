@@ -0,0 +1,171 @@
+# chat_history.py
+"""Lịch sử chat theo phiên, giới hạn số lượt mỗi phiên và tự xóa phiên không hoạt động.
+
+Mỗi phiên (session_id) giữ tối đa max_turns cặp (câu hỏi, câu trả lời) gần nhất; phiên
+không có hoạt động quá idle_ttl giây bị xóa, nên bộ nhớ không tăng theo thời gian chạy.
+Backend mặc định giữ trong bộ nhớ; backend SQLite lưu lịch sử xuống đĩa.
+"""
+from collections import OrderedDict, deque
+import os
+import sqlite3
+import threading
+import time
+
+CHAT_HISTORY_TURNS = int(os.getenv("CHAT_HISTORY_TURNS", "20"))
+CHAT_HISTORY_IDLE_TTL = float(os.getenv("CHAT_HISTORY_IDLE_TTL", "3600"))
+
+
+class ChatHistoryStore:
+    """Lịch sử chat trong bộ nhớ: mỗi phiên là một deque vòng, các phiên xếp theo LRU."""
+
+    def __init__(self, max_turns=CHAT_HISTORY_TURNS, idle_ttl=CHAT_HISTORY_IDLE_TTL, max_sessions=10000):
+        self.max_turns = max_turns
+        self.idle_ttl = idle_ttl
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()  # session_id -> (deque các lượt, thời điểm hoạt động cuối)
+        self._lock = threading.Lock()
+        self.evicted_sessions = 0
+
+    def append(self, session_id, query, response):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._sessions.pop(session_id, None)
+            turns = entry[0] if entry else deque(maxlen=self.max_turns)
+            turns.append((query, response))
+            self._sessions[session_id] = (turns, now)
+            self._evict(now)
+
+    def get(self, session_id):
+        """Danh sách các lượt (câu hỏi, câu trả lời) của phiên, cũ nhất trước."""
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            return list(entry[0]) if entry else []
+
+    def clear(self, session_id=None):
+        with self._lock:
+            if session_id is None:
+                self._sessions.clear()
+            else:
+                self._sessions.pop(session_id, None)
+
+    def _evict(self, now):
+        # Các phiên được xếp theo thời điểm hoạt động, phiên cũ nhất nằm đầu
+        while self._sessions:
+            session_id, (_, last_seen) = next(iter(self._sessions.items()))
+            if len(self._sessions) <= self.max_sessions and now - last_seen <= self.idle_ttl:
+                break
+            del self._sessions[session_id]
+            self.evicted_sessions += 1
+
+    def evict_idle(self):
+        with self._lock:
+            self._evict(time.monotonic())
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "turns": sum(len(turns) for turns, _ in self._sessions.values()),
+                "evicted_sessions": self.evicted_sessions,
+            }
+
+
+class SqliteChatHistoryStore:
+    """Lịch sử chat lưu trong SQLite, cùng giao diện và giới hạn với ChatHistoryStore."""
+
+    def __init__(self, path="chat_history.db", max_turns=CHAT_HISTORY_TURNS, idle_ttl=CHAT_HISTORY_IDLE_TTL,
+                 evict_interval=60):
+        self.path = path
+        self.max_turns = max_turns
+        self.idle_ttl = idle_ttl
+        self.evict_interval = evict_interval
+        self._lock = threading.Lock()
+        self._last_evict = 0.0
+        self.evicted_sessions = 0
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS chat_history ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT, created REAL, query TEXT, response TEXT)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS chat_history_session ON chat_history (session_id, id)"
+            )
+
+    @staticmethod
+    def _key(session_id):
+        return "" if session_id is None else str(session_id)
+
+    def append(self, session_id, query, response):
+        key = self._key(session_id)
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO chat_history (session_id, created, query, response) VALUES (?, ?, ?, ?)",
+                (key, now, query, str(response)),
+            )
+            # Chỉ giữ max_turns lượt gần nhất của phiên
+            self._conn.execute(
+                "DELETE FROM chat_history WHERE session_id = ? AND id NOT IN "
+                "(SELECT id FROM chat_history WHERE session_id = ? ORDER BY id DESC LIMIT ?)",
+                (key, key, self.max_turns),
+            )
+            if now - self._last_evict >= self.evict_interval:
+                self._evict(now)
+
+    def get(self, session_id):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT query, response FROM chat_history WHERE session_id = ? ORDER BY id",
+                (self._key(session_id),),
+            ).fetchall()
+        return [tuple(row) for row in rows]
+
+    def clear(self, session_id=None):
+        with self._lock, self._conn:
+            if session_id is None:
+                self._conn.execute("DELETE FROM chat_history")
+            else:
+                self._conn.execute("DELETE FROM chat_history WHERE session_id = ?", (self._key(session_id),))
+
+    def _evict(self, now):
+        self._last_evict = now
+        idle = [row[0] for row in self._conn.execute(
+            "SELECT session_id FROM chat_history GROUP BY session_id HAVING MAX(created) < ?",
+            (now - self.idle_ttl,),
+        )]
+        self._conn.executemany("DELETE FROM chat_history WHERE session_id = ?", [(key,) for key in idle])
+        self.evicted_sessions += len(idle)
+
+    def evict_idle(self):
+        with self._lock, self._conn:
+            self._evict(time.time())
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(DISTINCT session_id) FROM chat_history").fetchone()[0]
+
+    def stats(self):
+        with self._lock:
+            sessions, turns = self._conn.execute(
+                "SELECT COUNT(DISTINCT session_id), COUNT(*) FROM chat_history"
+            ).fetchone()
+        return {"sessions": sessions, "turns": turns, "evicted_sessions": self.evicted_sessions}
+
+    def close(self):
+        self._conn.close()
+
+
+def create_chat_history(backend=None):
+    """Tạo store lịch sử chat theo CHAT_HISTORY_BACKEND: 'memory' (mặc định) hoặc 'sqlite'."""
+    backend = backend or os.getenv("CHAT_HISTORY_BACKEND", "memory")
+    if backend == "memory":
+        return ChatHistoryStore()
+    if backend == "sqlite":
+        return SqliteChatHistoryStore(os.getenv("CHAT_HISTORY_PATH", "chat_history.db"))
+    raise ValueError(f"Chat history backend không hợp lệ: {backend}")
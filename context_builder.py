@@ -0,0 +1,113 @@
+# context_builder.py
+"""Ghép context cho prompt của LLM trong giới hạn số token.
+
+Các đoạn được xếp theo điểm, bỏ các đoạn gần trùng lặp (Jaccard trên shingle 3 từ) rồi
+xếp lần lượt cho đến khi hết ngân sách token. Đếm token bằng tiktoken nếu có cài đặt,
+nếu không thì ước lượng theo số từ.
+"""
+import math
+import os
+import re
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "2000"))
+DUPLICATE_THRESHOLD = 0.8
+
+_WORD_PATTERN = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+# Tokenizer BPE tách tiếng Việt có dấu thành nhiều token hơn số âm tiết
+_TOKENS_PER_WORD = 1.6
+
+
+def _load_encoding(name="cl100k_base"):
+    try:
+        import tiktoken
+        return tiktoken.get_encoding(name)
+    except Exception:
+        return None
+
+
+class TokenCounter:
+    """Đếm token bằng tiktoken; ước lượng theo số từ khi không có tiktoken."""
+
+    def __init__(self, encoding_name="cl100k_base"):
+        self.encoding = _load_encoding(encoding_name)
+
+    @property
+    def exact(self):
+        return self.encoding is not None
+
+    def count(self, text):
+        if self.encoding is not None:
+            return len(self.encoding.encode(text))
+        return math.ceil(len(_WORD_PATTERN.findall(text)) * _TOKENS_PER_WORD)
+
+    def truncate(self, text, max_tokens):
+        """Cắt văn bản để còn tối đa max_tokens token."""
+        if self.encoding is not None:
+            return self.encoding.decode(self.encoding.encode(text)[:max_tokens])
+        words = text.split()
+        keep = int(max_tokens / _TOKENS_PER_WORD)
+        while keep > 0 and self.count(" ".join(words[:keep])) > max_tokens:
+            keep -= 1
+        return " ".join(words[:keep])
+
+
+def _shingles(text, size=3):
+    words = _WORD_PATTERN.findall(text.lower())
+    if len(words) <= size:
+        return {tuple(words)}
+    return {tuple(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class ContextBuilder:
+    """Chọn và ghép các đoạn kết quả tìm kiếm vào context trong giới hạn token_budget."""
+
+    def __init__(self, token_budget=CONTEXT_TOKEN_BUDGET, duplicate_threshold=DUPLICATE_THRESHOLD,
+                 separator="\n\n", counter=None):
+        self.token_budget = token_budget
+        self.duplicate_threshold = duplicate_threshold
+        self.separator = separator
+        self.counter = counter or TokenCounter()
+
+    def build(self, results, clean=None):
+        """Trả về (context, thống kê) từ các kết quả dạng {"text", "score", ...}.
+
+        clean là hàm làm sạch văn bản của từng đoạn trước khi đếm token.
+        """
+        stats = {"candidates": len(results or []), "used": 0, "duplicates": 0, "over_budget": 0,
+                 "truncated": False, "tokens": 0, "budget": self.token_budget}
+        if not results:
+            return "", stats
+        separator_tokens = self.counter.count(self.separator)
+        ranked = sorted(results, key=lambda result: result.get("score", 0.0), reverse=True)
+        chosen, chosen_shingles = [], []
+        used_tokens = 0
+        for result in ranked:
+            text = clean(result["text"]) if clean else result["text"]
+            text = text.strip()
+            if not text:
+                continue
+            shingles = _shingles(text)
+            if any(jaccard(shingles, other) >= self.duplicate_threshold for other in chosen_shingles):
+                stats["duplicates"] += 1
+                continue
+            tokens = self.counter.count(text) + (separator_tokens if chosen else 0)
+            if used_tokens + tokens > self.token_budget:
+                if chosen:
+                    stats["over_budget"] += 1
+                    continue
+                # Đoạn điểm cao nhất đã vượt ngân sách: cắt bớt thay vì để context rỗng
+                text = self.counter.truncate(text, self.token_budget)
+                tokens = self.counter.count(text)
+                stats["truncated"] = True
+            chosen.append(text)
+            chosen_shingles.append(shingles)
+            used_tokens += tokens
+        stats["used"] = len(chosen)
+        stats["tokens"] = used_tokens
+        return self.separator.join(chosen), stats
@@ -0,0 +1,227 @@
+# embedding_store.py
+"""Lưu embeddings dạng ma trận float32 .npy (mở bằng mmap) và texts/metadata dạng JSONL có chỉ mục.
+
+Với prefix P, store gồm:
+    P.npy              ma trận embeddings float32 (n, d), liên tục
+    P.records.jsonl    mỗi dòng một bản ghi {"text", "metadata", "hash", "features"}
+    P.records.idx.npy  offset byte của từng dòng (n + 1 phần tử, int64)
+    P.meta.json        thông tin store (số dòng, model, fingerprint embeddings), được ghi cuối cùng
+                       khi mọi file đã hoàn tất
+"""
+from collections.abc import Sequence
+import hashlib
+import json
+import mmap
+import os
+import pickle
+import shutil
+import numpy as np
+
+STORE_VERSION = 1
+
+
+def _paths(prefix):
+    return {
+        "embeddings": f"{prefix}.npy",
+        "records": f"{prefix}.records.jsonl",
+        "index": f"{prefix}.records.idx.npy",
+        "meta": f"{prefix}.meta.json",
+    }
+
+
+def embeddings_fingerprint(embeddings, block_rows=65536):
+    """SHA-1 của ma trận embeddings float32, tính theo khối để không phải đọc hết vào RAM.
+
+    Dùng để nhận biết dữ liệu dẫn xuất (ví dụ chỉ mục IVF) đã cũ so với embeddings hiện tại.
+    """
+    digest = hashlib.sha1()
+    for start in range(0, len(embeddings), block_rows):
+        digest.update(np.ascontiguousarray(embeddings[start:start + block_rows], dtype=np.float32).tobytes())
+    return digest.hexdigest()
+
+
+def saved_fingerprint(prefix):
+    """Fingerprint embeddings ghi trong meta của store (None nếu store cũ chưa có)."""
+    with open(_paths(prefix)["meta"], 'r', encoding='utf-8') as f:
+        return json.load(f).get("fingerprint")
+
+
+def is_store(prefix):
+    """Kiểm tra prefix có phải một store đã ghi hoàn chỉnh hay không."""
+    return os.path.exists(_paths(prefix)["meta"])
+
+
+class EmbeddingStoreWriter:
+    """Ghi store theo từng phần: embeddings được ghi thẳng xuống đĩa nên bộ nhớ không tăng theo số dòng."""
+
+    def __init__(self, prefix, model=None, feature_version=None):
+        self.prefix = prefix
+        self.model = model
+        self.feature_version = feature_version
+        self.paths = _paths(prefix)
+        directory = os.path.dirname(os.path.abspath(prefix))
+        os.makedirs(directory, exist_ok=True)
+        self._raw = open(f"{self.paths['embeddings']}.part", 'wb')
+        self._records = open(f"{self.paths['records']}.part", 'wb')
+        self._offsets = [0]
+        self._digest = hashlib.sha1()
+        self.count = 0
+        self.dim = None
+
+    def append(self, texts, embeddings, metadata, hashes=None, features=None):
+        """Ghi thêm một phần dữ liệu (các danh sách cùng độ dài)."""
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        if len(embeddings) == 0:
+            return
+        if embeddings.ndim != 2 or len(embeddings) != len(texts):
+            raise ValueError("Số embeddings không khớp với số văn bản.")
+        if self.dim is None:
+            self.dim = embeddings.shape[1]
+        elif embeddings.shape[1] != self.dim:
+            raise ValueError(f"Embedding {embeddings.shape[1]} chiều, store đang dùng {self.dim} chiều.")
+        data = embeddings.tobytes()
+        self._raw.write(data)
+        self._digest.update(data)
+        hashes = hashes if hashes is not None else [None] * len(texts)
+        features = features if features is not None else [None] * len(texts)
+        for text, meta, h, columns in zip(texts, metadata, hashes, features):
+            record = {"text": text, "metadata": meta, "hash": h, "features": columns}
+            line = json.dumps(record, ensure_ascii=False).encode('utf-8') + b"\n"
+            self._records.write(line)
+            self._offsets.append(self._offsets[-1] + len(line))
+        self.count += len(embeddings)
+
+    def close(self):
+        """Hoàn tất file .npy, chỉ mục và meta; thay thế store cũ (nếu có)."""
+        self._raw.close()
+        self._records.close()
+        raw_path = f"{self.paths['embeddings']}.part"
+        dim = self.dim or 0
+        tmp_npy = f"{self.paths['embeddings']}.tmp"
+        # Ghi header .npy rồi sao chép dữ liệu thô theo từng khối
+        with open(tmp_npy, 'wb') as out, open(raw_path, 'rb') as raw:
+            header = {'descr': np.lib.format.dtype_to_descr(np.dtype(np.float32)),
+                      'fortran_order': False, 'shape': (self.count, dim)}
+            np.lib.format.write_array_header_1_0(out, header)
+            shutil.copyfileobj(raw, out, 16 * 1024 * 1024)
+        os.remove(raw_path)
+        tmp_index = f"{self.paths['index']}.tmp.npy"
+        np.save(tmp_index, np.asarray(self._offsets, dtype=np.int64))
+
+        os.replace(tmp_npy, self.paths['embeddings'])
+        os.replace(f"{self.paths['records']}.part", self.paths['records'])
+        os.replace(tmp_index, self.paths['index'])
+        with open(f"{self.paths['meta']}.tmp", 'w', encoding='utf-8') as f:
+            json.dump({"version": STORE_VERSION, "count": self.count, "dim": dim, "model": self.model,
+                       "feature_version": self.feature_version, "fingerprint": self._digest.hexdigest()}, f)
+        os.replace(f"{self.paths['meta']}.tmp", self.paths['meta'])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._raw.close()
+            self._records.close()
+
+
+class _RecordField(Sequence):
+    """Dãy chỉ đọc (Sequence), đọc lười một trường của bản ghi (text/metadata/hash/features) theo chỉ số.
+
+    Chỉ dùng được khi store còn mở; cắt lát trả về list. Cần danh sách độc lập với store thì
+    dùng list(...).
+    """
+
+    def __init__(self, store, field):
+        self._store = store
+        self._field = field
+
+    def __len__(self):
+        return len(self._store)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._store.record(i).get(self._field) for i in range(*index.indices(len(self)))]
+        return self._store.record(index).get(self._field)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+class EmbeddingStore:
+    """Store chỉ đọc: embeddings mở bằng np.load(mmap_mode='r'), bản ghi đọc theo offset.
+
+    Store giữ file mở cho đến khi gọi close() (hoặc ra khỏi khối with); phải đóng trước khi
+    ghi đè store cùng prefix.
+    """
+
+    def __init__(self, prefix, mmap_mode='r'):
+        self.prefix = prefix
+        self.paths = _paths(prefix)
+        with open(self.paths['meta'], 'r', encoding='utf-8') as f:
+            self.info = json.load(f)
+        self.model = self.info.get('model')
+        self.feature_version = self.info.get('feature_version')
+        self.embeddings = np.load(self.paths['embeddings'], mmap_mode=mmap_mode)
+        self._offsets = np.load(self.paths['index'])
+        self._file = open(self.paths['records'], 'rb')
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if len(self) else None
+        self.texts = _RecordField(self, 'text')
+        self.metadata = _RecordField(self, 'metadata')
+        self.hashes = _RecordField(self, 'hash')
+        self.features = _RecordField(self, 'features')
+
+    def __len__(self):
+        return self.info['count']
+
+    def record(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        start, end = int(self._offsets[index]), int(self._offsets[index + 1])
+        return json.loads(self._mmap[start:end])
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        self._file.close()
+        # mmap của np.load được đóng khi không còn tham chiếu (không đóng trực tiếp được khi
+        # còn mảng con trỏ vào), nên chỉ bỏ tham chiếu của store
+        self.embeddings = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def write_store(prefix, texts, embeddings, metadata, hashes=None, model=None, features=None, feature_version=None):
+    with EmbeddingStoreWriter(prefix, model=model, feature_version=feature_version) as writer:
+        writer.append(texts, embeddings, metadata, hashes, features)
+
+
+def open_store(prefix):
+    return EmbeddingStore(prefix)
+
+
+def convert_pickle(pkl_path, prefix):
+    """Chuyển file embeddings_data.pkl cũ sang định dạng store mới."""
+    with open(pkl_path, 'rb') as f:
+        data = pickle.load(f)
+    write_store(prefix, data['texts'], data['embeddings'], data['metadata'],
+                data.get('hashes'), data.get('model'), data.get('features'), data.get('feature_version'))
+    print(f"✅ Đã chuyển {pkl_path} sang {prefix}.npy ({len(data['texts'])} dòng).")
+
+
+if __name__ == "__main__":
+    import sys
+
+    source = sys.argv[1] if len(sys.argv) > 1 else 'embeddings_data.pkl'
+    target = sys.argv[2] if len(sys.argv) > 2 else 'embeddings_data'
+    convert_pickle(source, target)
@@ -1,13 +1,424 @@
 # embeddings.py
 from sentence_transformers import SentenceTransformer
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+import asyncio
+import numpy as np
+import unicodedata
+import threading
+import hashlib
+import queue
+import time
+import atexit
 import json
 import pickle
 import os
+from embedding_store import EmbeddingStoreWriter, write_store, open_store, is_store, convert_pickle
+from text_features import extract_features, FEATURE_VERSION
+
+MODEL_NAME = 'sentence-transformers/paraphrase-multilingual-mpnet-base-v2'
+
+# Registry model dùng chung trong toàn tiến trình: mỗi model chỉ được tải một lần
+_MODEL_REGISTRY = {}
+_MODEL_REGISTRY_LOCK = threading.Lock()
+
+
+def get_shared_model(model_name=MODEL_NAME, backend='torch'):
+    """Tải (lần đầu) và trả về model dùng chung cho mọi EmbeddingHandler.
+
+    backend: 'torch' (SentenceTransformer), 'onnx' hoặc 'onnx-int8' (ONNX Runtime).
+    """
+    key = (model_name, backend)
+    model = _MODEL_REGISTRY.get(key)
+    if model is not None:
+        return model
+    if backend != 'torch':
+        # Model PyTorch cần để xuất ONNX, phải tải ngoài khóa để tránh deadlock
+        st_model = get_shared_model(model_name)
+    with _MODEL_REGISTRY_LOCK:
+        model = _MODEL_REGISTRY.get(key)
+        if model is None:
+            print(f"⏳ Đang tải model {model_name} ({backend})...")
+            if backend == 'torch':
+                model = SentenceTransformer(model_name)
+            elif backend in ('onnx', 'onnx-int8'):
+                from onnx_backend import load_onnx_encoder
+                # Ném ValueError nếu embeddings ONNX lệch so với PyTorch (kiểm tra một lần sau khi xuất)
+                model = load_onnx_encoder(st_model, quantize=backend == 'onnx-int8', model_name=model_name)
+            else:
+                raise ValueError(f"Backend không hợp lệ: {backend}")
+            _MODEL_REGISTRY[key] = model
+            print(f"✅ Đã tải model {model_name} ({backend}).")
+    return model
+
+
+def register_model(model_name, model, backend='torch'):
+    """Đăng ký một encoder có sẵn (có phương thức encode như SentenceTransformer) vào registry,
+    ví dụ encoder giả khi benchmark offline."""
+    with _MODEL_REGISTRY_LOCK:
+        _MODEL_REGISTRY[(model_name, backend)] = model
+
+
+# Số ký tự cuối bộ đệm mà lỗi giải mã nằm trong đó được coi là do bộ đệm cắt ngang một giá trị
+# (literal, escape \uXXXX hoặc dấu phân cách bị cắt), không phải dữ liệu hỏng
+_TRUNCATION_MARGIN = 16
+
+
+def _truncated(error, buffer):
+    """Lỗi giải mã có phải do bộ đệm kết thúc giữa chừng (đọc thêm có thể giải mã được)."""
+    return error.msg.startswith("Unterminated string") or error.pos >= len(buffer) - _TRUNCATION_MARGIN
+
+
+def iter_json_records(file_path, read_size=1 << 20, max_record_size=64 << 20):
+    """Đọc lần lượt từng bản ghi từ file JSON (mảng) hoặc JSONL mà không tải toàn bộ file vào bộ nhớ.
+
+    Ném json.JSONDecodeError ngay khi gặp bản ghi hỏng, hoặc khi một bản ghi dài hơn
+    max_record_size ký tự vẫn chưa giải mã được.
+    """
+    with open(file_path, 'r', encoding='utf-8') as f:
+        buffer = f.read(read_size).lstrip('\ufeff')
+        while not buffer.strip():
+            more = f.read(read_size)
+            if not more:
+                return
+            buffer += more
+        start = len(buffer) - len(buffer.lstrip())
+        if not buffer[start:start + 1] == '[':
+            # JSONL: mỗi dòng một object, đọc lại từ đầu file theo từng dòng
+            f.seek(0)
+            for line in f:
+                line = line.strip().lstrip('\ufeff')
+                if line:
+                    yield json.loads(line)
+            return
+
+        # Mảng JSON: giải mã từng phần tử bằng raw_decode trên bộ đệm trượt
+        decoder = json.JSONDecoder()
+        pos = start + 1
+        eof = False
+        while True:
+            while pos < len(buffer) and (buffer[pos].isspace() or buffer[pos] == ','):
+                pos += 1
+            if pos < len(buffer) and buffer[pos] == ']':
+                return
+            try:
+                if pos == len(buffer):
+                    raise json.JSONDecodeError("Hết bộ đệm", buffer, pos)
+                item, end = decoder.raw_decode(buffer, pos)
+                if end == len(buffer) and not eof:
+                    # Giá trị kết thúc đúng ở cuối bộ đệm có thể bị cắt (ví dụ số 1234 chỉ đọc được 12)
+                    raise json.JSONDecodeError("Giá trị có thể bị cắt", buffer, end)
+            except json.JSONDecodeError as e:
+                if eof or not _truncated(e, buffer) or len(buffer) - pos > max_record_size:
+                    raise
+                more = f.read(read_size)
+                eof = not more
+                buffer = buffer[pos:] + more
+                pos = 0
+                continue
+            pos = end
+            yield item
+            if pos > read_size:
+                buffer = buffer[pos:]
+                pos = 0
+
+
+def _chunked(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def content_hash(text):
+    """Hash nội dung văn bản, dùng để nhận biết đoạn đã thay đổi giữa các lần xử lý."""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class QueryEmbeddingCache:
+    """Cache LRU ánh xạ câu hỏi đã chuẩn hóa -> embedding, có thể lưu xuống đĩa.
+
+    Khóa giữ nguyên chữ hoa/thường vì tokenizer của model phân biệt hoa thường: hai câu hỏi
+    chỉ khác nhau về chữ hoa có embedding khác nhau.
+    """
+
+    # Tăng khi đổi cách chuẩn hóa khóa, để không nạp cache đã lưu theo cách cũ
+    KEY_FORMAT = 2
+
+    def __init__(self, max_entries=1024, max_bytes=64 * 1024 * 1024, path=None, model_id=MODEL_NAME):
+        self.model_id = model_id
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.path = path
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._dirty = False
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if path:
+            self.load()
+
+    @staticmethod
+    def normalize(query):
+        """Chuẩn hóa câu hỏi: Unicode NFC, bỏ khoảng trắng thừa (không đổi chữ hoa/thường)."""
+        return " ".join(unicodedata.normalize("NFC", query).split())
+
+    def get(self, query):
+        """Trả về embedding đã lưu (hoặc None) và cập nhật thứ tự LRU."""
+        key = self.normalize(query)
+        with self._lock:
+            embedding = self._entries.get(key)
+            if embedding is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return embedding
+
+    def put(self, query, embedding):
+        """Lưu embedding cho câu hỏi, loại bỏ các mục cũ nhất khi vượt giới hạn."""
+        key = self.normalize(query)
+        embedding = np.array(embedding, dtype=np.float32)
+        embedding.setflags(write=False)  # Tránh việc bên gọi sửa trực tiếp giá trị trong cache
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old.nbytes
+            self._entries[key] = embedding
+            self._bytes += embedding.nbytes
+            self._dirty = True
+            self._evict()
+        return embedding
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            _, old = self._entries.popitem(last=False)
+            self._bytes -= old.nbytes
+            self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self._dirty = True
+
+    def stats(self):
+        """Thống kê số lần trúng/trượt cache và dung lượng đang dùng."""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+    def save(self, path=None):
+        """Ghi cache xuống đĩa (ghi ra file tạm rồi thay thế để tránh hỏng file)."""
+        path = path or self.path
+        if not path:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            entries = list(self._entries.items())
+            self._dirty = False
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump({'model': self.model_id, 'key_format': self.KEY_FORMAT, 'entries': entries}, f)
+        os.replace(tmp_path, path)
+
+    def load(self, path=None):
+        """Nạp cache từ đĩa nếu file tồn tại và cùng model."""
+        path = path or self.path
+        if not path or not os.path.exists(path):
+            return
+        try:
+            with open(path, 'rb') as f:
+                data = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError) as e:
+            print(f"⚠️ Không đọc được cache embeddings {path}: {e}")
+            return
+        if data.get('model') != self.model_id:
+            print(f"⚠️ Cache {path} được tạo bởi model khác, bỏ qua.")
+            return
+        if data.get('key_format') != self.KEY_FORMAT:
+            # Cache cũ dùng khóa chữ thường: embedding có thể thuộc một biến thể hoa/thường khác
+            print(f"⚠️ Cache {path} dùng định dạng khóa cũ, bỏ qua.")
+            return
+        for key, embedding in data['entries']:
+            self.put(key, embedding)
+        self._dirty = False
+        print(f"Đã tải {len(self._entries)} embeddings câu hỏi từ {path}.")
+
+
+class EmbeddingBatcher:
+    """Gom các yêu cầu encode một câu hỏi đồng thời thành batch để gọi model.encode một lần."""
+
+    def __init__(self, encode_fn, max_batch_size=32, max_wait_ms=5, max_queue=1024):
+        self.encode_fn = encode_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stats_lock = threading.Lock()
+        self._queue_latencies = deque(maxlen=10000)
+        self._started_at = time.perf_counter()
+        self.batches = 0
+        self.items = 0
+        self.encode_seconds = 0.0
+        self._closed = False
+        self._close_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._worker, name="embedding-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, text):
+        """Đưa câu hỏi vào hàng đợi, trả về Future chứa embedding.
+
+        Ném queue.Full nếu hàng đợi đầy, RuntimeError nếu batcher đã đóng.
+        """
+        future = Future()
+        with self._close_lock:
+            if self._closed:
+                raise RuntimeError("EmbeddingBatcher đã đóng.")
+            self._queue.put_nowait((text, future, time.perf_counter()))
+        return future
+
+    def encode(self, text, timeout=None):
+        return self.submit(text).result(timeout)
+
+    def close(self):
+        """Dừng luồng xử lý sau khi đã encode hết các yêu cầu còn trong hàng đợi."""
+        with self._close_lock:
+            if self._closed:
+                return
+            # Sau khi đánh dấu đóng, không còn yêu cầu nào được đưa vào sau tín hiệu dừng
+            self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+
+    def _worker(self):
+        running = True
+        while running:
+            batch = []
+            try:
+                item = self._queue.get()
+                if item is None:
+                    break
+                batch.append(item)
+                deadline = time.perf_counter() + self.max_wait
+                # Chờ thêm yêu cầu cho đến khi đủ batch hoặc hết thời gian chờ
+                while len(batch) < self.max_batch_size:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        break
+                    try:
+                        item = self._queue.get(timeout=remaining)
+                    except queue.Empty:
+                        break
+                    if item is None:
+                        running = False
+                        break
+                    batch.append(item)
+                self._run_batch(batch)
+            except Exception as e:
+                # Luồng xử lý không được dừng giữa chừng: mọi yêu cầu chưa xong đều nhận lỗi
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def _run_batch(self, batch):
+        started = time.perf_counter()
+        batch = [(text, future, enqueued) for text, future, enqueued in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        embeddings = self.encode_fn([text for text, _, _ in batch])
+        if len(embeddings) != len(batch):
+            raise ValueError(f"Model trả về {len(embeddings)} embeddings cho {len(batch)} câu hỏi.")
+        finished = time.perf_counter()
+        for (_, future, _), embedding in zip(batch, embeddings):
+            future.set_result(embedding)
+        with self._stats_lock:
+            self.batches += 1
+            self.items += len(batch)
+            self.encode_seconds += finished - started
+            self._queue_latencies.extend(started - enqueued for _, _, enqueued in batch)
+
+    def stats(self):
+        """Thống kê throughput và độ trễ chờ trong hàng đợi (ms)."""
+        with self._stats_lock:
+            latencies = np.array(self._queue_latencies, dtype=np.float64) * 1000
+            elapsed = time.perf_counter() - self._started_at
+            return {
+                "batches": self.batches,
+                "items": self.items,
+                "avg_batch_size": self.items / self.batches if self.batches else 0.0,
+                "queue_depth": self._queue.qsize(),
+                "throughput_per_s": self.items / elapsed if elapsed > 0 else 0.0,
+                "encode_throughput_per_s": self.items / self.encode_seconds if self.encode_seconds else 0.0,
+                "queue_latency_ms_p50": float(np.percentile(latencies, 50)) if len(latencies) else 0.0,
+                "queue_latency_ms_p95": float(np.percentile(latencies, 95)) if len(latencies) else 0.0,
+                "queue_latency_ms_max": float(latencies.max()) if len(latencies) else 0.0,
+            }
+
 
 class EmbeddingHandler:
-    def __init__(self):
-        # Sử dụng Vietnamese_Embedding từ AITeamVN
-        self.model = SentenceTransformer('sentence-transformers/paraphrase-multilingual-mpnet-base-v2')
+    def __init__(self, cache_size=1024, cache_max_bytes=64 * 1024 * 1024, cache_path=None,
+                 model_name=MODEL_NAME, backend=None, encode_workers=None):
+        # Model chỉ được tải khi cần lần đầu và dùng chung giữa các handler
+        self.model_name = model_name
+        self.backend = backend or os.getenv("EMBEDDING_BACKEND", "torch")
+        self._warmup_thread = None
+        self.batcher = None
+        # Số luồng tối đa chạy model cho aencode_query (ENCODE_WORKERS)
+        self.encode_workers = encode_workers or int(os.getenv("ENCODE_WORKERS", "2"))
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        # Cache embeddings của câu hỏi để bỏ qua model với các câu hỏi lặp lại
+        self.query_cache = None
+        if cache_size:
+            self.query_cache = QueryEmbeddingCache(cache_size, cache_max_bytes, cache_path,
+                                                   model_id=f"{self.model_name}:{self.backend}")
+            if cache_path:
+                atexit.register(self.query_cache.save)
+
+    @property
+    def model(self):
+        return get_shared_model(self.model_name, self.backend)
+
+    def enable_batching(self, max_batch_size=32, max_wait_ms=5, max_queue=1024):
+        """Bật chế độ gom batch cho encode_query khi có nhiều yêu cầu đồng thời."""
+        if self.batcher is None:
+            self.batcher = EmbeddingBatcher(self.generate_embeddings, max_batch_size, max_wait_ms, max_queue)
+        return self.batcher
+
+    def disable_batching(self):
+        if self.batcher is not None:
+            self.batcher.close()
+            self.batcher = None
+
+    def warmup(self, background=False):
+        """Tải model trước khi có câu hỏi; background=True để tải trong luồng riêng."""
+        if not background:
+            self.model.encode(["khởi động"], convert_to_tensor=False)
+            return None
+        if self._warmup_thread is None or not self._warmup_thread.is_alive():
+            self._warmup_thread = threading.Thread(target=self.warmup, name="embedding-warmup", daemon=True)
+            self._warmup_thread.start()
+        return self._warmup_thread
+
+    def wait_until_ready(self, timeout=None):
+        """Chờ luồng warmup (nếu có) hoàn tất; trả về True khi model đã sẵn sàng."""
+        if self._warmup_thread is not None:
+            self._warmup_thread.join(timeout)
+        return (self.model_name, self.backend) in _MODEL_REGISTRY
 
     def load_json_data(self, file_path):
         """Tải dữ liệu từ file JSON."""
@@ -29,8 +440,65 @@ class EmbeddingHandler:
         embeddings = self.model.encode(texts, convert_to_tensor=False)
         return embeddings
 
-    def process_handbook(self, file_path, output_path='embeddings_data.pkl'):
-        """Xử lý dữ liệu từ file JSON, tạo embeddings và lưu vào file để tái sử dụng."""
+    def encode_query(self, query):
+        """Tạo embedding cho một câu hỏi, dùng cache nếu câu hỏi đã gặp trước đó."""
+        if self.query_cache is not None:
+            cached = self.query_cache.get(query)
+            if cached is not None:
+                return cached
+        if self.batcher is not None:
+            embedding = self.batcher.encode(query)
+        else:
+            embedding = self.generate_embeddings([query])[0]
+        if self.query_cache is not None:
+            embedding = self.query_cache.put(query, embedding)
+        return embedding
+
+    def encode_queries(self, queries):
+        """Tạo embeddings cho nhiều câu hỏi: các câu chưa có trong cache được encode trong một lần
+        gọi model."""
+        embeddings = [self.query_cache.get(query) if self.query_cache is not None else None for query in queries]
+        missing = {}
+        for query, embedding in zip(queries, embeddings):
+            if embedding is None and query not in missing:
+                missing[query] = None
+        if missing:
+            for query, embedding in zip(missing, self.generate_embeddings(list(missing))):
+                missing[query] = self.query_cache.put(query, embedding) if self.query_cache is not None else embedding
+        return [embedding if embedding is not None else missing[query] for query, embedding in zip(queries, embeddings)]
+
+    def _encode_executor(self):
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.encode_workers,
+                                                    thread_name_prefix="embedding-encode")
+            return self._executor
+
+    async def aencode_query(self, query):
+        """Phiên bản asyncio của encode_query: model chạy ngoài event loop, trong executor
+        giới hạn encode_workers luồng (hoặc qua batcher nếu đã bật)."""
+        if self.query_cache is not None:
+            cached = self.query_cache.get(query)
+            if cached is not None:
+                return cached
+        if self.batcher is not None:
+            embedding = await asyncio.wrap_future(self.batcher.submit(query))
+        else:
+            loop = asyncio.get_running_loop()
+            embeddings = await loop.run_in_executor(self._encode_executor(), self.generate_embeddings, [query])
+            embedding = embeddings[0]
+        if self.query_cache is not None:
+            embedding = self.query_cache.put(query, embedding)
+        return embedding
+
+    def process_handbook(self, file_path, output_path='embeddings_data', incremental=False):
+        """Xử lý dữ liệu từ file JSON, tạo embeddings và lưu vào file để tái sử dụng.
+
+        output_path là prefix của store .npy/JSONL (xem embedding_store); đường dẫn .pkl
+        vẫn được hỗ trợ cho định dạng cũ.
+        incremental=True: tái sử dụng embeddings của các đoạn không đổi từ output_path cũ,
+        chỉ encode các đoạn mới hoặc đã chỉnh sửa.
+        """
         # Tải dữ liệu
         data = self.load_json_data(file_path)
         if not data:
@@ -38,25 +506,140 @@ class EmbeddingHandler:
 
         # Kết hợp regulation và content với ký tự xuống dòng \n
         texts = [f"{item.get('regulation', '')}\n{item.get('content', '')}" for item in data]
+        hashes = [content_hash(text) for text in texts]
+        # Đặc trưng từ khóa tính một lần tại đây để search_data không phải quét lại văn bản
+        features = [extract_features(text) for text in texts]
         
         # Tạo embeddings
-        embeddings = self.generate_embeddings(texts)
+        if incremental:
+            embeddings = self._incremental_embeddings(texts, hashes, output_path)
+        else:
+            embeddings = self.generate_embeddings(texts)
         
         # Lưu dữ liệu vào file để tái sử dụng
-        output_data = {
-            'texts': texts,
-            'embeddings': embeddings,
-            'metadata': data
-        }
-        with open(output_path, 'wb') as f:
-            pickle.dump(output_data, f)
+        model_id = f"{self.model_name}:{self.backend}"
+        if output_path.endswith('.pkl'):
+            output_data = {
+                'texts': texts,
+                'embeddings': embeddings,
+                'metadata': data,
+                'hashes': hashes,
+                'model': model_id,
+                'features': features,
+                'feature_version': FEATURE_VERSION
+            }
+            with open(output_path, 'wb') as f:
+                pickle.dump(output_data, f)
+        else:
+            write_store(output_path, texts, embeddings, data, hashes, model_id, features, FEATURE_VERSION)
         print(f"Đã lưu dữ liệu vào {output_path} để tái sử dụng.")
 
         return texts, embeddings, data
 
-    def load_saved_embeddings(self, file_path='embeddings_data.pkl'):
-        """Tải dữ liệu embeddings đã lưu trước đó."""
-        if os.path.exists(file_path):
+    def process_handbook_streaming(self, file_path, output_path='embeddings_data', chunk_size=256, vector_store=None):
+        """Xử lý handbook (JSON hoặc JSONL) theo từng phần chunk_size bản ghi với bộ nhớ không đổi.
+
+        Embeddings của mỗi phần được ghi ngay vào store; nếu truyền vector_store thì
+        phần đó cũng được upsert luôn (collection được tạo nếu chưa có) và phiên bản dữ liệu của
+        vector store được ghi một lần sau phần cuối. Kết quả đọc từ store như load_saved_embeddings.
+        """
+        total = 0
+        # Bộ đếm ID dùng chung cho mọi phần, để ID giống như VectorStore.sync trên toàn bộ dữ liệu
+        occurrences = {}
+        point_ids = []
+        if vector_store is not None:
+            vector_store.ensure_collection()
+        try:
+            with EmbeddingStoreWriter(output_path, model=f"{self.model_name}:{self.backend}",
+                                      feature_version=FEATURE_VERSION) as writer:
+                for chunk in _chunked(iter_json_records(file_path), chunk_size):
+                    texts = [f"{item.get('regulation', '')}\n{item.get('content', '')}" for item in chunk]
+                    hashes = [content_hash(text) for text in texts]
+                    features = [extract_features(text) for text in texts]
+                    embeddings = np.asarray(self.generate_embeddings(texts), dtype=np.float32)
+                    writer.append(texts, embeddings, chunk, hashes, features)
+                    if vector_store is not None:
+                        point_ids += vector_store.upsert_vectors(texts, embeddings, chunk, occurrences=occurrences,
+                                                                 features=features, mark_changed=False)
+                    total += len(chunk)
+                    print(f"✅ Đã xử lý {total} bản ghi.")
+        except FileNotFoundError:
+            print(f"File {file_path} không tồn tại. Vui lòng kiểm tra lại đường dẫn.")
+            return [], [], []
+        except json.JSONDecodeError:
+            print(f"File {file_path} không đúng định dạng JSON.")
+            return [], [], []
+        finally:
+            # Kể cả khi dừng giữa chừng: các phần đã upsert vẫn làm dữ liệu cũ trong cache hết hạn
+            if point_ids:
+                vector_store.mark_changed(point_ids, point_ids)
+
+        print(f"Đã lưu dữ liệu vào {output_path} để tái sử dụng.")
+        store = open_store(output_path)
+        return store.texts, store.embeddings, store.metadata
+
+    def _incremental_embeddings(self, texts, hashes, previous_path):
+        """Ghép embeddings cũ (theo hash nội dung) với embeddings của các đoạn mới."""
+        previous = self._previous_embeddings(previous_path)
+
+        # Các đoạn trùng nội dung chỉ cần encode một lần
+        missing = {}
+        for text, h in zip(texts, hashes):
+            if h not in previous and h not in missing:
+                missing[h] = text
+        new_rows = dict(zip(missing, self.generate_embeddings(list(missing.values())))) if missing else {}
+
+        embeddings = np.stack([previous[h] if h in previous else new_rows[h] for h in hashes]).astype(np.float32)
+        current = set(hashes)
+        reused = sum(1 for h in hashes if h in previous)
+        removed = sum(1 for h in previous if h not in current)
+        print(f"♻️ Tái sử dụng {reused} embeddings, encode mới {len(missing)}, loại bỏ {removed}.")
+        return embeddings
+
+    def _previous_embeddings(self, path):
+        """Embeddings đã lưu ở path theo hash nội dung ({hash: vector}), rỗng nếu không có hoặc khác model.
+
+        Các dòng được sao chép ra khỏi mmap và store được đóng ngay, vì store cũ sẽ bị ghi đè.
+        """
+        if is_store(path):
+            with open_store(path) as store:
+                return self._rows_by_hash(path, store.texts, store.embeddings, store.hashes, store.model)
+        if os.path.isfile(path):
+            with open(path, 'rb') as f:
+                saved = pickle.load(f)
+            hashes = saved.get('hashes') or [None] * len(saved['texts'])
+            return self._rows_by_hash(path, saved['texts'], saved['embeddings'], hashes, saved.get('model'))
+        return {}
+
+    def _rows_by_hash(self, path, texts, embeddings, hashes, model):
+        if (model or f"{MODEL_NAME}:torch") != f"{self.model_name}:{self.backend}":
+            print(f"⚠️ {path} được tạo bởi model khác, encode lại toàn bộ.")
+            return {}
+        hashes = [h or content_hash(text) for h, text in zip(hashes, texts)]
+        return {h: np.array(row) for h, row in zip(hashes, embeddings)}
+
+    def load_saved_features(self, file_path='embeddings_data'):
+        """Đặc trưng từ khóa đã lưu cùng embeddings; None nếu chưa có hoặc khác FEATURE_VERSION."""
+        if is_store(file_path):
+            store = open_store(file_path)
+            return store.features if store.feature_version == FEATURE_VERSION else None
+        if os.path.isfile(file_path):
+            with open(file_path, 'rb') as f:
+                data = pickle.load(f)
+            return data.get('features') if data.get('feature_version') == FEATURE_VERSION else None
+        return None
+
+    def load_saved_embeddings(self, file_path='embeddings_data'):
+        """Tải dữ liệu embeddings đã lưu trước đó (store mmap hoặc file .pkl cũ).
+
+        Với store, texts và metadata là dãy chỉ đọc (collections.abc.Sequence) đọc lười từ đĩa
+        và embeddings là ma trận mmap; với file .pkl là list và mảng trong bộ nhớ.
+        """
+        if is_store(file_path):
+            store = open_store(file_path)
+            print(f"Đã mở dữ liệu từ {file_path} (mmap, {len(store)} dòng).")
+            return store.texts, store.embeddings, store.metadata
+        elif os.path.isfile(file_path):
             with open(file_path, 'rb') as f:
                 data = pickle.load(f)
             print(f"Đã tải dữ liệu từ {file_path}.")
@@ -68,12 +651,17 @@ class EmbeddingHandler:
 if __name__ == "__main__":
     # Đường dẫn đến file JSON
     json_file_path = os.path.join('data', 'data_raw.json')
-    output_file_path = 'embeddings_data.pkl'
+    output_file_path = 'embeddings_data'
+    legacy_file_path = 'embeddings_data.pkl'
 
     handler = EmbeddingHandler()
     
+    # Chuyển file pickle cũ sang store mmap nếu chưa chuyển
+    if not is_store(output_file_path) and os.path.exists(legacy_file_path):
+        convert_pickle(legacy_file_path, output_file_path)
+
     # Kiểm tra xem file embeddings đã tồn tại chưa
-    if os.path.exists(output_file_path):
+    if is_store(output_file_path):
         print("Tải embeddings từ file đã lưu...")
         texts, embeddings, data = handler.load_saved_embeddings(output_file_path)
     else:
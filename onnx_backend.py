@@ -0,0 +1,232 @@
+# onnx_backend.py
+"""Backend ONNX Runtime (có thể lượng tử hóa int8) thay cho PyTorch khi tạo embeddings trên CPU."""
+import json
+import os
+import re
+import time
+import numpy as np
+
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", "onnx_model")
+EMBEDDING_DIM = 768  # Kích thước vector mà VectorStore yêu cầu
+META_FILE = "export_meta.json"
+# Ngưỡng cosine tối thiểu so với PyTorch trước khi chấp nhận backend (theo lượng tử hóa)
+PARITY_THRESHOLDS = {False: 0.99, True: 0.97}
+PARITY_TEXTS = [
+    "Học phí ngành Công nghệ thông tin khóa 20-21 là bao nhiêu?",
+    "Điều kiện xếp loại học lực giỏi là gì?",
+    "Làm thế nào để đổi mật khẩu tài khoản sinh viên?",
+    "Liệt kê các khoa tại ICTU.",
+    "Sinh viên nội trú và ngoại trú khác nhau như thế nào?",
+    "Tổng số tín chỉ của chương trình kỹ sư là bao nhiêu?",
+    "Cách đăng ký học phần trên hệ thống?",
+    "Thời gian xem lịch thi học kỳ 2?",
+]
+
+
+def model_name_of(st_model):
+    """Tên (hoặc đường dẫn) của model transformer trong SentenceTransformer."""
+    return getattr(st_model[0].auto_model.config, "_name_or_path", "") or "model"
+
+
+def export_dir(model_name, opset, root=ONNX_MODEL_DIR):
+    """Thư mục xuất riêng cho từng model và opset, để đổi model không dùng nhầm file cũ."""
+    safe_name = re.sub(r"[^0-9A-Za-z._-]+", "_", model_name).strip("_")
+    return os.path.join(root, f"{safe_name}-opset{opset}")
+
+
+def export_fingerprint(model_name, opset, quantize):
+    """Thông tin xác định một file ONNX, lưu trong META_FILE và kiểm tra khi nạp lại."""
+    return {"model_name": model_name, "opset": opset, "quantization": "dynamic-int8" if quantize else None}
+
+
+def read_meta(output_dir):
+    try:
+        with open(os.path.join(output_dir, META_FILE), encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def write_meta(output_dir, meta):
+    path = os.path.join(output_dir, META_FILE)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def _export_transformer(st_model, model_path, opset):
+    import torch
+
+    transformer = st_model[0].auto_model.eval()
+
+    class _HiddenStates(torch.nn.Module):
+        # Chỉ lấy last_hidden_state, mean pooling được thực hiện bằng NumPy
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, input_ids, attention_mask):
+            return self.model(input_ids=input_ids, attention_mask=attention_mask)[0]
+
+    dummy = st_model.tokenizer(["xin chào ICTU"], return_tensors="pt", padding=True)
+    with torch.no_grad():
+        torch.onnx.export(
+            _HiddenStates(transformer),
+            (dummy["input_ids"], dummy["attention_mask"]),
+            model_path,
+            input_names=["input_ids", "attention_mask"],
+            output_names=["last_hidden_state"],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "sequence"},
+                "attention_mask": {0: "batch", 1: "sequence"},
+                "last_hidden_state": {0: "batch", 1: "sequence"},
+            },
+            opset_version=opset,
+        )
+    st_model.tokenizer.save_pretrained(os.path.dirname(model_path))
+
+
+def _quantize(model_path, quantized_path):
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+    quantize_dynamic(model_path, quantized_path, weight_type=QuantType.QInt8)
+
+
+def export_onnx(st_model, output_dir=None, quantize=False, opset=14, model_name=None):
+    """Xuất transformer của SentenceTransformer sang ONNX, tùy chọn lượng tử hóa động int8.
+
+    File đã xuất chỉ được dùng lại khi fingerprint (model, opset, lượng tử hóa) lưu trong
+    META_FILE trùng khớp; nếu không thì xuất lại và bỏ kết quả kiểm tra parity cũ.
+    """
+    model_name = model_name or model_name_of(st_model)
+    output_dir = output_dir or export_dir(model_name, opset)
+    os.makedirs(output_dir, exist_ok=True)
+    meta = read_meta(output_dir)
+
+    model_path = os.path.join(output_dir, "model.onnx")
+    fingerprint = export_fingerprint(model_name, opset, False)
+    if meta.get("model.onnx", {}).get("fingerprint") != fingerprint or not os.path.exists(model_path):
+        _export_transformer(st_model, model_path, opset)
+        # File int8 được lượng tử hóa từ file cũ, không còn hợp lệ
+        meta = {"model.onnx": {"fingerprint": fingerprint}}
+        write_meta(output_dir, meta)
+        print(f"✅ Đã xuất model ONNX vào {model_path}.")
+
+    if not quantize:
+        return model_path
+
+    quantized_path = os.path.join(output_dir, "model.int8.onnx")
+    fingerprint = export_fingerprint(model_name, opset, True)
+    if meta.get("model.int8.onnx", {}).get("fingerprint") != fingerprint or not os.path.exists(quantized_path):
+        _quantize(model_path, quantized_path)
+        meta["model.int8.onnx"] = {"fingerprint": fingerprint}
+        write_meta(output_dir, meta)
+        print(f"✅ Đã lượng tử hóa int8 vào {quantized_path}.")
+    return quantized_path
+
+
+class OnnxEncoder:
+    """Tạo embeddings bằng ONNX Runtime với cùng mean pooling như SentenceTransformer."""
+
+    def __init__(self, model_path, tokenizer_dir=None, max_seq_length=128, num_threads=None):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.tokenizer = AutoTokenizer.from_pretrained(tokenizer_dir or os.path.dirname(model_path))
+        self.max_seq_length = max_seq_length
+        self.model_path = model_path
+
+    def encode(self, texts, batch_size=32, **kwargs):
+        """Trả về ma trận float32 (n, 768); nhận thêm tham số như model.encode để thay thế trực tiếp."""
+        if isinstance(texts, str):
+            texts = [texts]
+        outputs = []
+        for start in range(0, len(texts), batch_size):
+            encoded = self.tokenizer(
+                list(texts[start:start + batch_size]),
+                padding=True,
+                truncation=True,
+                max_length=self.max_seq_length,
+                return_tensors="np",
+            )
+            attention_mask = encoded["attention_mask"].astype(np.int64)
+            hidden = self.session.run(
+                ["last_hidden_state"],
+                {"input_ids": encoded["input_ids"].astype(np.int64), "attention_mask": attention_mask},
+            )[0]
+            mask = attention_mask[..., None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            outputs.append(pooled.astype(np.float32))
+        embeddings = np.vstack(outputs) if outputs else np.zeros((0, EMBEDDING_DIM), dtype=np.float32)
+        if embeddings.shape[1] != EMBEDDING_DIM:
+            raise ValueError(f"Model ONNX trả về vector {embeddings.shape[1]} chiều, cần {EMBEDDING_DIM} chiều.")
+        return embeddings
+
+
+def load_onnx_encoder(st_model, quantize=False, output_dir=None, opset=14, model_name=None):
+    """Xuất model (nếu chưa có hoặc khác fingerprint) rồi khởi tạo OnnxEncoder.
+
+    Lần đầu dùng một file vừa xuất, embeddings được so với PyTorch trên PARITY_TEXTS và kết quả
+    lưu vào META_FILE; không đạt ngưỡng thì ném ValueError để backend ONNX không được dùng.
+    """
+    model_path = export_onnx(st_model, output_dir, quantize=quantize, opset=opset, model_name=model_name)
+    output_dir = os.path.dirname(model_path)
+    encoder = OnnxEncoder(model_path, output_dir, max_seq_length=st_model.max_seq_length)
+
+    meta = read_meta(output_dir)
+    entry = meta[os.path.basename(model_path)]
+    if "parity" not in entry:
+        passed, stats = check_parity(st_model, encoder, PARITY_TEXTS, threshold=PARITY_THRESHOLDS[quantize])
+        entry["parity"] = dict(stats, passed=passed)
+        write_meta(output_dir, meta)
+    if not entry["parity"]["passed"]:
+        raise ValueError(f"Model ONNX {model_path} lệch so với PyTorch (cosine thấp nhất "
+                         f"{entry['parity']['min']:.5f}), không dùng backend ONNX.")
+    return encoder
+
+
+def cosine_agreement(reference, candidate):
+    """Độ tương đồng cosine theo từng dòng giữa hai ma trận embeddings."""
+    reference = np.asarray(reference, dtype=np.float32)
+    candidate = np.asarray(candidate, dtype=np.float32)
+    dot = (reference * candidate).sum(axis=1)
+    norms = np.linalg.norm(reference, axis=1) * np.linalg.norm(candidate, axis=1)
+    return dot / np.clip(norms, 1e-12, None)
+
+
+def check_parity(st_model, encoder, texts, threshold=0.99):
+    """So sánh embeddings ONNX với PyTorch; trả về (đạt ngưỡng, thống kê cosine)."""
+    reference = st_model.encode(texts, convert_to_tensor=False)
+    cosines = cosine_agreement(reference, encoder.encode(texts))
+    stats = {"mean": float(cosines.mean()), "min": float(cosines.min())}
+    passed = stats["min"] >= threshold
+    status = "✅" if passed else "❌"
+    print(f"{status} Parity {os.path.basename(encoder.model_path)}: cosine trung bình {stats['mean']:.5f}, thấp nhất {stats['min']:.5f}.")
+    return passed, stats
+
+
+def benchmark(encoders, texts, repeats=5):
+    """Đo thời gian encode (ms/câu) cho từng backend, ví dụ {'torch': model, 'onnx': encoder}."""
+    results = {}
+    for name, encoder in encoders.items():
+        encoder.encode(texts[:1])  # Khởi động
+        started = time.perf_counter()
+        for _ in range(repeats):
+            encoder.encode(texts)
+        elapsed = time.perf_counter() - started
+        results[name] = elapsed * 1000 / (repeats * len(texts))
+        print(f"⏱️ {name}: {results[name]:.2f} ms/câu")
+    return results
+
+
+if __name__ == "__main__":
+    from embeddings import get_shared_model
+
+    torch_model = get_shared_model()
+    onnx_encoder = load_onnx_encoder(torch_model)
+    int8_encoder = load_onnx_encoder(torch_model, quantize=True)
+    benchmark({"torch": torch_model, "onnx": onnx_encoder, "onnx-int8": int8_encoder}, PARITY_TEXTS)
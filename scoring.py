@@ -0,0 +1,90 @@
+# scoring.py
+"""Trạng thái chấm điểm kết quả tìm kiếm của ChatBotAgent.
+
+Mỗi câu hỏi nhận một ScoringContext riêng (ảnh chụp độ ưu tiên các chủ đề), nên một
+ChatBotAgent dùng chung được cho nhiều luồng. Việc tăng độ ưu tiên theo các câu hỏi trước
+chỉ diễn ra trong phạm vi một phiên (session_id); câu hỏi không có phiên luôn dùng độ ưu
+tiên mặc định nên kết quả không phụ thuộc người hỏi trước.
+"""
+from collections import OrderedDict, namedtuple
+import threading
+
+# Độ ưu tiên mặc định cho các chủ đề
+DEFAULT_PRIORITY_WEIGHTS = {
+    "khoa": 5,
+    "ngành học": 5,
+    "học phí": 5,
+    "xếp loại học lực": 2,
+    "xếp hạng học lực": 2,
+    "đăng nhập": 1,
+    "đổi mật khẩu": 1,
+    "đăng ký học": 1,
+    "thanh toán học phí": 1,
+    "hoạt động ngoại khóa": 1,
+    "xem lịch thi": 1,
+    "tra cứu điểm": 1,
+    "hủy học phần": 1,
+    "gửi tin nhắn": 1,
+    "tổng số tín chỉ": 2,
+}
+# Reset max_priority sau số câu hỏi này để tránh độ ưu tiên tăng quá cao
+PRIORITY_RESET_INTERVAL = 10
+
+# Trạng thái chấm điểm của một câu hỏi, chỉ đọc sau khi tạo
+ScoringContext = namedtuple("ScoringContext", ["priority_weights", "max_priority"])
+
+
+class SessionScoringState:
+    """Độ ưu tiên thích ứng của một phiên: chủ đề được hỏi nhiều được tăng độ ưu tiên."""
+
+    def __init__(self, priority_weights=None):
+        self.priority_weights = dict(priority_weights or DEFAULT_PRIORITY_WEIGHTS)
+        # Độ ưu tiên cao nhất từ các câu hỏi trước
+        self.max_priority = 0
+        self.query_count = 0
+        self._lock = threading.Lock()
+
+    def begin_request(self, boosts):
+        """Áp dụng các mức tăng (chủ đề, mức tăng) của câu hỏi mới và trả về ScoringContext."""
+        with self._lock:
+            self.query_count += 1
+            if self.query_count > PRIORITY_RESET_INTERVAL:
+                self.max_priority = 0
+                self.query_count = 0
+            for topics, increment in boosts:
+                boosted = {
+                    topic: max(self.priority_weights[topic] + increment, self.max_priority)
+                    for topic in topics
+                }
+                self.priority_weights.update(boosted)
+                self.max_priority = max(self.max_priority, *boosted.values())
+            return ScoringContext(dict(self.priority_weights), self.max_priority)
+
+
+class ScoringSessions:
+    """Các SessionScoringState theo session_id, giữ tối đa max_sessions phiên gần nhất."""
+
+    def __init__(self, max_sessions=1024):
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id):
+        with self._lock:
+            state = self._sessions.get(session_id)
+            if state is None:
+                state = self._sessions[session_id] = SessionScoringState()
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+            else:
+                self._sessions.move_to_end(session_id)
+            return state
+
+    def discard(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def context_for(self, session_id, boosts):
+        """ScoringContext của một câu hỏi; không có phiên thì dùng trạng thái mới, không lưu lại."""
+        state = SessionScoringState() if session_id is None else self.get(session_id)
+        return state.begin_request(boosts)
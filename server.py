@@ -0,0 +1,207 @@
+# server.py
+"""Phục vụ ChatBotAgent qua HTTP (thư viện chuẩn, không cần framework).
+
+Một tiến trình dùng chung một ChatBotAgent (một model, một Qdrant client) cho mọi luồng:
+    GET  /healthz  tiến trình còn sống
+    GET  /readyz   agent và model đã sẵn sàng (503 nếu chưa)
+    GET  /stats    số yêu cầu đang xử lý, thống kê cache
+    POST /ask      {"question": "...", "session_id": "...", "top_k": 5} -> {"answer": "...", ...}
+                   (top_k từ 1 đến 50, session_id là chuỗi; sai định dạng trả về 400)
+
+Số câu hỏi xử lý đồng thời bị giới hạn (MAX_CONCURRENT_REQUESTS); khi đầy trả về 503 kèm
+Retry-After thay vì xếp hàng vô hạn. Câu hỏi quá REQUEST_TIMEOUT giây trả về 504; agent
+gặp lỗi khi tìm kiếm hoặc gọi LLM trả về 500.
+"""
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import os
+import threading
+import time
+
+SERVER_HOST = os.getenv("SERVER_HOST", "127.0.0.1")
+SERVER_PORT = int(os.getenv("SERVER_PORT", "8000"))
+MAX_CONCURRENT_REQUESTS = int(os.getenv("MAX_CONCURRENT_REQUESTS", "8"))
+REQUEST_TIMEOUT = float(os.getenv("REQUEST_TIMEOUT", "60"))
+MAX_BODY_BYTES = 64 * 1024
+MAX_TOP_K = 50
+# ChatBotAgent.run trả lỗi (tìm kiếm, LLM) dưới dạng chuỗi bắt đầu bằng ký hiệu này
+AGENT_ERROR_PREFIX = "❌"
+
+
+def parse_ask_request(body):
+    """Kiểm tra nội dung POST /ask; trả về (question, session_id, top_k) hoặc ValueError kèm lý do."""
+    if not isinstance(body, dict):
+        raise ValueError("Nội dung yêu cầu phải là một đối tượng JSON.")
+    question = body.get("question", "")
+    if not isinstance(question, str) or not question.strip():
+        raise ValueError("Vui lòng nhập câu hỏi.")
+    session_id = body.get("session_id")
+    if session_id is not None and not isinstance(session_id, str):
+        raise ValueError("session_id phải là chuỗi.")
+    top_k = body.get("top_k", 5)
+    # bool là lớp con của int nên phải loại riêng
+    if isinstance(top_k, bool) or not isinstance(top_k, int) or not 1 <= top_k <= MAX_TOP_K:
+        raise ValueError(f"top_k phải là số nguyên từ 1 đến {MAX_TOP_K}.")
+    return question.strip(), session_id, top_k
+
+
+class ChatService:
+    """Giữ ChatBotAgent dùng chung, giới hạn số câu hỏi đồng thời và thời gian mỗi câu hỏi."""
+
+    def __init__(self, agent_factory, max_concurrency=MAX_CONCURRENT_REQUESTS, request_timeout=REQUEST_TIMEOUT):
+        self.agent_factory = agent_factory
+        self.max_concurrency = max_concurrency
+        self.request_timeout = request_timeout
+        self.agent = None
+        self.startup_error = None
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="chat-worker")
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.completed = 0  # Chỉ các câu hỏi trả lời thành công
+        self.failed = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    def start(self):
+        """Khởi tạo agent trong luồng nền; /readyz trả về 503 cho đến khi xong."""
+        thread = threading.Thread(target=self._load, name="chat-service-startup", daemon=True)
+        thread.start()
+        return thread
+
+    def _load(self):
+        try:
+            agent = self.agent_factory()
+            # Các câu hỏi đồng thời được gom batch khi encode bằng model dùng chung
+            agent.embedding_handler.enable_batching()
+            agent.embedding_handler.wait_until_ready()
+            self.agent = agent
+            print("✅ ChatBotAgent đã sẵn sàng phục vụ.")
+        except Exception as e:
+            self.startup_error = str(e)
+            print(f"❌ Lỗi khi khởi tạo ChatBotAgent: {e}")
+
+    @property
+    def ready(self):
+        return self.agent is not None and self.agent.embedding_handler.wait_until_ready(0)
+
+    def _release(self, _future):
+        with self._lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+    def ask(self, question, session_id=None, top_k=5):
+        """Trả về (mã HTTP, nội dung JSON) cho một câu hỏi."""
+        if not self.ready:
+            return 503, {"error": "Dịch vụ đang khởi động.", "detail": self.startup_error}
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            return 503, {"error": "Máy chủ đang quá tải, vui lòng thử lại sau."}
+        with self._lock:
+            self.in_flight += 1
+        started = time.perf_counter()
+        # Chỗ trống chỉ được trả lại khi câu hỏi chạy xong thật sự (kể cả sau khi đã timeout),
+        # để số luồng đang chạy không vượt max_concurrency
+        future = self._executor.submit(self.agent.run, question, top_k, session_id)
+        future.add_done_callback(self._release)
+        try:
+            answer = future.result(timeout=self.request_timeout)
+        except FutureTimeoutError:
+            with self._lock:
+                self.timed_out += 1
+            return 504, {"error": f"Quá thời gian xử lý ({self.request_timeout:g}s)."}
+        except Exception as e:
+            with self._lock:
+                self.failed += 1
+            return 500, {"error": f"Lỗi khi xử lý câu hỏi: {e}"}
+        answer = str(answer)
+        if answer.startswith(AGENT_ERROR_PREFIX):
+            with self._lock:
+                self.failed += 1
+            return 500, {"error": answer}
+        with self._lock:
+            self.completed += 1
+        return 200, {"answer": answer, "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)}
+
+    def stats(self):
+        with self._lock:
+            stats = {"in_flight": self.in_flight, "completed": self.completed, "failed": self.failed,
+                     "rejected": self.rejected,
+                     "timed_out": self.timed_out, "max_concurrency": self.max_concurrency}
+        if self.agent is not None:
+            stats["cache"] = self.agent.cache_stats()
+        return stats
+
+
+class ChatRequestHandler(BaseHTTPRequestHandler):
+    service = None  # Gán bởi make_server
+
+    def _send_json(self, status, body, headers=None):
+        data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == "/healthz":
+            self._send_json(200, {"status": "ok"})
+        elif self.path == "/readyz":
+            ready = self.service.ready
+            self._send_json(200 if ready else 503, {"ready": ready, "detail": self.service.startup_error})
+        elif self.path == "/stats":
+            self._send_json(200, self.service.stats())
+        else:
+            self._send_json(404, {"error": "Không tìm thấy đường dẫn."})
+
+    def do_POST(self):
+        if self.path != "/ask":
+            self._send_json(404, {"error": "Không tìm thấy đường dẫn."})
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        if length <= 0 or length > MAX_BODY_BYTES:
+            self._send_json(400, {"error": "Nội dung yêu cầu rỗng hoặc quá lớn."})
+            return
+        try:
+            body = json.loads(self.rfile.read(length).decode('utf-8'))
+        except ValueError:
+            self._send_json(400, {"error": "Nội dung yêu cầu không đúng định dạng JSON."})
+            return
+        try:
+            question, session_id, top_k = parse_ask_request(body)
+        except ValueError as e:
+            self._send_json(400, {"error": str(e)})
+            return
+        status, response = self.service.ask(question, session_id, top_k)
+        self._send_json(status, response, {"Retry-After": "1"} if status == 503 else None)
+
+    def log_message(self, format, *args):
+        print(f"🌐 {self.address_string()} {format % args}")
+
+
+def make_server(service, host=SERVER_HOST, port=SERVER_PORT):
+    handler = type("BoundChatRequestHandler", (ChatRequestHandler,), {"service": service})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+if __name__ == "__main__":
+    from agents import ChatBotAgent
+
+    service = ChatService(ChatBotAgent)
+    service.start()
+    server = make_server(service)
+    print(f"🚀 Phục vụ ChatBotAgent tại http://{SERVER_HOST}:{SERVER_PORT} "
+          f"(tối đa {MAX_CONCURRENT_REQUESTS} câu hỏi đồng thời, timeout {REQUEST_TIMEOUT:g}s)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n👋 Dừng máy chủ.")
+    finally:
+        server.server_close()
@@ -0,0 +1,147 @@
+# sparse_index.py
+"""Chỉ mục BM25 cho tìm kiếm từ khóa (sparse) và hàm gộp điểm Reciprocal Rank Fusion.
+
+Tách từ cho tiếng Việt: mỗi âm tiết là một token, thêm bigram âm tiết (ví dụ "học_phí")
+để bắt từ ghép, và bản không dấu của token để khớp câu hỏi gõ không dấu.
+"""
+import math
+import pickle
+import re
+import unicodedata
+import zlib
+from collections import Counter
+import numpy as np
+
+SPARSE_VECTOR_NAME = "bm25"
+RRF_K = 60
+
+_TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+
+def strip_diacritics(text):
+    """Bỏ dấu tiếng Việt: 'học phí' -> 'hoc phi'."""
+    text = unicodedata.normalize("NFD", text.replace("đ", "d").replace("Đ", "D"))
+    return "".join(ch for ch in text if unicodedata.category(ch) != "Mn")
+
+
+def tokenize(text, bigrams=True, fold_diacritics=True):
+    """Tách văn bản thành các token âm tiết, bigram âm tiết và bản không dấu."""
+    syllables = _TOKEN_PATTERN.findall(unicodedata.normalize("NFC", text).lower())
+    tokens = list(syllables)
+    if bigrams:
+        tokens.extend(f"{a}_{b}" for a, b in zip(syllables, syllables[1:]))
+    if fold_diacritics:
+        seen = set(tokens)
+        tokens.extend(folded for folded in map(strip_diacritics, list(tokens)) if folded not in seen)
+    return tokens
+
+
+def token_id(token):
+    """ID ổn định của token (không cần lưu từ điển), dùng làm chỉ số của sparse vector."""
+    return zlib.crc32(token.encode("utf-8")) & 0x7FFFFFFF
+
+
+class BM25Index:
+    """Chỉ mục BM25 dạng inverted index: token_id -> (các dòng, trọng số tf đã chuẩn hóa)."""
+
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.doc_count = 0
+        self.avgdl = 1.0
+        self.postings = {}
+        self.idf = {}
+
+    @classmethod
+    def build(cls, texts, k1=1.5, b=0.75):
+        index = cls(k1, b)
+        docs = [Counter(token_id(token) for token in tokenize(text)) for text in texts]
+        index.doc_count = len(docs)
+        index.avgdl = (sum(sum(doc.values()) for doc in docs) / len(docs)) if docs else 1.0
+        postings = {}
+        for row, doc in enumerate(docs):
+            for tid, weight in index._tf_weights(doc).items():
+                postings.setdefault(tid, ([], []))
+                postings[tid][0].append(row)
+                postings[tid][1].append(weight)
+        index.postings = {
+            tid: (np.asarray(rows, dtype=np.int64), np.asarray(weights, dtype=np.float32))
+            for tid, (rows, weights) in postings.items()
+        }
+        index.idf = {
+            tid: math.log(1 + (index.doc_count - len(rows) + 0.5) / (len(rows) + 0.5))
+            for tid, (rows, _) in index.postings.items()
+        }
+        return index
+
+    def _tf_weights(self, counts):
+        # Phần tf của BM25, đã chuẩn hóa theo độ dài văn bản
+        length = sum(counts.values())
+        norm = self.k1 * (1 - self.b + self.b * length / self.avgdl)
+        return {tid: tf * (self.k1 + 1) / (tf + norm) for tid, tf in counts.items()}
+
+    def params_key(self):
+        """Khóa của các tham số quyết định trọng số doc_vector (k1, b, avgdl). Thêm/xóa văn bản
+        làm avgdl đổi nên sparse vector đã lưu với khóa khác cần được tính lại."""
+        return f"{self.k1:g}:{self.b:g}:{self.avgdl:.6f}"
+
+    def doc_vector(self, text):
+        """Sparse vector (indices, values) của văn bản để lưu vào Qdrant (IDF do server tính)."""
+        weights = self._tf_weights(Counter(token_id(token) for token in tokenize(text)))
+        return list(weights.keys()), [float(value) for value in weights.values()]
+
+    @staticmethod
+    def query_vector(text):
+        """Sparse vector của câu hỏi: mỗi token xuất hiện có trọng số 1."""
+        indices = sorted({token_id(token) for token in tokenize(text)})
+        return indices, [1.0] * len(indices)
+
+    def search(self, query_text, top_k=10):
+        """Trả về (các dòng, điểm BM25) của top_k văn bản khớp nhất."""
+        scores = np.zeros(self.doc_count, dtype=np.float32)
+        for tid in self.query_vector(query_text)[0]:
+            posting = self.postings.get(tid)
+            if posting is not None:
+                np.add.at(scores, posting[0], posting[1] * self.idf[tid])
+        matched = np.flatnonzero(scores)
+        if len(matched) == 0:
+            return [], []
+        k = min(top_k, len(matched))
+        best = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+        best = best[np.argsort(-scores[best])]
+        return best.tolist(), scores[best].tolist()
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            pickle.dump(self, f)
+
+    @staticmethod
+    def load(path):
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+
+
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    """Gộp nhiều danh sách xếp hạng bằng RRF.
+
+    Trả về danh sách (key, score) đã sắp xếp, score được chuẩn hóa bằng normalize_fused_scores.
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking, start=1):
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+    fused = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+    return list(zip([key for key, _ in fused], normalize_fused_scores([score for _, score in fused])))
+
+
+def normalize_fused_scores(scores):
+    """Chia điểm RRF cho điểm cao nhất để nằm trong (0, 1], cùng thang với cosine khi
+    search_data cộng điểm từ khóa để xếp hạng.
+
+    Đoạn đầu luôn được 1.0 dù có liên quan hay không, nên không dùng điểm này để lọc theo
+    ngưỡng; kết quả tìm kiếm kết hợp mang thêm dense_score (cosine thật) cho việc đó.
+    """
+    if not scores:
+        return []
+    top = max(scores) or 1.0
+    return [score / top for score in scores]
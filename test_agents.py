@@ -0,0 +1,201 @@
+import asyncio
+import contextlib
+import io
+import re
+import zlib
+
+import numpy as np
+import pytest
+
+fake_chat_models = pytest.importorskip("langchain_core.language_models.fake_chat_models")
+chat_models = pytest.importorskip("langchain_core.language_models.chat_models")
+
+import agents
+from agents import ChatBotAgent
+from text_features import MAJORS
+from answer_cache import SemanticAnswerCache
+from embeddings import EmbeddingHandler
+from vector_store import LocalVectorStore
+
+RECORDS = [
+    {"regulation": "Điều 1", "content": "Ký túc xá của trường nằm ở khu A, sinh viên đăng ký tại phòng công tác sinh viên."},
+    {"regulation": "Điều 2", "content": "Học phí được đóng theo từng học kỳ trước khi đăng ký học phần."},
+    {"regulation": "Điều 3", "content": "Sinh viên bị cảnh báo học tập khi điểm trung bình học kỳ dưới 1,0."},
+]
+
+
+class _HashEncoder:
+    """Encoder giả: tổng các vector ngẫu nhiên cố định của từng từ (không cần tải model)."""
+
+    dim = 64
+
+    def encode(self, texts, convert_to_tensor=False, **kwargs):
+        embeddings = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in re.findall(r"\w+", text.lower()):
+                embeddings[row] += np.random.default_rng(zlib.crc32(word.encode("utf-8"))).standard_normal(self.dim)
+        return embeddings
+
+
+class _HashEmbeddingHandler(EmbeddingHandler):
+    encoder = _HashEncoder()
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(cache_size=0)
+
+    @property
+    def model(self):
+        return self.encoder
+
+
+def _make_agent(monkeypatch, llm, answer_cache=None):
+    """ChatBotAgent trên LocalVectorStore gồm RECORDS, với encoder băm và LLM giả."""
+    monkeypatch.setattr(agents, "EmbeddingHandler", _HashEmbeddingHandler)
+    monkeypatch.setattr(agents, "get_llm", lambda: llm)
+    handler = _HashEmbeddingHandler()
+    texts = [f"{item['regulation']}\n{item['content']}" for item in RECORDS]
+    with contextlib.redirect_stdout(io.StringIO()):
+        store = LocalVectorStore(vector_size=_HashEncoder.dim)
+        store.upsert_vectors(texts, np.asarray(handler.generate_embeddings(texts)), RECORDS)
+        agent = ChatBotAgent(vector_store=store)
+    if answer_cache is not None:
+        agent.answer_cache = answer_cache
+    return agent
+
+
+def _fake_llm(responses):
+    return fake_chat_models.FakeListChatModel(responses=responses)
+
+
+def _quiet(fn, *args, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return fn(*args, **kwargs)
+
+
+def test_arun_returns_same_answer_as_run(monkeypatch):
+    responses = ["Final Answer: Ký túc xá ở khu A."]
+    query = "Ký túc xá ở đâu?"
+
+    expected = _quiet(_make_agent(monkeypatch, _fake_llm(responses)).run, query)
+    actual = _quiet(asyncio.run, _make_agent(monkeypatch, _fake_llm(responses)).arun(query))
+
+    assert "Ký túc xá ở khu A" in expected
+    assert actual == expected
+
+
+def test_not_found_answers_are_not_cached(monkeypatch):
+    agent = _make_agent(monkeypatch, _fake_llm(["Final Answer: Không tìm thấy thông tin trong sổ tay."]),
+                        answer_cache=SemanticAnswerCache(threshold=0.5, ttl=0))
+
+    answer = _quiet(agent.run, "Ký túc xá ở đâu?")
+
+    assert "Không tìm thấy thông tin" in answer
+    assert agent.answer_cache.stats()["entries"] == 0
+
+
+def test_run_stream_emits_retrieval_tokens_and_full_answer(monkeypatch):
+    agent = _make_agent(monkeypatch, _fake_llm(["Ký túc xá ở khu A."]))
+
+    events = _quiet(list, agent.run_stream("Ký túc xá ở đâu?"))
+
+    assert events[0]["type"] == "retrieval" and events[0]["results"]
+    tokens = [event["text"] for event in events[1:-1]]
+    assert all(event["type"] == "token" for event in events[1:-1]) and len(tokens) > 1
+    assert events[-1] == {"type": "done", "answer": "".join(tokens)}
+    assert "".join(tokens) == "Ký túc xá ở khu A."
+
+
+def test_run_stream_records_answer_in_session_history(monkeypatch):
+    agent = _make_agent(monkeypatch, _fake_llm(["Ký túc xá ở khu A."]))
+
+    _quiet(list, agent.run_stream("Ký túc xá ở đâu?", session_id="s1"))
+
+    assert agent.chat_history.get("s1") == [("Ký túc xá ở đâu?", "Ký túc xá ở khu A.")]
+    assert agent.chat_history.get("s2") == []
+
+
+def test_stream_prompt_uses_crewai_role_and_task_prompt(monkeypatch):
+    agent = _make_agent(monkeypatch, _fake_llm(["Ký túc xá ở khu A."]))
+    search_results, _ = _quiet(agent.search_data, "Ký túc xá ở đâu?", 5)
+    task = _quiet(agent.build_task, "Ký túc xá ở đâu?", search_results)
+
+    prompt = agent.stream_prompt(task)
+
+    assert f"You are {task.agent.role}. {task.agent.backstory}" in prompt
+    assert prompt.endswith(task.prompt())
+    assert "Final Answer" not in prompt
+
+
+def test_topic_filtered_candidates_are_topped_up_to_top_k(monkeypatch):
+    agent = _make_agent(monkeypatch, _fake_llm([]))
+    query = "Học phí đóng khi nào?"
+    query_embedding = agent.embedding_handler.encode_query(query)
+    assert agent.query_topics(query)[1]
+
+    _, candidates = _quiet(agent.retrieve_candidates, query, query_embedding, 3)
+    _, async_candidates = _quiet(asyncio.run, agent.aretrieve_candidates(query, query_embedding, 3))
+
+    assert len(candidates) == 3 and len({result.id for result in candidates}) == 3
+    assert candidates[0].payload["metadata"]["regulation"] == "Điều 2"
+    assert [result.id for result in async_candidates] == [result.id for result in candidates]
+
+
+def test_fast_answer_lists_majors_and_tuition_without_retrieval(monkeypatch):
+    agent = _make_agent(monkeypatch, _fake_llm([]))
+
+    def no_search(*args, **kwargs):
+        raise AssertionError("không được tìm kiếm")
+
+    monkeypatch.setattr(agent.vector_store, "search", no_search)
+    majors = _quiet(agent.run, "Liệt kê các ngành học")
+    tuition = _quiet(agent.run, f"Học phí ngành {MAJORS[0]} là bao nhiêu?")
+
+    assert majors.splitlines() == ["Danh sách các ngành học tại ICTU:"] + [f"- {major}" for major in MAJORS]
+    assert tuition.startswith(f"Ngành {MAJORS[0]}") and "đồng/tín chỉ" in tuition
+
+
+def test_fast_answer_lists_every_major_and_records_history(monkeypatch):
+    agent = _make_agent(monkeypatch, _fake_llm([]))
+
+    answer = _quiet(agent.run, "Trường có những ngành nào?", session_id="s1")
+
+    assert answer.splitlines()[1:] == [f"- {major}" for major in MAJORS]
+    assert agent.chat_history.get("s1") == [("Trường có những ngành nào?", answer)]
+
+
+def test_fast_answer_misses_handbook_questions(monkeypatch):
+    agent = _make_agent(monkeypatch, _fake_llm([]))
+
+    assert agent.fast_answer("Ký túc xá ở đâu?") is None
+    assert agent.fast_answer("Ngành nào có học phí thấp nhất?") is None
+
+
+class _EchoChatModel(chat_models.SimpleChatModel):
+    """Trả lời bằng câu hỏi có trong prompt; ném lỗi với câu hỏi chứa "hỏng"."""
+
+    queries: list
+
+    @property
+    def _llm_type(self):
+        return "echo"
+
+    def _call(self, messages, stop=None, run_manager=None, **kwargs):
+        prompt = "\n".join(str(message.content) for message in messages)
+        query = next(query for query in self.queries if query in prompt)
+        if "hỏng" in query:
+            raise RuntimeError("LLM hỏng")
+        return f"Final Answer: trả lời {query}"
+
+
+def test_run_batch_keeps_input_order_and_isolates_failures(monkeypatch):
+    queries = ["Ký túc xá ở đâu?", "Học phí hỏng ở đâu?", "Điểm trung bình học kỳ bao nhiêu thì bị cảnh báo?",
+               "Liệt kê các ngành học"]
+    agent = _make_agent(monkeypatch, _EchoChatModel(queries=queries))
+
+    results = _quiet(agent.run_batch, queries, max_workers=3)
+
+    assert [result["query"] for result in results] == queries
+    assert results[0] == {"query": queries[0], "answer": f"trả lời {queries[0]}", "error": None}
+    assert results[1]["answer"] is None and "LLM hỏng" in results[1]["error"]
+    assert results[2]["answer"] == f"trả lời {queries[2]}" and results[2]["error"] is None
+    assert results[3]["answer"].startswith("Danh sách các ngành học tại ICTU")
@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from ann_index import IVFIndex
+from embedding_store import embeddings_fingerprint
+
+
+def _vectors(n=200, dim=16, seed=0):
+    return np.random.default_rng(seed).standard_normal((n, dim)).astype(np.float32)
+
+
+def test_ivf_search_with_all_probes_matches_exact_search():
+    vectors = _vectors()
+    index = IVFIndex.build(vectors, nlist=8, nprobe=8)
+    query = vectors[17]
+
+    ids, scores = index.search(query, top_k=5)
+    exact = np.argsort(-(vectors / np.linalg.norm(vectors, axis=1, keepdims=True)) @ (query / np.linalg.norm(query)))
+
+    assert ids == exact[:5].tolist()
+    assert scores == sorted(scores, reverse=True)
+
+
+def test_ivf_load_checks_count_and_fingerprint(tmp_path):
+    vectors = _vectors()
+    fingerprint = embeddings_fingerprint(vectors)
+    IVFIndex.build(vectors, nlist=4, fingerprint=fingerprint).save(str(tmp_path))
+
+    index = IVFIndex.load(str(tmp_path), count=len(vectors), fingerprint=fingerprint)
+    assert len(index) == len(vectors)
+    assert index.fingerprint == fingerprint
+
+    with pytest.raises(ValueError):
+        IVFIndex.load(str(tmp_path), count=len(vectors) + 1)
+    with pytest.raises(ValueError):
+        IVFIndex.load(str(tmp_path), fingerprint=embeddings_fingerprint(_vectors(seed=1)))
+
+
+def test_ivf_scores_are_exact_cosine_by_id():
+    vectors = _vectors()
+    index = IVFIndex.build(vectors, nlist=8, nprobe=1)
+    query = vectors[3]
+    ids = [0, 42, 199]
+
+    expected = (vectors[ids] / np.linalg.norm(vectors[ids], axis=1, keepdims=True)) @ (query / np.linalg.norm(query))
+    np.testing.assert_allclose(index.scores(query, ids), expected, rtol=1e-5)
@@ -0,0 +1,82 @@
+import numpy as np
+
+import answer_cache
+from answer_cache import SemanticAnswerCache
+
+
+def _unit(*values):
+    return np.asarray(values, dtype=np.float32)
+
+
+def test_get_returns_closest_answer_above_threshold_with_same_guard():
+    cache = SemanticAnswerCache(threshold=0.9, ttl=0)
+    cache.put("học phí CNTT", _unit(1, 0, 0), "A", ["c1"], guard="cntt")
+
+    hit = cache.get(_unit(1, 0.1, 0), guard="cntt")
+    assert hit.answer == "A" and hit.similarity > 0.9
+    assert cache.get(_unit(1, 0.1, 0), guard="kế toán") is None
+    assert cache.get(_unit(0, 1, 0), guard="cntt") is None
+
+
+def test_lru_evicts_least_recently_used_entry():
+    cache = SemanticAnswerCache(threshold=0.99, max_entries=2, ttl=0)
+    cache.put("a", _unit(1, 0, 0), "A")
+    cache.put("b", _unit(0, 1, 0), "B")
+    cache.get(_unit(1, 0, 0))
+    cache.put("c", _unit(0, 0, 1), "C")
+
+    assert cache.get(_unit(0, 1, 0)) is None
+    assert cache.get(_unit(1, 0, 0)).answer == "A"
+    assert cache.stats()["evictions"] == 1
+
+
+def test_ttl_expires_entries(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(answer_cache.time, "monotonic", lambda: now[0])
+    cache = SemanticAnswerCache(threshold=0.9, ttl=10)
+    cache.put("a", _unit(1, 0), "A")
+
+    now[0] += 5
+    assert cache.get(_unit(1, 0)) is not None
+    now[0] += 6
+    assert cache.get(_unit(1, 0)) is None
+    assert cache.stats()["expirations"] == 1
+
+
+def test_set_version_removes_only_answers_using_changed_chunks():
+    cache = SemanticAnswerCache(threshold=0.99, ttl=0)
+    cache.put("a", _unit(1, 0), "A", ["c1"], version="v1")
+    cache.put("b", _unit(0, 1), "B", ["c2"], version="v1")
+
+    cache.set_version("v2", ["c1"], previous="v1")
+
+    assert cache.get(_unit(1, 0), version="v2") is None
+    assert cache.get(_unit(0, 1), version="v2").answer == "B"
+
+
+def test_set_version_clears_everything_when_new_chunks_were_added():
+    cache = SemanticAnswerCache(threshold=0.99, ttl=0)
+    cache.put("a", _unit(1, 0), "A", ["c1"], version="v1")
+    cache.put("b", _unit(0, 1), "B", ["c2"], version="v1")
+
+    cache.set_version("v2", ["c3"], previous="v1", added_ids=["c3"])
+
+    assert cache.get(_unit(1, 0), version="v2") is None
+    assert cache.get(_unit(0, 1), version="v2") is None
+
+
+def test_set_version_clears_everything_without_known_changes():
+    cache = SemanticAnswerCache(threshold=0.99, ttl=0)
+    cache.put("b", _unit(0, 1), "B", ["c2"], version="v1")
+
+    cache.set_version("v3", ["c1"], previous="v2")
+
+    assert cache.get(_unit(0, 1), version="v3") is None
+
+
+def test_disabled_cache_stores_and_returns_nothing():
+    cache = SemanticAnswerCache(threshold=0.5, ttl=0, enabled=False)
+    cache.put("a", _unit(1, 0), "A")
+
+    assert cache.get(_unit(1, 0)) is None
+    assert cache.stats()["entries"] == 0 and cache.stats()["misses"] == 0
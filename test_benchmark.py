@@ -0,0 +1,39 @@
+import json
+
+import numpy as np
+import pytest
+
+pytest.importorskip("langchain_core.language_models.chat_models")
+
+import benchmark
+
+
+def test_summarize_reports_percentiles_and_throughput():
+    summary = benchmark.summarize([10.0] * 99 + [1000.0])
+
+    assert summary["count"] == 100 and summary["max_ms"] == 1000.0
+    assert summary["p50_ms"] == summary["p95_ms"] == 10.0 < summary["p99_ms"]
+    assert summary["throughput_per_s"] == pytest.approx(100 / 1.99)
+
+
+def test_hash_encoder_is_deterministic_and_token_based():
+    encoder = benchmark.HashEncoder(dim=16)
+
+    first, same, other = encoder.encode(["học phí ngành", "học phí ngành", "ký túc xá"])
+
+    np.testing.assert_array_equal(first, same)
+    np.testing.assert_array_equal(benchmark.HashEncoder(dim=16).encode(["học phí ngành"])[0], first)
+    assert not np.allclose(first, other)
+
+
+def test_benchmark_reports_every_stage(tmp_path):
+    output_path = tmp_path / "benchmark.json"
+
+    report = benchmark.main(["--sizes", "30", "--top-k", "3", "--queries", "4", "--llm-latency-ms", "0",
+                             "--llm-tokens", "3", "--output", str(output_path)])
+
+    assert [(row["corpus_size"], row["top_k"], row["stage"]) for row in report["results"]] == \
+        [(30, 3, stage) for stage in benchmark.STAGES]
+    assert all(row["count"] == 4 and row["p50_ms"] <= row["p99_ms"] for row in report["results"])
+    assert report["ingest"][0]["corpus_size"] == 30
+    assert json.loads(output_path.read_text(encoding="utf-8"))["results"] == report["results"]
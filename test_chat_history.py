@@ -0,0 +1,93 @@
+import threading
+import time
+
+import pytest
+
+from chat_history import ChatHistoryStore, SqliteChatHistoryStore
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_store(request, tmp_path):
+    stores = []
+
+    def make(**kwargs):
+        if request.param == "memory":
+            store = ChatHistoryStore(**kwargs)
+        else:
+            store = SqliteChatHistoryStore(str(tmp_path / "history.db"), **kwargs)
+        stores.append(store)
+        return store
+
+    yield make
+    for store in stores:
+        if hasattr(store, "close"):
+            store.close()
+
+
+def test_round_trip_keeps_turn_order(make_store):
+    store = make_store()
+    store.append("s1", "Học phí?", "500.000 đồng")
+    store.append("s1", "Ký túc xá?", "Khu A")
+
+    assert store.get("s1") == [("Học phí?", "500.000 đồng"), ("Ký túc xá?", "Khu A")]
+    assert store.get("khác") == []
+
+
+def test_sessions_are_isolated(make_store):
+    store = make_store()
+    store.append("s1", "q1", "a1")
+    store.append("s2", "q2", "a2")
+    store.append(None, "q3", "a3")
+
+    store.clear("s1")
+
+    assert store.get("s1") == []
+    assert store.get("s2") == [("q2", "a2")]
+    assert store.get(None) == [("q3", "a3")]
+    assert len(store) == 2
+
+
+def test_only_last_max_turns_are_kept(make_store):
+    store = make_store(max_turns=3)
+    for i in range(5):
+        store.append("s1", f"q{i}", f"a{i}")
+    store.append("s2", "q", "a")
+
+    assert store.get("s1") == [("q2", "a2"), ("q3", "a3"), ("q4", "a4")]
+    assert store.stats()["turns"] == 4
+
+
+def test_idle_sessions_are_evicted(make_store):
+    store = make_store(idle_ttl=0)
+    store.append("s1", "q", "a")
+    time.sleep(0.01)
+
+    store.evict_idle()
+
+    assert store.get("s1") == []
+    assert store.stats()["evicted_sessions"] == 1
+
+
+def test_sqlite_concurrent_appends_keep_every_turn(tmp_path):
+    store = SqliteChatHistoryStore(str(tmp_path / "history.db"), max_turns=100)
+    errors = []
+
+    def worker(thread):
+        try:
+            for i in range(25):
+                store.append(f"s{thread % 2}", f"q{thread}-{i}", f"a{thread}-{i}")
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(thread,)) for thread in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert store.stats() == {"sessions": 2, "turns": 200, "evicted_sessions": 0}
+    turns = store.get("s0")
+    # Thứ tự các lượt của cùng một luồng được giữ nguyên
+    assert [query for query, _ in turns if query.startswith("q0-")] == [f"q0-{i}" for i in range(25)]
+    store.close()
@@ -0,0 +1,63 @@
+from context_builder import ContextBuilder, TokenCounter, jaccard, _shingles
+
+
+def _word_counter():
+    # Đếm theo số từ để kết quả không phụ thuộc vào việc có cài tiktoken hay không
+    counter = TokenCounter()
+    counter.encoding = None
+    return counter
+
+
+def test_build_orders_by_score_and_stays_within_budget():
+    counter = _word_counter()
+    builder = ContextBuilder(token_budget=30, counter=counter)
+    results = [
+        {"text": "đoạn điểm thấp " * 3, "score": 0.1},
+        {"text": "học phí tính theo tín chỉ", "score": 0.9},
+        {"text": "ký túc xá ưu tiên năm nhất", "score": 0.5},
+        {"text": "rất dài " * 40, "score": 0.3},
+    ]
+
+    context, stats = builder.build(results)
+
+    assert context == "học phí tính theo tín chỉ\n\nký túc xá ưu tiên năm nhất"
+    assert stats["tokens"] <= 30
+    assert stats["over_budget"] == 2 and stats["used"] == 2
+
+
+def test_build_skips_near_duplicates():
+    builder = ContextBuilder(token_budget=1000, counter=_word_counter())
+    text = "sinh viên phải đóng học phí trước ngày 15 hằng tháng tại phòng tài chính"
+    results = [{"text": text, "score": 0.9}, {"text": text + ".", "score": 0.8},
+               {"text": "lịch thi được thông báo trên hệ thống", "score": 0.7}]
+
+    context, stats = builder.build(results)
+
+    assert stats["duplicates"] == 1 and stats["used"] == 2
+    assert context.count("học phí") == 1
+
+
+def test_build_truncates_top_result_larger_than_budget():
+    counter = _word_counter()
+    builder = ContextBuilder(token_budget=10, counter=counter)
+
+    context, stats = builder.build([{"text": "từ " * 100, "score": 1.0}])
+
+    assert stats["truncated"] and context
+    assert counter.count(context) <= 10
+
+
+def test_build_applies_clean_and_handles_empty_input():
+    builder = ContextBuilder(token_budget=100, counter=_word_counter())
+
+    assert builder.build([]) == ("", {"candidates": 0, "used": 0, "duplicates": 0, "over_budget": 0,
+                                      "truncated": False, "tokens": 0, "budget": 100})
+    context, _ = builder.build([{"text": "Tải về: học phí", "score": 1.0}],
+                               clean=lambda text: text.replace("Tải về:", ""))
+    assert context == "học phí"
+
+
+def test_jaccard_of_shingles():
+    assert jaccard(_shingles("a b c d"), _shingles("a b c d")) == 1.0
+    assert jaccard(_shingles("a b c d"), _shingles("x y z w")) == 0.0
+    assert jaccard(set(), _shingles("a")) == 0.0
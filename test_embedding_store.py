@@ -0,0 +1,61 @@
+from collections.abc import Sequence
+
+import numpy as np
+
+from embedding_store import (
+    EmbeddingStoreWriter, embeddings_fingerprint, is_store, open_store, saved_fingerprint, write_store
+)
+
+
+def test_store_maps_embeddings_and_reads_records_by_offset(tmp_path):
+    prefix = str(tmp_path / "store")
+    embeddings = np.arange(6, dtype=np.float32).reshape(3, 2)
+    write_store(prefix, ["a", "bé", "c"], embeddings, [{"i": 0}, {"i": 1}, {"i": 2}], hashes=["h0", "h1", "h2"],
+                model="m")
+
+    store = open_store(prefix)
+    assert is_store(prefix) and len(store) == 3 and store.model == "m"
+    assert list(store.texts) == ["a", "bé", "c"]
+    assert store.metadata[2] == {"i": 2} and store.hashes[1] == "h1"
+    assert isinstance(store.embeddings, np.memmap)
+    np.testing.assert_array_equal(store.embeddings, embeddings)
+    store.close()
+
+
+def test_store_round_trip_and_lazy_fields(tmp_path):
+    prefix = str(tmp_path / "store")
+    embeddings = np.arange(6, dtype=np.float32).reshape(3, 2)
+    write_store(prefix, ["a", "b", "c"], embeddings, [{"i": 0}, {"i": 1}, {"i": 2}], hashes=["h0", "h1", "h2"])
+
+    with open_store(prefix) as store:
+        assert isinstance(store.texts, Sequence)
+        assert list(store.texts) == ["a", "b", "c"]
+        assert store.texts[-1] == "c"
+        assert store.metadata[1:] == [{"i": 1}, {"i": 2}]
+        assert "b" in store.texts
+        np.testing.assert_array_equal(store.embeddings, embeddings)
+
+
+def test_store_can_be_overwritten_after_close(tmp_path):
+    prefix = str(tmp_path / "store")
+    write_store(prefix, ["a"], np.zeros((1, 2)), [{}])
+    store = open_store(prefix)
+    previous = np.array(store.embeddings[0])
+    store.close()
+
+    write_store(prefix, ["a", "b"], np.ones((2, 2)), [{}, {}])
+    with open_store(prefix) as store:
+        assert len(store) == 2
+        np.testing.assert_array_equal(store.embeddings[0], [1, 1])
+    np.testing.assert_array_equal(previous, [0, 0])
+
+
+def test_store_fingerprint_matches_embeddings_fingerprint(tmp_path):
+    prefix = str(tmp_path / "store")
+    embeddings = np.random.default_rng(0).standard_normal((5, 3)).astype(np.float32)
+    with EmbeddingStoreWriter(prefix) as writer:
+        writer.append(["a", "b"], embeddings[:2], [{}, {}])
+        writer.append(["c", "d", "e"], embeddings[2:], [{}, {}, {}])
+
+    assert saved_fingerprint(prefix) == embeddings_fingerprint(embeddings, block_rows=2)
+    assert saved_fingerprint(prefix) != embeddings_fingerprint(embeddings[::-1])
@@ -0,0 +1,234 @@
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+import embeddings
+from embedding_store import write_store
+from embeddings import (
+    EmbeddingBatcher, EmbeddingHandler, QueryEmbeddingCache, content_hash, iter_json_records, register_model
+)
+
+
+def test_query_cache_key_keeps_case_and_collapses_whitespace():
+    cache = QueryEmbeddingCache(max_entries=8)
+    cache.put("Học phí  ngành CNTT ", np.ones(4))
+
+    assert cache.get("Học phí ngành CNTT") is not None
+    assert cache.get("học phí ngành cntt") is None
+
+
+def test_query_cache_evicts_least_recently_used():
+    cache = QueryEmbeddingCache(max_entries=2)
+    cache.put("a", np.zeros(4))
+    cache.put("b", np.zeros(4))
+    cache.get("a")
+    cache.put("c", np.zeros(4))
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_query_cache_save_and_load(tmp_path):
+    path = str(tmp_path / "cache.pkl")
+    cache = QueryEmbeddingCache(path=path, model_id="m")
+    cache.put("câu hỏi", np.arange(4, dtype=np.float32))
+    cache.save()
+
+    restored = QueryEmbeddingCache(path=path, model_id="m")
+    np.testing.assert_array_equal(restored.get("câu hỏi"), np.arange(4, dtype=np.float32))
+    assert QueryEmbeddingCache(path=path, model_id="khác").get("câu hỏi") is None
+
+
+def test_batcher_groups_concurrent_requests():
+    batches = []
+
+    def encode(texts):
+        batches.append(list(texts))
+        return [np.full(2, len(text)) for text in texts]
+
+    batcher = EmbeddingBatcher(encode, max_batch_size=4, max_wait_ms=200)
+    futures = [batcher.submit("a" * length) for length in range(1, 9)]
+
+    for length, future in enumerate(futures, 1):
+        np.testing.assert_array_equal(future.result(timeout=5), [length, length])
+    batcher.close()
+    assert [len(batch) for batch in batches] == [4, 4]
+
+
+def test_batcher_encodes_and_rejects_after_close():
+    batcher = EmbeddingBatcher(lambda texts: [np.full(2, len(text)) for text in texts], max_wait_ms=1)
+    np.testing.assert_array_equal(batcher.encode("abc", timeout=5), [3, 3])
+    batcher.close()
+
+    with pytest.raises(RuntimeError):
+        batcher.submit("abc")
+
+
+def test_batcher_reports_errors_to_every_request_and_keeps_running():
+    calls = []
+
+    def encode(texts):
+        calls.append(texts)
+        if len(calls) == 1:
+            return []  # Sai số lượng embeddings
+        return [np.zeros(2) for _ in texts]
+
+    batcher = EmbeddingBatcher(encode, max_wait_ms=1)
+    with pytest.raises(ValueError):
+        batcher.encode("a", timeout=5)
+    np.testing.assert_array_equal(batcher.encode("b", timeout=5), [0, 0])
+    batcher.close()
+
+
+class _RecordingHandler(EmbeddingHandler):
+    """Handler không cần model: embedding là (độ dài văn bản, 1) và ghi lại các văn bản đã encode."""
+
+    def __init__(self):
+        super().__init__(cache_size=0, model_name="test-recording-handler")
+        self.encoded = []
+
+    def generate_embeddings(self, texts):
+        self.encoded.extend(texts)
+        return np.asarray([[len(text), 1.0] for text in texts], dtype=np.float32)
+
+
+def test_model_is_loaded_lazily_and_once_for_all_handlers(monkeypatch):
+    loads = []
+
+    class SlowModel:
+        def __init__(self, model_name):
+            loads.append(model_name)
+            time.sleep(0.05)  # Đủ lâu để các luồng cùng chờ một lần tải
+
+    monkeypatch.setattr(embeddings, "SentenceTransformer", SlowModel)
+    monkeypatch.setattr(embeddings, "_MODEL_REGISTRY", {})
+    handlers = [EmbeddingHandler(cache_size=0, model_name="test-lazy-model") for _ in range(4)]
+    assert loads == []
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        models = list(pool.map(lambda handler: handler.model, handlers))
+
+    assert loads == ["test-lazy-model"]
+    assert all(model is models[0] for model in models)
+
+
+def test_incremental_handbook_encodes_only_new_and_edited_chunks(tmp_path):
+    handbook = tmp_path / "handbook.json"
+    output_path = str(tmp_path / "embeddings_data.pkl")
+    handler = _RecordingHandler()
+    handbook.write_text(json.dumps([
+        {"regulation": "Điều 1", "content": "cũ"},
+        {"regulation": "Điều 2", "content": "giữ nguyên"},
+    ], ensure_ascii=False), encoding="utf-8")
+    handler.process_handbook(str(handbook), output_path, incremental=True)
+
+    handbook.write_text(json.dumps([
+        {"regulation": "Điều 1", "content": "đã sửa"},
+        {"regulation": "Điều 2", "content": "giữ nguyên"},
+        {"regulation": "Điều 3", "content": "mới"},
+    ], ensure_ascii=False), encoding="utf-8")
+    handler.encoded.clear()
+    texts, vectors, _ = handler.process_handbook(str(handbook), output_path, incremental=True)
+
+    assert handler.encoded == ["Điều 1\nđã sửa", "Điều 3\nmới"]
+    np.testing.assert_array_equal(vectors, [[len(text), 1.0] for text in texts])
+
+
+def test_incremental_embeddings_reuse_previous_store(tmp_path):
+    class CountingEncoder:
+        def __init__(self):
+            self.encoded = []
+
+        def encode(self, texts, convert_to_tensor=False):
+            self.encoded.extend(texts)
+            return np.asarray([[len(text), 1.0] for text in texts], dtype=np.float32)
+
+    encoder = CountingEncoder()
+    register_model("test-counting-encoder", encoder)
+    handler = EmbeddingHandler(cache_size=0, model_name="test-counting-encoder", backend="torch")
+    prefix = str(tmp_path / "store")
+    write_store(prefix, ["cũ"], np.asarray([[9.0, 9.0]]), [{}], hashes=None,
+                model="test-counting-encoder:torch")
+
+    embeddings = handler._incremental_embeddings(["cũ", "mới"], [content_hash("cũ"), content_hash("mới")], prefix)
+
+    np.testing.assert_array_equal(embeddings[0], [9, 9])
+    assert encoder.encoded == ["mới"]
+    # Store cũ đã được đóng nên ghi đè được ngay
+    write_store(prefix, ["mới"], embeddings[1:], [{}])
+
+
+@pytest.mark.parametrize("read_size", [1, 2, 3, 5, 7, 64])
+def test_iter_json_records_values_cut_at_buffer_end(tmp_path, read_size):
+    path = tmp_path / "data.json"
+    path.write_text("[1234, 5678]", encoding="utf-8")
+
+    assert list(iter_json_records(str(path), read_size=read_size)) == [1234, 5678]
+
+
+@pytest.mark.parametrize("read_size", [1, 4, 13, 1 << 20])
+def test_iter_json_records_objects_across_buffers(tmp_path, read_size):
+    records = [{"regulation": f"Điều {i}", "content": "học phí \u1234 " * i, "score": i / 3, "ok": True}
+               for i in range(20)]
+    path = tmp_path / "data.json"
+    path.write_text(json.dumps(records, ensure_ascii=False, indent=1), encoding="utf-8")
+
+    assert list(iter_json_records(str(path), read_size=read_size)) == records
+
+
+def test_iter_json_records_raises_on_malformed_record_without_reading_rest(tmp_path):
+    path = tmp_path / "data.json"
+    path.write_text("[" + '{"a": 1},' * 3 + '{"a": 1 x},' + '{"a": 1},' * 10000 + '{"a": 1}]', encoding="utf-8")
+    records = iter_json_records(str(path), read_size=32, max_record_size=1024)
+
+    assert [next(records) for _ in range(3)] == [{"a": 1}] * 3
+    with pytest.raises(json.JSONDecodeError):
+        next(records)
+
+
+def test_iter_json_records_reads_jsonl(tmp_path):
+    path = tmp_path / "data.jsonl"
+    path.write_text('\n{"a": 1}\n\n{"a": 2}\n', encoding="utf-8")
+
+    assert list(iter_json_records(str(path), read_size=2)) == [{"a": 1}, {"a": 2}]
+
+
+def test_streaming_ingest_creates_collection_and_marks_change_once(tmp_path):
+    from qdrant_client import QdrantClient
+    from text_features import extract_features
+    from vector_store import VectorStore
+
+    class RecordingStore(VectorStore):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.marked = []
+
+        def mark_changed(self, changed_ids=None, added_ids=()):
+            self.marked.append(changed_ids)
+            super().mark_changed(changed_ids, added_ids)
+
+    class LengthEncoder:
+        def encode(self, texts, convert_to_tensor=False):
+            return np.asarray([[len(text), 1.0] for text in texts], dtype=np.float32)
+
+    register_model("test-stream-encoder", LengthEncoder())
+    handler = EmbeddingHandler(cache_size=0, model_name="test-stream-encoder", backend="torch")
+    records = [{"regulation": f"Điều {i}", "content": f"học phí kỳ {i}"} for i in range(5)]
+    path = tmp_path / "data.json"
+    path.write_text(json.dumps(records, ensure_ascii=False), encoding="utf-8")
+    store = RecordingStore(collection_name="test_stream", client=QdrantClient(":memory:"))
+    store.vector_size = 2
+
+    handler.process_handbook_streaming(str(path), str(tmp_path / "store"), chunk_size=2, vector_store=store)
+
+    points, _ = store.client.scroll(collection_name="test_stream", limit=10, with_payload=True)
+    assert len(points) == 5
+    assert store.marked[0] is None  # Tạo collection
+    assert len(store.marked) == 2 and len(store.marked[1]) == 5
+    text = f"{records[0]['regulation']}\n{records[0]['content']}"
+    assert next(point.payload for point in points if point.payload["text"] == text)["features"] == \
+        extract_features(text)
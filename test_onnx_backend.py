@@ -0,0 +1,115 @@
+import numpy as np
+import pytest
+
+import onnx_backend
+
+
+class _FakeSTModel:
+    max_seq_length = 128
+
+    def __init__(self, embeddings):
+        self.embeddings = embeddings
+
+    def encode(self, texts, convert_to_tensor=False, **kwargs):
+        return self.embeddings[:len(texts)]
+
+
+class _FakeOnnxEncoder:
+    outputs = None
+
+    def __init__(self, model_path, tokenizer_dir=None, max_seq_length=128, num_threads=None):
+        self.model_path = model_path
+
+    def encode(self, texts, **kwargs):
+        return _FakeOnnxEncoder.outputs[:len(texts)]
+
+
+@pytest.fixture
+def exports(monkeypatch):
+    calls = []
+
+    def fake_export(st_model, model_path, opset):
+        calls.append(("export", model_path, opset))
+        open(model_path, "wb").close()
+
+    def fake_quantize(model_path, quantized_path):
+        calls.append(("quantize", quantized_path))
+        open(quantized_path, "wb").close()
+
+    monkeypatch.setattr(onnx_backend, "_export_transformer", fake_export)
+    monkeypatch.setattr(onnx_backend, "_quantize", fake_quantize)
+    monkeypatch.setattr(onnx_backend, "OnnxEncoder", _FakeOnnxEncoder)
+    return calls
+
+
+def _embeddings(seed=0, rows=16):
+    return np.random.default_rng(seed).standard_normal((rows, 8)).astype(np.float32)
+
+
+def test_check_parity_requires_every_row_to_agree():
+    reference = _embeddings()
+    texts = ["câu hỏi"] * len(reference)
+    _FakeOnnxEncoder.outputs = reference * 2  # Cùng hướng: cosine = 1
+    passed, stats = onnx_backend.check_parity(_FakeSTModel(reference), _FakeOnnxEncoder("model.onnx"), texts)
+    assert passed and stats["min"] == pytest.approx(1.0)
+
+    _FakeOnnxEncoder.outputs = np.vstack([-reference[:1], reference[1:]])
+    passed, stats = onnx_backend.check_parity(_FakeSTModel(reference), _FakeOnnxEncoder("model.onnx"), texts)
+    assert not passed and stats["min"] == pytest.approx(-1.0)
+
+
+def test_export_is_reused_only_for_the_same_model_and_opset(tmp_path, exports):
+    st_model = _FakeSTModel(_embeddings())
+    root = str(tmp_path)
+
+    first = onnx_backend.export_onnx(st_model, onnx_backend.export_dir("org/model-a", 14, root), model_name="org/model-a")
+    again = onnx_backend.export_onnx(st_model, onnx_backend.export_dir("org/model-a", 14, root), model_name="org/model-a")
+    other = onnx_backend.export_onnx(st_model, onnx_backend.export_dir("org/model-b", 14, root), model_name="org/model-b")
+    newer = onnx_backend.export_onnx(st_model, onnx_backend.export_dir("org/model-a", 17, root), opset=17,
+                                     model_name="org/model-a")
+
+    assert first == again
+    assert len({first, other, newer}) == 3
+    assert [call[0] for call in exports] == ["export", "export", "export"]
+
+
+def test_export_redone_when_stored_fingerprint_differs(tmp_path, exports):
+    st_model = _FakeSTModel(_embeddings())
+    output_dir = str(tmp_path)
+    onnx_backend.export_onnx(st_model, output_dir, quantize=True, model_name="model-a")
+
+    # Cùng thư mục nhưng model khác: cả file fp32 lẫn file int8 đều phải tạo lại
+    onnx_backend.export_onnx(st_model, output_dir, quantize=True, model_name="model-b")
+
+    assert [call[0] for call in exports] == ["export", "quantize", "export", "quantize"]
+    assert onnx_backend.read_meta(output_dir)["model.int8.onnx"]["fingerprint"] == \
+        onnx_backend.export_fingerprint("model-b", 14, True)
+
+
+def test_parity_is_checked_once_after_export(tmp_path, exports, monkeypatch):
+    reference = _embeddings()
+    _FakeOnnxEncoder.outputs = reference * 2  # Cùng hướng: cosine = 1
+    checks = []
+    check_parity = onnx_backend.check_parity
+
+    def counting_check_parity(*args, **kwargs):
+        checks.append(args)
+        return check_parity(*args, **kwargs)
+
+    monkeypatch.setattr(onnx_backend, "check_parity", counting_check_parity)
+
+    onnx_backend.load_onnx_encoder(_FakeSTModel(reference), output_dir=str(tmp_path), model_name="model-a")
+    onnx_backend.load_onnx_encoder(_FakeSTModel(reference), output_dir=str(tmp_path), model_name="model-a")
+
+    assert len(checks) == 1
+    assert onnx_backend.read_meta(str(tmp_path))["model.onnx"]["parity"]["passed"] is True
+
+
+def test_backend_rejected_when_parity_fails(tmp_path, exports):
+    _FakeOnnxEncoder.outputs = _embeddings(seed=1)
+
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            onnx_backend.load_onnx_encoder(_FakeSTModel(_embeddings()), output_dir=str(tmp_path), model_name="model-a")
+
+    assert [call[0] for call in exports] == ["export"]
@@ -0,0 +1,54 @@
+from scoring import DEFAULT_PRIORITY_WEIGHTS, PRIORITY_RESET_INTERVAL, ScoringSessions, SessionScoringState
+
+BOOSTS = [(("học phí",), 3)]
+
+
+def test_boosts_stay_within_their_session():
+    sessions = ScoringSessions()
+
+    boosted = sessions.context_for("s1", BOOSTS)
+    other = sessions.context_for("s2", [])
+
+    assert boosted.priority_weights["học phí"] == DEFAULT_PRIORITY_WEIGHTS["học phí"] + 3
+    assert other.priority_weights == DEFAULT_PRIORITY_WEIGHTS
+    assert sessions.context_for("s1", BOOSTS).priority_weights["học phí"] == DEFAULT_PRIORITY_WEIGHTS["học phí"] + 6
+
+
+def test_requests_without_session_never_accumulate():
+    sessions = ScoringSessions()
+
+    for _ in range(3):
+        context = sessions.context_for(None, BOOSTS)
+
+    assert context.priority_weights["học phí"] == DEFAULT_PRIORITY_WEIGHTS["học phí"] + 3
+    assert sessions.get("s1").priority_weights == DEFAULT_PRIORITY_WEIGHTS
+
+
+def test_least_recently_used_session_is_evicted():
+    sessions = ScoringSessions(max_sessions=2)
+    sessions.context_for("s1", BOOSTS)
+    sessions.context_for("s2", BOOSTS)
+    sessions.get("s1")  # s1 vừa được dùng, s2 cũ nhất
+
+    sessions.get("s3")
+
+    assert sessions.get("s1").priority_weights["học phí"] == DEFAULT_PRIORITY_WEIGHTS["học phí"] + 3
+    assert sessions.get("s2").priority_weights == DEFAULT_PRIORITY_WEIGHTS
+
+
+def test_discard_resets_session_state():
+    sessions = ScoringSessions()
+    sessions.context_for("s1", BOOSTS)
+
+    sessions.discard("s1")
+
+    assert sessions.get("s1").priority_weights == DEFAULT_PRIORITY_WEIGHTS
+
+
+def test_max_priority_resets_after_interval():
+    state = SessionScoringState()
+    for _ in range(PRIORITY_RESET_INTERVAL):
+        context = state.begin_request(BOOSTS)
+    assert context.max_priority > 0
+
+    assert state.begin_request([]).max_priority == 0
@@ -0,0 +1,128 @@
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+
+from server import ChatService, make_server, parse_ask_request
+
+
+class _ReadyHandler:
+    def wait_until_ready(self, timeout=None):
+        return True
+
+
+class _EchoAgent:
+    def __init__(self):
+        self.calls = []
+        self.embedding_handler = _ReadyHandler()
+
+    def run(self, question, top_k=5, session_id=None):
+        self.calls.append((question, top_k, session_id))
+        if question == "lỗi":
+            return "❌ Lỗi khi tìm kiếm dữ liệu: mất kết nối"
+        if question == "ngoại lệ":
+            raise RuntimeError("hỏng")
+        if question == "chậm":
+            time.sleep(0.5)
+        return f"{question}:{top_k}"
+
+    def cache_stats(self):
+        return {}
+
+
+def test_parse_ask_request_accepts_defaults():
+    assert parse_ask_request({"question": "  Học phí?  "}) == ("Học phí?", None, 5)
+    assert parse_ask_request({"question": "a", "session_id": "s1", "top_k": 50}) == ("a", "s1", 50)
+
+
+@pytest.mark.parametrize("body", [
+    [],
+    {"question": ""},
+    {"question": 123},
+    {"question": "a", "session_id": 42},
+    {"question": "a", "session_id": {"id": 1}},
+    {"question": "a", "top_k": 0},
+    {"question": "a", "top_k": 51},
+    {"question": "a", "top_k": 10 ** 9},
+    {"question": "a", "top_k": "5"},
+    {"question": "a", "top_k": 2.5},
+    {"question": "a", "top_k": True},
+])
+def test_parse_ask_request_rejects_invalid_input(body):
+    with pytest.raises(ValueError):
+        parse_ask_request(body)
+
+
+def _post(port, body):
+    request = urllib.request.Request(f"http://127.0.0.1:{port}/ask", data=json.dumps(body).encode("utf-8"),
+                                     headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(request, timeout=5) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+def _get(port, path):
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}{path}", timeout=5) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+@pytest.fixture
+def served():
+    agent = _EchoAgent()
+    service = ChatService(lambda: agent, max_concurrency=2, request_timeout=0.2)
+    service.agent = agent
+    server = make_server(service, port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server.server_address[1], agent, service
+    server.shutdown()
+    server.server_close()
+
+
+def test_questions_wait_for_the_agent_to_be_ready(served):
+    port, agent, service = served
+    service.agent = None  # Agent đang khởi tạo
+
+    assert _get(port, "/healthz") == (200, {"status": "ok"})
+    assert _get(port, "/readyz")[0] == 503
+    assert _post(port, {"question": "Học phí?"})[0] == 503
+
+    service.agent = agent
+    assert _get(port, "/readyz")[0] == 200
+    status, body = _post(port, {"question": "Học phí?", "top_k": 3})
+    assert status == 200 and body["answer"] == "Học phí?:3"
+    assert _get(port, "/khong-co")[0] == 404
+
+
+def test_ask_returns_400_for_invalid_input_without_calling_agent(served):
+    port, agent, _ = served
+
+    assert _post(port, {"question": "a", "top_k": 1000})[0] == 400
+    assert _post(port, {"question": "a", "session_id": 1})[0] == 400
+    assert agent.calls == []
+
+    status, body = _post(port, {"question": "a", "top_k": 3, "session_id": "s"})
+    assert status == 200 and body["answer"] == "a:3"
+    assert agent.calls == [("a", 3, "s")]
+
+
+def test_agent_errors_are_5xx_and_only_answers_count_as_completed(served):
+    port, _, service = served
+
+    assert _post(port, {"question": "a"})[0] == 200
+    status, body = _post(port, {"question": "lỗi"})
+    assert status == 500 and body["error"].startswith("❌")
+    assert _post(port, {"question": "ngoại lệ"})[0] == 500
+    assert _post(port, {"question": "chậm"})[0] == 504
+    time.sleep(0.6)
+
+    stats = service.stats()
+    assert (stats["completed"], stats["failed"], stats["timed_out"], stats["in_flight"]) == (1, 2, 1, 0)
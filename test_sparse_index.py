@@ -0,0 +1,63 @@
+import math
+
+import pytest
+
+from sparse_index import BM25Index, normalize_fused_scores, reciprocal_rank_fusion, tokenize, RRF_K
+
+TEXTS = [
+    "Học phí được tính theo số tín chỉ đăng ký",
+    "Ký túc xá ưu tiên sinh viên năm nhất",
+    "Lịch thi học kỳ được thông báo trên hệ thống",
+    "Sinh viên đóng học phí trước ngày thi",
+]
+
+
+def test_tokenize_adds_bigrams_and_unaccented_forms():
+    tokens = tokenize("Học phí")
+
+    assert {"học", "phí", "học_phí", "hoc", "phi", "hoc_phi"} <= set(tokens)
+
+
+def test_bm25_ranks_documents_with_query_terms_first():
+    index = BM25Index.build(TEXTS)
+
+    rows, scores = index.search("học phí", top_k=4)
+
+    assert set(rows[:2]) == {0, 3}
+    assert scores == sorted(scores, reverse=True)
+    assert index.search("hoc phi", top_k=2)[0] == rows[:2]
+    assert index.search("không khớp gì cả xyz", top_k=4) == ([], [])
+
+
+def test_bm25_scores_match_formula():
+    index = BM25Index.build(TEXTS, k1=1.2, b=0.75)
+    docs = [tokenize(text) for text in TEXTS]
+    avgdl = sum(map(len, docs)) / len(docs)
+
+    rows, scores = index.search("túc", top_k=4)
+
+    # "túc" và bản không dấu "tuc" chỉ có trong đoạn 1, mỗi token xuất hiện một lần
+    norm = 1.2 * (1 - 0.75 + 0.75 * len(docs[1]) / avgdl)
+    idf = math.log(1 + (len(TEXTS) - 1 + 0.5) / (1 + 0.5))
+    assert rows == [1]
+    assert scores[0] == pytest.approx(2 * idf * 2.2 / (1 + norm), rel=1e-5)
+    assert index.avgdl == pytest.approx(avgdl)
+
+
+def test_params_key_changes_with_avgdl():
+    assert BM25Index.build(TEXTS).params_key() == BM25Index.build(list(TEXTS)).params_key()
+    assert BM25Index.build(TEXTS).params_key() != BM25Index.build(TEXTS[:2]).params_key()
+
+
+def test_rrf_rewards_items_ranked_high_in_both_lists():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["b", "c", "d"]])
+
+    assert [key for key, _ in fused] == ["b", "c", "a", "d"]
+    assert fused[0][1] == 1.0
+    expected_a = (1 / (RRF_K + 1)) / (1 / (RRF_K + 2) + 1 / (RRF_K + 1))
+    assert dict(fused)["a"] == pytest.approx(expected_a)
+
+
+def test_normalize_fused_scores():
+    assert normalize_fused_scores([]) == []
+    assert normalize_fused_scores([0.5, 0.25]) == [1.0, 0.5]
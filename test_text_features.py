@@ -0,0 +1,108 @@
+import numpy as np
+import pytest
+
+from text_features import (
+    FEATURE_VERSION, MAJORS, MATCHER, RESULT_BOOSTS, KeywordMatcher, detect_topics, extract_features,
+    is_majors_list_question, keyword_scores, payload_features, payload_matches, query_weights
+)
+
+
+@pytest.mark.parametrize("text", [
+    "học phí ngành công nghệ thông tin khóa 20",
+    "sinh viên ở ký túc xá cần đăng ký học phần",
+    "không có từ khóa nào",
+    "",
+])
+def test_matcher_finds_same_phrases_as_substring_checks(text):
+    assert MATCHER.find(text) == {pattern for pattern in MATCHER.patterns if pattern in text}
+
+
+def test_matcher_reports_longest_match_and_its_sub_phrases():
+    matcher = KeywordMatcher(["học phí", "phí", "học phí ngành", "ngành", "thi"])
+
+    assert matcher.find("học phí ngành cntt") == {"học phí ngành", "học phí", "phí", "ngành"}
+    assert matcher.find("lịch thi") == {"thi"}
+
+
+def test_matcher_finds_overlapping_phrases():
+    matcher = KeywordMatcher(["ký túc", "túc xá"])
+
+    assert matcher.find("ký túc xá") == {"ký túc", "túc xá"}
+
+
+def _scan_score(text, query, relevant_keywords, priority_weights):
+    """Điểm từ khóa tính bằng cách quét chuỗi trực tiếp, để đối chiếu với keyword_scores."""
+    text, query = text.lower(), query.lower()
+    score = sum(1 for keyword in relevant_keywords if keyword in text)
+    for query_any, result_any, result_all, weight in RESULT_BOOSTS:
+        if query_any and not any(phrase in query for phrase in query_any):
+            continue
+        if result_any and not any(phrase in text for phrase in result_any):
+            continue
+        if not all(phrase in text for phrase in result_all):
+            continue
+        score += priority_weights[weight] if isinstance(weight, str) else weight
+    return score
+
+
+def test_keyword_scores_match_string_scan():
+    texts = [
+        "Học phí 500.000 đồng/tín chỉ",
+        "Tổng số tín chỉ của chương trình",
+        "Sinh viên đăng nhập hệ thống để đăng ký học",
+        "Trình độ bậc 7 kỹ sư, 150 tín chỉ",
+        "Ký túc xá khu A",
+    ]
+    query = "Học phí và cách đăng nhập hệ thống"
+    relevant_keywords = sorted(MATCHER.find(" ".join(texts).lower()))
+    priority_weights = {rule[3]: 2 for rule in RESULT_BOOSTS if isinstance(rule[3], str)}
+    payloads = [{"text": text, "features": extract_features(text.lower()), "feature_version": FEATURE_VERSION}
+                for text in texts]
+
+    weights = query_weights(MATCHER.find(query.lower()), relevant_keywords, priority_weights)
+
+    np.testing.assert_array_equal(keyword_scores(payloads, weights),
+                                  [_scan_score(text, query, relevant_keywords, priority_weights) for text in texts])
+
+
+def test_payload_features_recomputed_when_missing_or_stale():
+    text = "học phí 500.000 đồng/tín chỉ"
+    features = extract_features(text)
+
+    assert payload_features({"text": text}) == features
+    assert payload_features({"text": text, "features": [0], "feature_version": "cũ"}) == features
+    assert payload_features({"text": text, "features": [0], "feature_version": FEATURE_VERSION}) == [0]
+
+
+def test_detect_topics_and_payload_matches_agree():
+    text = "Sinh viên nộp học phí theo tín chỉ"
+    topics = detect_topics(text)
+    payload = {"text": text, "topics": topics}
+
+    assert topics == ["học phí"]
+    assert all(payload_matches(payload, topics=[topic]) for topic in topics)
+    assert payload_matches(payload, text_terms=["tín chỉ"])
+    assert not payload_matches(payload, text_terms=["ký túc xá"])
+
+
+@pytest.mark.parametrize("query", [
+    "Liệt kê các ngành học",
+    "Danh sách ngành học của trường",
+    "Trường có những ngành nào?",
+    "ICTU đào tạo bao nhiêu ngành?",
+    "Kể tên các ngành đào tạo",
+    "Trường có ngành gì?",
+])
+def test_majors_list_questions_are_recognized(query):
+    assert is_majors_list_question(query)
+
+
+@pytest.mark.parametrize("query", [
+    "Ngành nào có học phí thấp nhất?",
+    "Điều kiện tốt nghiệp của các ngành",
+    "Học phí các ngành là bao nhiêu?",
+    f"Liệt kê các môn của ngành {MAJORS[0]}",
+    "Ký túc xá ở đâu?",
+])
+def test_other_questions_are_not_majors_list_questions(query):
+    assert not is_majors_list_question(query)
@@ -0,0 +1,282 @@
+import asyncio
+import threading
+
+import numpy as np
+import pytest
+from qdrant_client import QdrantClient
+from qdrant_client.http.models import Distance, VectorParams
+
+import vector_store
+from sparse_index import BM25Index
+from ann_index import IVFIndex
+from vector_store import AnnVectorStore, LocalVectorStore, VectorStore, stable_point_ids
+
+
+def _embeddings(n, dim=8, seed=0):
+    return np.random.default_rng(seed).standard_normal((n, dim)).astype(np.float32)
+
+
+class _FlakyClient:
+    """Bọc QdrantClient: lần upsert đầu tiên vào collection chính thất bại, ghi lại cờ wait.
+
+    Qdrant cục bộ (":memory:") không an toàn luồng nên các upsert được tuần tự hóa bằng khóa.
+    """
+
+    def __init__(self, client, collection_name):
+        self.client = client
+        self.lock = threading.Lock()
+        self.collection_name = collection_name
+        self.failures = 1
+        self.waits = []
+
+    def upsert(self, collection_name, points, wait=True, **kwargs):
+        with self.lock:
+            if collection_name == self.collection_name:
+                self.waits.append(wait)
+                if self.failures:
+                    self.failures -= 1
+                    raise ConnectionError("mất kết nối")
+            return self.client.upsert(collection_name=collection_name, points=points, wait=wait, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+
+def test_pipelined_upsert_stores_every_batch_and_retries_failures(monkeypatch):
+    client = _FlakyClient(QdrantClient(":memory:"), "test_pipeline")
+    monkeypatch.setattr(vector_store, "QdrantClient", lambda **kwargs: client)
+    monkeypatch.setattr(vector_store.time, "sleep", lambda seconds: None)
+    store = VectorStore(collection_name="test_pipeline")
+    store.vector_size = 8
+    store.create_collection()
+    texts = [f"đoạn {i}" for i in range(23)]
+
+    store.upsert_vectors(texts, _embeddings(23), [{} for _ in texts], batch_size=5, parallelism=2)
+
+    assert client.count(collection_name="test_pipeline").count == 23
+    # 5 batch + 1 lần thử lại; chỉ batch cuối chờ Qdrant áp dụng
+    assert len(client.waits) == 6
+    assert client.waits.count(True) == 1 and client.waits[-1] is True
+
+
+def test_stable_point_ids_keep_duplicate_texts_apart():
+    texts = ["học phí", "học phí", "ký túc xá", "học phí"]
+    metadata = [{"regulation": "Điều 1"}, {"regulation": "Điều 2"}, {}, {}]
+
+    ids = stable_point_ids(texts, metadata)
+
+    assert len(set(ids)) == 4
+    assert ids[0] == stable_point_ids(["học phí"], [{}])[0]
+    assert ids == stable_point_ids(texts, metadata)
+
+
+def test_stable_point_ids_chunked_match_single_call():
+    texts = ["a", "b", "a", "c", "a"]
+    metadata = [{}] * 5
+    occurrences = {}
+
+    chunked = stable_point_ids(texts[:2], metadata[:2], occurrences=occurrences) \
+        + stable_point_ids(texts[2:], metadata[2:], occurrences=occurrences)
+
+    assert chunked == stable_point_ids(texts, metadata)
+
+
+def test_stable_point_ids_by_key_field_ignore_content():
+    ids = stable_point_ids(["cũ", "x"], [{"regulation": "Điều 1"}, {"regulation": "Điều 1"}], key_field="regulation")
+    edited = stable_point_ids(["mới", "y"], [{"regulation": "Điều 1"}, {"regulation": "Điều 1"}], key_field="regulation")
+
+    assert ids == edited
+    assert ids[0] != ids[1]
+
+
+def test_local_store_keeps_metadata_of_duplicate_texts():
+    store = LocalVectorStore(vector_size=8)
+    embeddings = _embeddings(2)
+    store.upsert_vectors(["giống nhau", "giống nhau"], embeddings, [{"regulation": "Điều 1"}, {"regulation": "Điều 2"}])
+
+    results = store.search(embeddings[0], top_k=5)
+
+    assert sorted(result.payload["metadata"]["regulation"] for result in results) == ["Điều 1", "Điều 2"]
+
+
+def test_sync_upserts_metadata_changes_and_deletes_stale_points():
+    store = VectorStore(collection_name="test_sync", client=QdrantClient(":memory:"))
+    store.vector_size = 8
+    texts = ["học phí", "học phí", "ký túc xá"]
+    embeddings = _embeddings(3)
+
+    assert store.sync(texts, embeddings, [{"regulation": "Điều 1"}, {"regulation": "Điều 2"}, {}]) == \
+        {"added": 3, "updated": 0, "deleted": 0, "unchanged": 0, "reweighted": 0}
+    assert store.sync(texts, embeddings, [{"regulation": "Điều 1"}, {"regulation": "Điều 3"}, {}]) == \
+        {"added": 0, "updated": 1, "deleted": 0, "unchanged": 2, "reweighted": 0}
+    assert store.sync(texts[:2], embeddings[:2], [{"regulation": "Điều 1"}, {"regulation": "Điều 3"}]) == \
+        {"added": 0, "updated": 0, "deleted": 1, "unchanged": 2, "reweighted": 0}
+
+    points, _ = store.client.scroll("test_sync", with_payload=True)
+    assert sorted(point.payload["metadata"]["regulation"] for point in points) == ["Điều 1", "Điều 3"]
+
+
+def test_upsert_vectors_and_sync_write_the_same_point_ids():
+    store = VectorStore(collection_name="test_ids", client=QdrantClient(":memory:"))
+    store.vector_size = 8
+    texts = ["a", "b", "a"]
+    metadata = [{}, {}, {}]
+    store.create_collection()
+    occurrences = {}
+    store.upsert_vectors(texts[:2], _embeddings(2), metadata[:2], occurrences=occurrences)
+    store.upsert_vectors(texts[2:], _embeddings(1, seed=1), metadata[2:], occurrences=occurrences)
+
+    summary = store.sync(texts, np.vstack([_embeddings(2), _embeddings(1, seed=1)]), metadata)
+
+    assert summary == {"added": 0, "updated": 0, "deleted": 0, "unchanged": 3, "reweighted": 0}
+
+
+def test_sync_recreates_collection_without_sparse_config():
+    client = QdrantClient(":memory:")
+    client.create_collection("test_sparse", vectors_config=VectorParams(size=8, distance=Distance.COSINE))
+    texts = ["học phí ngành CNTT", "ký túc xá", "lịch thi học kỳ"]
+    embeddings = _embeddings(3)
+    VectorStore(collection_name="test_sparse", client=client).upsert_vectors(texts, embeddings, [{}, {}, {}])
+
+    store = VectorStore(collection_name="test_sparse", sparse_index=BM25Index.build(texts), client=client)
+    store.vector_size = 8
+    summary = store.sync(texts, embeddings, [{}, {}, {}])
+
+    assert summary["added"] == 3
+    results = store.hybrid_search(embeddings[1], "ký túc xá", top_k=1)
+    assert results[0].payload["text"] == "ký túc xá"
+
+
+def test_upsert_falls_back_to_dense_only_without_sparse_config():
+    client = QdrantClient(":memory:")
+    client.create_collection("test_dense", vectors_config=VectorParams(size=8, distance=Distance.COSINE))
+    texts = ["học phí", "ký túc xá"]
+    store = VectorStore(collection_name="test_dense", sparse_index=BM25Index.build(texts), client=client)
+
+    store.upsert_vectors(texts, _embeddings(2), [{}, {}])
+
+    assert client.count("test_dense").count == 2
+
+
+def _cosine(a, b):
+    return float(a @ b / (np.linalg.norm(a) * np.linalg.norm(b)))
+
+
+def test_hybrid_results_carry_dense_cosine():
+    texts = ["học phí ngành CNTT", "ký túc xá", "lịch thi học kỳ"]
+    embeddings = _embeddings(3)
+    query = _embeddings(1, seed=7)[0]
+    client = QdrantClient(":memory:")
+    qdrant = VectorStore(collection_name="test_fused", sparse_index=BM25Index.build(texts), client=client)
+    qdrant.vector_size = 8
+    qdrant.sync(texts, embeddings, [{}, {}, {}])
+    local = LocalVectorStore(vector_size=8)
+    local.upsert_vectors(texts, embeddings, [{}, {}, {}])
+
+    for store in (qdrant, local):
+        results = store.hybrid_search(query, "không liên quan", top_k=3)
+        assert results[0].score == 1.0
+        for result in results:
+            row = texts.index(result.payload["text"])
+            assert abs(result.dense_score - _cosine(embeddings[row], query)) < 1e-5
+
+
+def test_async_search_with_injected_client_matches_sync_search():
+    texts = ["học phí ngành CNTT", "ký túc xá", "lịch thi học kỳ"]
+    embeddings = _embeddings(3)
+    query = _embeddings(1, seed=7)[0]
+    store = VectorStore(collection_name="test_async", sparse_index=BM25Index.build(texts),
+                        client=QdrantClient(":memory:"))
+    store.vector_size = 8
+    store.sync(texts, embeddings, [{}, {}, {}])
+
+    assert store.async_client is None
+    dense = asyncio.run(store.asearch(query, top_k=3))
+    fused = asyncio.run(store.ahybrid_search(query, "ký túc xá", top_k=3))
+
+    assert [point.id for point in dense] == [point.id for point in store.search(query, top_k=3)]
+    assert [point.id for point in fused] == [point.id for point in store.hybrid_search(query, "ký túc xá", top_k=3)]
+
+
+def test_sync_reweights_unchanged_sparse_vectors_when_avgdl_changes():
+    client = QdrantClient(":memory:")
+    texts = ["học phí", "ký túc xá"]
+    store = VectorStore(collection_name="test_bm25", sparse_index=BM25Index.build(texts), client=client)
+    store.vector_size = 8
+    store.sync(texts, _embeddings(2), [{}, {}])
+
+    texts = texts + ["lịch thi học kỳ và quy định đăng ký học phần cho sinh viên năm nhất"]
+    store.sparse_index = BM25Index.build(texts)
+    summary = store.sync(texts, _embeddings(3), [{}, {}, {}])
+
+    assert summary == {"added": 1, "updated": 0, "deleted": 0, "unchanged": 2, "reweighted": 2}
+    points, _ = client.scroll("test_bm25", with_payload=["text", "bm25_params"], with_vectors=True)
+    for point in points:
+        expected = store.sparse_index.doc_vector(point.payload["text"])
+        assert point.payload["bm25_params"] == store.sparse_index.params_key()
+        assert dict(zip(point.vector["bm25"].indices, point.vector["bm25"].values)) == \
+            pytest.approx(dict(zip(*expected)))
+    assert store.sync(texts, _embeddings(3), [{}, {}, {}])["reweighted"] == 0
+
+
+def test_generation_is_shared_between_stores_and_lists_changed_ids():
+    client = QdrantClient(":memory:")
+    ingest = VectorStore(collection_name="test_gen", client=client)
+    ingest.vector_size = 8
+    serving = VectorStore(collection_name="test_gen", client=client)
+    texts = ["học phí", "ký túc xá"]
+    ingest.sync(texts, _embeddings(2), [{}, {}])
+    before = serving.generation
+
+    ingest.sync(texts, _embeddings(2), [{"regulation": "Điều 9"}, {}])
+    serving._state = None  # Bỏ qua khoảng GENERATION_REFRESH_INTERVAL
+
+    assert before is not None and serving.generation not in (None, before)
+    assert serving.changes_since(before) == (stable_point_ids(texts, [{"regulation": "Điều 9"}, {}])[:1], [])
+    assert serving.changes_since("cũ") is None
+
+
+def test_changes_since_lists_added_points():
+    texts = ["học phí", "ký túc xá"]
+    new_id = stable_point_ids(texts, [{}, {}])[1]
+
+    qdrant = VectorStore(collection_name="test_added", client=QdrantClient(":memory:"))
+    qdrant.vector_size = 8
+    qdrant.sync(texts[:1], _embeddings(1), [{}])
+    before = qdrant.generation
+    qdrant.sync(texts, _embeddings(2), [{}, {}])
+    assert qdrant.changes_since(before) == ([new_id], [new_id])
+
+    local = LocalVectorStore(vector_size=8)
+    local.upsert_vectors(texts[:1], _embeddings(1), [{}])
+    before = local.generation
+    local.upsert_vectors(texts, _embeddings(2), [{}, {}])
+    assert local.changes_since(before) == (stable_point_ids(texts, [{}, {}]), [new_id])
+
+
+def _ann_store(n=200, nprobe=1):
+    embeddings = _embeddings(n, dim=16)
+    texts = [f"đoạn {i} học phí" if i % 50 == 0 else f"đoạn {i}" for i in range(n)]
+    metadata = [{"regulation": f"Điều {i}"} for i in range(n)]
+    return AnnVectorStore(IVFIndex.build(embeddings, nlist=16, nprobe=nprobe), texts, metadata), embeddings
+
+
+def test_ann_store_returns_stable_point_ids():
+    store, embeddings = _ann_store(nprobe=16)
+
+    results = store.search(embeddings[3], top_k=3)
+    fused = store.hybrid_search(embeddings[3], "đoạn 3", top_k=3)
+
+    assert results[0].id == store.point_ids[3] == stable_point_ids(store.texts, store.metadata)[3]
+    assert fused[0].id == store.point_ids[3]
+    assert results[0].payload["text"] == "đoạn 3"
+
+
+def test_ann_filtered_search_falls_back_to_exact_when_probes_miss():
+    store, embeddings = _ann_store(nprobe=1)
+    expected = {store.point_ids[row] for row in (0, 50, 100, 150)}
+
+    results = store.search(embeddings[7], top_k=4, text_terms=["học phí"], overfetch=1)
+
+    assert {result.id for result in results} == expected
+    assert [result.score for result in results] == sorted((result.score for result in results), reverse=True)
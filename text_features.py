@@ -0,0 +1,264 @@
+# text_features.py
+"""Đặc trưng từ khóa/chủ đề của văn bản, dùng chung khi ingest (payload) và khi truy vấn.
+
+Mọi cụm từ mà ChatBotAgent kiểm tra trong câu hỏi và trong kết quả tìm kiếm được biên
+dịch một lần vào MATCHER; một lần duyệt chuỗi trả về tập tất cả cụm từ xuất hiện.
+Đặc trưng của mỗi đoạn (extract_features) được lưu khi ingest để chấm điểm bằng NumPy.
+"""
+import hashlib
+import json
+import re
+import numpy as np
+from keywords import KEYWORDS
+from training_program import TRAINING_PROGRAM
+
+MAJORS = [major for block in TRAINING_PROGRAM.values() for major in block["majors"]]
+MAJORS_LOWER = frozenset(major.lower() for major in MAJORS)
+# Từ khóa theo chủ đề; giữ nguyên chuỗi gốc như khi so khớp bằng `in`
+KEYWORD_SETS = {topic: frozenset(words) for topic, words in KEYWORDS.items()}
+
+FACULTY_KEYWORDS = [
+    "khoa", "ngành học", "cơ cấu tổ chức", "khoa học cơ bản", "công nghệ thông tin",
+    "công nghệ điện tử và truyền thông", "hệ thống thông tin kinh tế", "công nghệ tự động hóa",
+    "truyền thông đa phương tiện", "thương mại điện tử"
+]
+TUITION_TRIGGERS = ("học phí", "mỗi tín chỉ", "bao nhiêu tiền")
+TUITION_KEYWORDS = ["học phí", "đồng/tín chỉ", "mỗi tín chỉ", "khóa 17", "khóa 18-19", "khóa 20-21"]
+COURSE_EXPANSIONS = [
+    (("khóa 17",), ["khóa 17"]),
+    (("khóa 18", "khóa 19", "khóa 18-19"), ["khóa 18", "khóa 19", "khóa 18-19"]),
+    (("khóa 20", "khóa 21", "khóa 20-21"), ["khóa 20", "khóa 21", "khóa 20-21"]),
+]
+MAJORS_IN_QUERY = None  # Đánh dấu: thêm tên các ngành xuất hiện trong câu hỏi
+
+# Mở rộng từ khóa khi tìm kiếm: (cụm kích hoạt trong câu hỏi, từ khóa thêm vào,
+# chủ đề được tăng độ ưu tiên, mức tăng). Thứ tự quyết định thứ tự từ khóa.
+SEARCH_EXPANSIONS = [
+    (("khoa", "ngành học", "liệt kê"), FACULTY_KEYWORDS, ("khoa", "ngành học"), 2),
+    (tuple(MAJORS_LOWER), MAJORS_IN_QUERY, (), 0),
+    (TUITION_TRIGGERS, TUITION_KEYWORDS, ("học phí",), 2),
+    *[(triggers, keywords, (), 0) for triggers, keywords in COURSE_EXPANSIONS],
+    (("điều 3",), ["điều 3", "chương trình đào tạo", "kỹ sư", "trình độ bậc 7", "cử nhân"], (), 0),
+    (("cử nhân",), ["cử nhân", "chương trình đào tạo", "đại học"], (), 0),
+    (("kỹ sư",), ["kỹ sư", "trình độ bậc 7", "chương trình đào tạo", "tín chỉ", "khối lượng học tập"], (), 0),
+    (("xếp loại học lực",), ["xếp loại học lực", "xuất sắc", "giỏi", "khá", "trung bình", "yếu", "kém", "điểm trung bình tích lũy"], ("xếp loại học lực",), 1),
+    (("xếp hạng học lực",), ["xếp hạng học lực", "hạng bình thường", "hạng yếu", "điểm trung bình tích lũy"], ("xếp hạng học lực",), 1),
+    (("đăng nhập",), ["đăng nhập", "mã sinh viên", "mật khẩu", "ngày tháng năm sinh", "viết hoa", "hệ thống"], ("đăng nhập",), 1),
+    (("đổi mật khẩu",), ["đổi mật khẩu", "thay đổi mật khẩu", "cập nhật mật khẩu", "quản lý tài khoản", "phòng đào tạo", "hệ thống"], ("đổi mật khẩu",), 1),
+    (("đăng ký học",), ["đăng ký học", "học phần", "hệ thống", "đăng ký tín chỉ"], ("đăng ký học",), 1),
+    (("thanh toán học phí", "nộp tiền trước"), ["thanh toán học phí", "online", "đăng ký học kỳ tới", "nộp tiền trước", "chức năng thanh toán", "hệ thống"], ("thanh toán học phí",), 1),
+    (("hoạt động ngoại khóa",), ["hoạt động ngoại khóa", "điểm ngoại khóa", "tham gia hoạt động", "đánh giá hoạt động"], ("hoạt động ngoại khóa",), 1),
+    (("xem lịch thi",), ["xem lịch thi", "học kỳ", "đợt học"], ("xem lịch thi",), 1),
+    (("tra cứu điểm",), ["tra cứu điểm", "học kỳ"], ("tra cứu điểm",), 1),
+    (("hủy học phần",), ["hủy học phần", "đăng ký nhầm"], ("hủy học phần",), 1),
+    (("gửi tin nhắn",), ["gửi tin nhắn", "người quản trị"], ("gửi tin nhắn",), 1),
+    (("tổng số tín chỉ", "khối lượng học tập tối thiểu"), ["tổng số tín chỉ", "khối lượng học tập tối thiểu", "chương trình đào tạo", "kỹ sư", "trình độ bậc 7", "cử nhân", "điều 3"], ("tổng số tín chỉ",), 1),
+]
+
+# Mở rộng từ khóa đưa vào prompt của create_task
+PROMPT_EXPANSIONS = [
+    (("khoa", "ngành học", "liệt kê"), FACULTY_KEYWORDS, (), 0),
+    (tuple(MAJORS_LOWER), MAJORS_IN_QUERY, (), 0),
+    (TUITION_TRIGGERS, TUITION_KEYWORDS, (), 0),
+    *[(triggers, keywords, (), 0) for triggers, keywords in COURSE_EXPANSIONS],
+    (("nội trú", "ngoại trú"), ["nội trú", "ngoại trú", "ký túc xá", "thuê trọ", "ở trong trường", "ở ngoài trường"], (), 0),
+    (("điều kiện nhập học",), ["điều kiện nhập học", "yêu cầu nhập học", "điểm chuẩn", "xét tuyển"], (), 0),
+    (("chương trình đào tạo",), ["chương trình đào tạo", "tín chỉ", "môn học", "kỹ sư", "cử nhân"], (), 0),
+    (("hoạt động ngoại khóa",), ["hoạt động ngoại khóa", "điểm ngoại khóa", "sự kiện sinh viên"], (), 0),
+]
+
+# Điểm cộng khi chấm lại kết quả: (cụm cần có trong câu hỏi hoặc None, cần có ít nhất một
+# cụm trong kết quả, cần có tất cả cụm trong kết quả, trọng số: tên chủ đề hoặc hằng số)
+RESULT_BOOSTS = [
+    (("khoa",), ("khoa",), (), "khoa"),
+    (("ngành học",), tuple(MAJORS_LOWER), (), "ngành học"),
+    (("liệt kê",), ("khoa",), (), "khoa"),
+    (None, ("cơ cấu tổ chức",), (), 10),  # Ưu tiên cao cho các đoạn văn chứa danh sách khoa
+    (("học phí",), ("đồng/tín chỉ",), (), "học phí"),
+    (("xếp loại học lực",), ("điểm trung bình tích lũy",), (), "xếp loại học lực"),
+    (("xếp hạng học lực",), ("điểm trung bình tích lũy",), (), "xếp hạng học lực"),
+    (("đăng nhập",), ("hệ thống",), (), "đăng nhập"),
+    (("đổi mật khẩu",), ("quản lý tài khoản",), (), "đổi mật khẩu"),
+    (("đăng ký học",), ("hệ thống",), (), "đăng ký học"),
+    (("thanh toán học phí",), ("hệ thống",), (), "thanh toán học phí"),
+    (None, ("tổng số tín chỉ", "khối lượng học tập tối thiểu"), (), "tổng số tín chỉ"),
+    (None, (), ("trình độ bậc 7 kỹ sư", "tín chỉ"), 3),
+]
+
+# Các cụm khác create_task kiểm tra trong câu hỏi/kết quả
+EXTRA_PHRASES = [
+    "liệt kê các ngành học", "danh sách ngành học", "ký túc xá", "thuê trọ", "môn học",
+    "yêu cầu nhập học", "điểm chuẩn", "điểm ngoại khóa",
+]
+
+
+class KeywordMatcher:
+    """Bộ so khớp nhiều cụm từ biên dịch một lần (tương đương Aho-Corasick).
+
+    Một regex lookahead duy nhất tìm cụm dài nhất bắt đầu tại mỗi vị trí; các cụm là
+    chuỗi con của cụm đó được bổ sung từ bảng bao đóng tính sẵn, nên kết quả giống hệt
+    việc kiểm tra `cụm in văn bản` cho từng cụm.
+    """
+
+    def __init__(self, patterns):
+        self.patterns = sorted({pattern.lower() for pattern in patterns if pattern}, key=len, reverse=True)
+        self._regex = re.compile("(?=(%s))" % "|".join(map(re.escape, self.patterns)))
+        self._closure = {
+            pattern: frozenset(other for other in self.patterns if other in pattern)
+            for pattern in self.patterns
+        }
+
+    def find(self, text):
+        """Tập các cụm xuất hiện trong văn bản (văn bản cần chuyển chữ thường trước)."""
+        hits = set()
+        for match in self._regex.finditer(text):
+            longest = match.group(1)
+            if longest not in hits:
+                hits |= self._closure[longest]
+        return hits
+
+
+def _vocabulary():
+    phrases = list(MAJORS_LOWER) + EXTRA_PHRASES
+    for words in KEYWORDS.values():
+        phrases.extend(words)
+    for triggers, keywords, topics, _ in SEARCH_EXPANSIONS + PROMPT_EXPANSIONS:
+        phrases.extend(triggers)
+        phrases.extend(keywords or [])
+        phrases.extend(topics)
+    for query_any, result_any, result_all, _ in RESULT_BOOSTS:
+        phrases.extend(query_any or ())
+        phrases.extend(result_any)
+        phrases.extend(result_all)
+    return phrases
+
+
+MATCHER = KeywordMatcher(_vocabulary())
+
+
+def expand_keywords(query_hits, expansions, relevant_keywords=None):
+    """Áp dụng bảng mở rộng; trả về (từ khóa liên quan, danh sách (chủ đề, mức tăng)).
+
+    relevant_keywords mặc định là từ khóa của chủ đề đầu tiên trong KEYWORDS khớp với câu hỏi.
+    """
+    if relevant_keywords is None:
+        relevant_keywords = []
+        for topic, words in KEYWORDS.items():
+            if query_hits & KEYWORD_SETS[topic]:
+                relevant_keywords.extend(words)
+                break
+    boosts = []
+    for triggers, keywords, topics, increment in expansions:
+        if keywords is MAJORS_IN_QUERY:
+            relevant_keywords.extend(major for major in MAJORS if major.lower() in query_hits)
+            continue
+        if not query_hits.isdisjoint(triggers):
+            relevant_keywords.extend(keywords)
+            if topics:
+                boosts.append((topics, increment))
+    return relevant_keywords, boosts
+
+
+# Đặc trưng của một đoạn văn: mỗi cụm trong MATCHER một cột, thêm một cột cho mỗi luật
+# RESULT_BOOSTS mà điều kiện phía kết quả được thỏa. Tính một lần khi ingest và lưu vào
+# payload ("features" là chỉ số các cột bật), nên khi truy vấn chỉ còn một phép nhân ma trận.
+FEATURE_PHRASES = tuple(sorted(MATCHER.patterns))
+FEATURE_INDEX = {phrase: column for column, phrase in enumerate(FEATURE_PHRASES)}
+BOOST_OFFSET = len(FEATURE_PHRASES)
+FEATURE_SIZE = BOOST_OFFSET + len(RESULT_BOOSTS)
+# Phiên bản bảng đặc trưng: đổi từ khóa hoặc luật thì đặc trưng đã lưu không còn dùng được
+FEATURE_VERSION = hashlib.sha1(json.dumps(
+    [FEATURE_PHRASES, [(rule[1], rule[2]) for rule in RESULT_BOOSTS]], ensure_ascii=False
+).encode('utf-8')).hexdigest()[:12]
+
+
+def extract_features(text, hits=None):
+    """Danh sách chỉ số cột đặc trưng của văn bản (đã sắp xếp)."""
+    hits = MATCHER.find(text.lower()) if hits is None else hits
+    columns = [FEATURE_INDEX[phrase] for phrase in hits]
+    for rule, (_, result_any, result_all, _) in enumerate(RESULT_BOOSTS):
+        if result_any and hits.isdisjoint(result_any):
+            continue
+        if result_all and not all(phrase in hits for phrase in result_all):
+            continue
+        columns.append(BOOST_OFFSET + rule)
+    return sorted(columns)
+
+
+def payload_features(payload):
+    """Đặc trưng đã lưu trong payload; tính lại từ văn bản nếu thiếu hoặc khác phiên bản."""
+    if payload.get("feature_version") == FEATURE_VERSION and payload.get("features") is not None:
+        return payload["features"]
+    return extract_features(payload["text"])
+
+
+def feature_matrix(feature_rows):
+    """Ma trận nhị phân (n, FEATURE_SIZE) từ các danh sách chỉ số cột."""
+    matrix = np.zeros((len(feature_rows), FEATURE_SIZE), dtype=np.float32)
+    for row, columns in enumerate(feature_rows):
+        matrix[row, columns] = 1.0
+    return matrix
+
+
+def query_weights(query_hits, relevant_keywords, priority_weights):
+    """Vector trọng số của câu hỏi: số lần mỗi cụm có trong relevant_keywords, cộng trọng số
+    của các luật RESULT_BOOSTS mà điều kiện phía câu hỏi được thỏa."""
+    weights = np.zeros(FEATURE_SIZE, dtype=np.float64)
+    for keyword in relevant_keywords:
+        column = FEATURE_INDEX.get(keyword)
+        if column is not None:
+            weights[column] += 1
+    for rule, (query_any, _, _, weight) in enumerate(RESULT_BOOSTS):
+        if query_any and query_hits.isdisjoint(query_any):
+            continue
+        weights[BOOST_OFFSET + rule] = priority_weights[weight] if isinstance(weight, str) else weight
+    return weights
+
+
+def keyword_scores(payloads, weights):
+    """Điểm từ khóa của các kết quả: ma trận đặc trưng nhân với vector trọng số câu hỏi."""
+    if not payloads:
+        return np.zeros(0)
+    return feature_matrix([payload_features(payload) for payload in payloads]) @ weights
+
+
+# Câu hỏi xin danh sách ngành: "liệt kê các ngành học", "trường có những ngành nào", "ICTU đào
+# tạo bao nhiêu ngành", ... (không khớp "ngành nào có học phí thấp nhất", "các ngành" đơn lẻ)
+MAJORS_LIST_PATTERN = re.compile(
+    r"(liệt kê|danh sách|kể tên|tất cả)\s+(các\s+|những\s+)?ngành"
+    r"|(có|gồm|đào tạo)\s+(những|các|bao nhiêu)\s+ngành"
+    r"|(có|gồm|đào tạo)\s+ngành\s+(học\s+)?(nào|gì)"
+    r"|bao nhiêu\s+ngành"
+)
+
+
+def is_majors_list_question(query, hits=None):
+    """Câu hỏi chỉ xin danh sách ngành học: khớp MAJORS_LIST_PATTERN, không nêu ngành cụ thể và
+    không hỏi học phí."""
+    query = query.lower()
+    hits = MATCHER.find(query) if hits is None else hits
+    if hits & MAJORS_LOWER or any(trigger in hits for trigger in TUITION_TRIGGERS):
+        return False
+    return MAJORS_LIST_PATTERN.search(query) is not None
+
+
+def detect_topics(text, hits=None):
+    """Danh sách các chủ đề trong KEYWORDS có ít nhất một từ khóa xuất hiện trong văn bản."""
+    hits = MATCHER.find(text.lower()) if hits is None else hits
+    return [topic for topic, words in KEYWORD_SETS.items() if hits & words]
+
+
+def payload_matches(payload, topics=None, text_terms=None):
+    """Điều kiện lọc giống Filter(should=...) của Qdrant: khớp một chủ đề hoặc chứa một cụm từ."""
+    if not topics and not text_terms:
+        return True
+    if topics:
+        point_topics = payload.get("topics")
+        if point_topics is None:
+            point_topics = detect_topics(payload["text"])
+        if set(topics) & set(point_topics):
+            return True
+    if text_terms:
+        text_lower = payload["text"].lower()
+        return any(term.lower() in text_lower for term in text_terms)
+    return False
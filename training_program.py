@@ -0,0 +1,34 @@
+# training_program.py
+# Bảng học phí (đồng/tín chỉ) và các ngành của chương trình đào tạo đại trà
+TRAINING_PROGRAM = {
+    "II: Nghệ thuật": {
+        "majors": ["Thiết kế đồ họa"],
+        "Khóa 17": 372000,
+        "Khóa 18-19": 369200,
+        "Khóa 20-21": 387000
+    },
+    "III: Kinh doanh và quản lý, pháp luật": {
+        "majors": ["Hệ thống thông tin quản lý", "Quản trị văn phòng", "Thương mại điện tử", "Kinh tế số"],
+        "Khóa 17": 387500,
+        "Khóa 18-19": 384600,
+        "Khóa 20-21": 403200
+    },
+    "V: Máy tính và công nghệ thông tin, Công nghệ kỹ thuật…": {
+        "majors": [
+            "Công nghệ thông tin", "Khoa học máy tính", "Truyền thông và mạng máy tính", "Kỹ thuật phần mềm",
+            "Hệ thống thông tin", "An toàn thông tin", "Công nghệ kỹ thuật điện, điện tử",
+            "Công nghệ ô tô và Giao thông thông minh", "Công nghệ kỹ thuật điều khiển và tự động hóa",
+            "Công nghệ kỹ thuật máy tính", "Công nghệ kỹ thuật điện tử, viễn thông", "Kỹ thuật y sinh",
+            "Kỹ thuật cơ điện tử thông minh và robot"
+        ],
+        "Khóa 17": 453000,
+        "Khóa 18-19": 450000,
+        "Khóa 20-21": 467700
+    },
+    "VII: Báo chí và thông tin…": {
+        "majors": ["Truyền thông đa phương tiện", "Công nghệ truyền thông"],
+        "Khóa 17": 372000,
+        "Khóa 18-19": 369200,
+        "Khóa 20-21": 387000
+    }
+}
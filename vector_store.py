@@ -1,21 +1,111 @@
-from qdrant_client import QdrantClient
-from qdrant_client.http.models import Distance, VectorParams, PointStruct
+from qdrant_client import QdrantClient, AsyncQdrantClient
+from qdrant_client.http.models import (
+    Distance, VectorParams, PointStruct, PointIdsList, Filter, FieldCondition, MatchAny, MatchText,
+    PayloadSchemaType, TextIndexParams, TextIndexType, TokenizerType,
+    SparseVectorParams, SparseVector, Modifier, Prefetch, FusionQuery, Fusion, SearchRequest, QueryRequest,
+    PointVectors
+)
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from collections import namedtuple
+import numpy as np
+import asyncio
+import json
+import uuid
+import time
 import os
 from dotenv import load_dotenv
-from embeddings import EmbeddingHandler
+from embeddings import EmbeddingHandler, content_hash
+from embedding_store import is_store, convert_pickle, embeddings_fingerprint, saved_fingerprint
+from ann_index import IVFIndex, build_index
+from text_features import MATCHER, detect_topics, payload_matches, extract_features, FEATURE_VERSION
+from sparse_index import BM25Index, SPARSE_VECTOR_NAME, reciprocal_rank_fusion, normalize_fused_scores
 
 load_dotenv()
 
+# Namespace cố định để UUID của mỗi điểm không đổi giữa các lần chạy
+POINT_ID_NAMESPACE = uuid.UUID("6f0c1f3e-5a7b-4c55-9a3e-2d8f4b1e7c90")
+# Các trường payload trả về khi tìm kiếm (đặc trưng dùng để chấm lại điểm trong search_data)
+SEARCH_PAYLOAD_FIELDS = ["text", "metadata", "features", "feature_version"]
+# Phiên bản dữ liệu lưu trong một điểm của collection "<tên>_state", dùng chung giữa tiến trình
+# ingest và tiến trình phục vụ; tiến trình phục vụ đọc lại tối đa mỗi GENERATION_REFRESH_INTERVAL giây
+STATE_POINT_ID = 1
+GENERATION_REFRESH_INTERVAL = float(os.getenv("GENERATION_REFRESH_INTERVAL", "5"))
+# Lưu tối đa ngần này ID đã đổi trong phiên bản; nhiều hơn thì coi như toàn bộ dữ liệu đã đổi
+MAX_CHANGED_IDS = 10000
+
+
+def record_hash(text, metadata):
+    """Hash nội dung và metadata của một đoạn: đổi một trong hai thì sync upsert lại điểm."""
+    return content_hash(f"{text}\n{json.dumps(metadata, ensure_ascii=False, sort_keys=True, default=str)}")
+
+
+def stable_point_ids(texts, metadata, key_field=None, occurrences=None):
+    """Tạo ID ổn định (UUID5) cho từng đoạn.
+
+    Mặc định ID lấy từ hash nội dung; nếu truyền key_field (ví dụ 'regulation') thì ID lấy
+    từ giá trị trường đó kèm số thứ tự của đoạn trong cùng điều khoản, nên sửa nội dung
+    không làm đổi ID. Các đoạn trùng nội dung được đánh số theo thứ tự xuất hiện để mỗi
+    đoạn (và metadata của nó) là một điểm riêng.
+
+    occurrences là bộ đếm số lần đã gặp mỗi khóa; truyền cùng một dict khi tạo ID cho từng
+    phần dữ liệu liên tiếp (ingest theo từng phần) để kết quả giống như tạo một lần.
+    """
+    ids = []
+    occurrences = {} if occurrences is None else occurrences
+    for text, meta in zip(texts, metadata):
+        key_value = meta.get(key_field) if key_field and isinstance(meta, dict) else None
+        key = f"{key_field}:{key_value}" if key_value else f"hash:{content_hash(text)}"
+        occurrences[key] = count = occurrences.get(key, 0) + 1
+        if key_value or count > 1:
+            # Đoạn trùng nội dung: đoạn đầu giữ ID theo hash, các bản sau được đánh số từ #2
+            key = f"{key}#{count}"
+        ids.append(str(uuid.uuid5(POINT_ID_NAMESPACE, key)))
+    return ids
+
+
+def text_payload(text, metadata, features=None):
+    """Payload của một đoạn: chủ đề và đặc trưng từ khóa được tính một lần khi ingest."""
+    hits = MATCHER.find(text.lower())
+    return {"text": text, "metadata": metadata, "content_hash": content_hash(text),
+            "record_hash": record_hash(text, metadata),
+            "topics": detect_topics(text, hits),
+            "features": features if features is not None else extract_features(text, hits),
+            "feature_version": FEATURE_VERSION}
+
+
+def build_filter(topics=None, text_terms=None):
+    """Bộ lọc Qdrant: điểm thuộc một trong các chủ đề hoặc chứa một trong các cụm từ."""
+    conditions = []
+    if topics:
+        conditions.append(FieldCondition(key="topics", match=MatchAny(any=list(topics))))
+    for term in text_terms or []:
+        conditions.append(FieldCondition(key="text", match=MatchText(text=term)))
+    return Filter(should=conditions) if conditions else None
+
+
 class VectorStore:
-    def __init__(self, collection_name="ictu_handbook"):
-        # Khởi tạo client Qdrant với timeout tăng lên
-        self.client = QdrantClient(
+    def __init__(self, collection_name="ictu_handbook", sparse_index=None, client=None, async_client=None):
+        # Khởi tạo client Qdrant với timeout tăng lên (hoặc dùng client truyền vào, ví dụ
+        # QdrantClient(":memory:") khi chạy offline)
+        self._client_from_env = client is None
+        self.client = client or QdrantClient(
             url=os.getenv("QDRANT_URL"),
             api_key=os.getenv("QDRANT_API_KEY"),
             timeout=60  # Tăng timeout lên 60 giây
         )
         self.collection_name = collection_name
         self.vector_size = 768  # Kích thước vector
+        # Chỉ mục BM25 dùng để tạo sparse vector khi ingest (truy vấn không cần)
+        self.sparse_index = sparse_index
+        # Client async truyền vào; nếu không có và client đồng bộ cũng được truyền vào thì
+        # asearch/ahybrid_search chạy bản đồng bộ trong luồng riêng
+        self._async_client = async_client
+        # Collection có cấu hình sparse vector bm25 hay không (None: chưa kiểm tra)
+        self._write_sparse = None
+        # Phiên bản dữ liệu đọc từ collection trạng thái (xem generation) và thời điểm đọc
+        self.state_collection = f"{collection_name}_state"
+        self._state = None
+        self._state_read_at = 0.0
 
     def create_collection(self):
         """Tạo hoặc tái tạo collection trong Qdrant."""
@@ -31,15 +121,221 @@ class VectorStore:
                 vectors_config=VectorParams(
                     size=self.vector_size,
                     distance=Distance.COSINE
-                )
+                ),
+                # Sparse vector BM25: IDF được Qdrant tính trên toàn collection
+                sparse_vectors_config={SPARSE_VECTOR_NAME: SparseVectorParams(modifier=Modifier.IDF)}
             )
             print(f"✅ Đã tạo collection {self.collection_name} thành công với vector_size = {self.vector_size}.")
+            self._write_sparse = None
+            self.mark_changed()
+            self.create_payload_indexes()
         except Exception as e:
             print(f"❌ Lỗi khi tạo collection: {e}")
             raise
 
-    def upsert_vectors(self, texts, embeddings, metadata, batch_size=100):
-        """Lưu trữ vectors vào Qdrant theo batch."""
+    def ensure_collection(self):
+        """Tạo collection nếu chưa có, giữ nguyên dữ liệu nếu đã tồn tại.
+
+        Collection tạo trước khi có tìm kiếm kết hợp không có sparse vector bm25 nên không nhận
+        được sparse vectors; khi cần ghi sparse vectors, collection đó được tạo lại (sync sau đó
+        ghi lại toàn bộ điểm).
+        """
+        if not self.client.collection_exists(collection_name=self.collection_name):
+            self.create_collection()
+        elif self.sparse_index is not None and not self._has_sparse_config():
+            print(f"⚠️ Collection {self.collection_name} chưa có sparse vector {SPARSE_VECTOR_NAME}, tạo lại...")
+            self.create_collection()
+        else:
+            self.create_payload_indexes()
+
+    def _has_sparse_config(self):
+        info = self.client.get_collection(collection_name=self.collection_name)
+        return SPARSE_VECTOR_NAME in (info.config.params.sparse_vectors or {})
+
+    @property
+    def write_sparse(self):
+        """Có ghi sparse vectors BM25 khi upsert hay không: cần chỉ mục BM25 và collection có
+        cấu hình sparse bm25; nếu không chỉ ghi dense vectors."""
+        if self.sparse_index is None:
+            return False
+        if self._write_sparse is None:
+            self._write_sparse = self._has_sparse_config()
+            if not self._write_sparse:
+                print(f"⚠️ Collection {self.collection_name} chưa có sparse vector {SPARSE_VECTOR_NAME}, "
+                      f"chỉ lưu dense vectors (chạy sync hoặc create_collection để bật tìm kiếm kết hợp).")
+        return self._write_sparse
+
+    def _read_state(self):
+        if not self.client.collection_exists(collection_name=self.state_collection):
+            return {}
+        points = self.client.retrieve(collection_name=self.state_collection, ids=[STATE_POINT_ID],
+                                      with_payload=True, with_vectors=False)
+        return dict(points[0].payload or {}) if points else {}
+
+    @property
+    def state(self):
+        now = time.monotonic()
+        if self._state is None or now - self._state_read_at >= GENERATION_REFRESH_INTERVAL:
+            try:
+                self._state = self._read_state()
+            except Exception as e:
+                print(f"⚠️ Không đọc được phiên bản dữ liệu: {e}")
+                self._state = self._state or {}
+            self._state_read_at = now
+        return self._state
+
+    @property
+    def generation(self):
+        """Phiên bản dữ liệu, đổi mỗi khi collection được ghi (ở bất kỳ tiến trình nào), để các
+        cache phía trên biết cần làm mới; None nếu collection chưa từng được ghi qua VectorStore."""
+        return self.state.get("generation")
+
+    def changes_since(self, generation):
+        """(ID các điểm đã thêm, sửa hoặc xóa; ID các điểm mới thêm) khi chuyển từ generation sang
+        phiên bản hiện tại; None nếu không biết (đã qua nhiều lần ghi, hoặc collection được tạo lại)."""
+        state = self.state
+        if generation is None or state.get("previous") != generation or state.get("changed_ids") is None:
+            return None
+        return state["changed_ids"], state.get("added_ids") or []
+
+    def mark_changed(self, changed_ids=None, added_ids=()):
+        """Ghi phiên bản mới kèm các ID đã đổi và ID mới thêm; changed_ids=None nghĩa là mọi dữ
+        liệu cũ đều không còn đáng tin. Gọi sau upsert_vectors(..., mark_changed=False)."""
+        if changed_ids is not None and len(changed_ids) > MAX_CHANGED_IDS:
+            changed_ids = None
+        if not self.client.collection_exists(collection_name=self.state_collection):
+            self.client.create_collection(collection_name=self.state_collection,
+                                          vectors_config=VectorParams(size=1, distance=Distance.COSINE))
+        state = {"generation": uuid.uuid4().hex, "previous": self._read_state().get("generation"),
+                 "changed_ids": None if changed_ids is None else [str(point_id) for point_id in changed_ids],
+                 "added_ids": None if changed_ids is None else [str(point_id) for point_id in added_ids]}
+        self.client.upsert(collection_name=self.state_collection,
+                           points=[PointStruct(id=STATE_POINT_ID, vector=[1.0], payload=state)], wait=True)
+        self._state, self._state_read_at = state, time.monotonic()
+
+    def create_payload_indexes(self):
+        """Tạo chỉ mục full-text cho text và chỉ mục keyword cho chủ đề/điều khoản để lọc phía server."""
+        self.client.create_payload_index(
+            collection_name=self.collection_name,
+            field_name="text",
+            field_schema=TextIndexParams(
+                type=TextIndexType.TEXT,
+                tokenizer=TokenizerType.WORD,  # Tiếng Việt tách âm tiết bằng khoảng trắng
+                min_token_len=2,
+                lowercase=True,
+            ),
+        )
+        for field_name in ("topics", "metadata.regulation"):
+            self.client.create_payload_index(
+                collection_name=self.collection_name,
+                field_name=field_name,
+                field_schema=PayloadSchemaType.KEYWORD,
+            )
+
+    def _existing_hashes(self, page_size=1000):
+        # Đọc ID, record_hash và tham số BM25 của toàn bộ điểm hiện có (không tải vectors); điểm
+        # ghi trước khi có record_hash không khớp nên được upsert lại một lần
+        existing = {}
+        offset = None
+        while True:
+            points, offset = self.client.scroll(
+                collection_name=self.collection_name,
+                limit=page_size,
+                offset=offset,
+                with_payload=["record_hash", "bm25_params"],
+                with_vectors=False,
+            )
+            for point in points:
+                payload = point.payload or {}
+                existing[str(point.id)] = (payload.get("record_hash"), payload.get("bm25_params"))
+            if offset is None:
+                return existing
+
+    def sync(self, texts, embeddings, metadata, key_field=None, batch_size=100, parallelism=4):
+        """Đồng bộ collection với dữ liệu hiện tại: chỉ upsert điểm mới/đã đổi và xóa điểm cũ.
+
+        Trọng số tf của sparse vector BM25 phụ thuộc avgdl của cả corpus; khi avgdl đổi, sparse
+        vector của các điểm không đổi nội dung được tính lại và ghi đè (không gửi lại dense vectors).
+        """
+        self.ensure_collection()
+        ids = stable_point_ids(texts, metadata, key_field)
+        existing = self._existing_hashes()
+
+        rows = {}
+        for row, point_id in enumerate(ids):
+            rows[point_id] = row  # ID trùng: giữ đoạn cuối cùng
+        changed = [row for point_id, row in rows.items()
+                   if existing.get(point_id, (None, None))[0] != record_hash(texts[row], metadata[row])]
+        stale = [point_id for point_id in existing if point_id not in rows]
+        added = sum(1 for row in changed if ids[row] not in existing)
+        reweighted = []
+        if self.write_sparse:
+            params_key = self.sparse_index.params_key()
+            changed_rows = set(changed)
+            reweighted = [row for point_id, row in rows.items()
+                          if row not in changed_rows and existing[point_id][1] != params_key]
+
+        batches = (
+            (
+                [ids[row] for row in chunk],
+                [texts[row] for row in chunk],
+                np.asarray([embeddings[row] for row in chunk], dtype=np.float32),
+                [metadata[row] for row in chunk],
+            )
+            for chunk in (changed[start:start + batch_size] for start in range(0, len(changed), batch_size))
+        )
+        if changed:
+            self._upsert_batches(batches, parallelism)
+        for start in range(0, len(reweighted), batch_size):
+            self._reweight_sparse([ids[row] for row in reweighted[start:start + batch_size]],
+                                  [texts[row] for row in reweighted[start:start + batch_size]])
+        for start in range(0, len(stale), batch_size):
+            self.client.delete(
+                collection_name=self.collection_name,
+                points_selector=PointIdsList(points=stale[start:start + batch_size]),
+                wait=True,
+            )
+        if changed or stale or reweighted:
+            self.mark_changed([ids[row] for row in changed] + stale,
+                               [ids[row] for row in changed if ids[row] not in existing])
+        summary = {"added": added, "updated": len(changed) - added, "deleted": len(stale),
+                   "unchanged": len(rows) - len(changed), "reweighted": len(reweighted)}
+        print(f"✅ Đồng bộ {self.collection_name}: thêm {summary['added']}, cập nhật {summary['updated']}, "
+              f"xóa {summary['deleted']}, giữ nguyên {summary['unchanged']} "
+              f"(tính lại BM25 cho {summary['reweighted']}).")
+        return summary
+
+    def _reweight_sparse(self, ids, texts):
+        # Ghi đè sparse vector BM25 của các điểm đã có theo avgdl hiện tại
+        self.client.update_vectors(
+            collection_name=self.collection_name,
+            points=[
+                PointVectors(id=point_id,
+                             vector={SPARSE_VECTOR_NAME: self._sparse_vector(self.sparse_index.doc_vector(text))})
+                for point_id, text in zip(ids, texts)
+            ],
+            wait=True,
+        )
+        self.client.set_payload(
+            collection_name=self.collection_name,
+            payload={"bm25_params": self.sparse_index.params_key()},
+            points=ids,
+            wait=True,
+        )
+
+    def upsert_vectors(self, texts, embeddings, metadata, batch_size=100, occurrences=None, parallelism=4,
+                       max_retries=3, features=None, mark_changed=True):
+        """Lưu trữ vectors vào Qdrant theo batch, ID giống sync (stable_point_ids); trả về danh sách ID.
+
+        Khi upsert dữ liệu theo từng phần, truyền cùng một dict occurrences cho mọi phần để ID
+        của các đoạn trùng nội dung giữa các phần không đè lên nhau, và mark_changed=False để
+        chỉ ghi phiên bản dữ liệu một lần (mark_changed) sau phần cuối.
+        features là đặc trưng từ khóa đã tính sẵn; mặc định tính từ văn bản.
+
+        Các batch được tạo trong khi những batch trước đang gửi, tối đa parallelism batch
+        gửi cùng lúc (không chờ Qdrant áp dụng); batch cuối gửi với wait=True để đảm bảo
+        toàn bộ dữ liệu đã được ghi khi hàm trả về.
+        """
         if embeddings is None or len(embeddings) == 0:
             print("❌ Không có embeddings để lưu trữ.")
             return
@@ -49,66 +345,575 @@ class VectorStore:
             if embeddings is not None and len(embeddings) > 0:
                 print(f"Kích thước của embedding đầu tiên: {len(embeddings[0])} chiều.")
 
-            # Chia dữ liệu thành các batch
             total_vectors = len(embeddings)
-            for start_idx in range(0, total_vectors, batch_size):
-                end_idx = min(start_idx + batch_size, total_vectors)
-                batch_texts = texts[start_idx:end_idx]
-                batch_embeddings = embeddings[start_idx:end_idx]
-                batch_metadata = metadata[start_idx:end_idx]
-
-                # Tạo points cho batch hiện tại
-                points = [
-                    PointStruct(
-                        id=idx,
-                        vector=embedding.tolist(),
-                        payload={"text": text, "metadata": meta}
-                    )
-                    for idx, (text, embedding, meta) in enumerate(zip(batch_texts, batch_embeddings, batch_metadata), start=start_idx)
-                ]
-
-                # Upsert batch
-                self.client.upsert(
-                    collection_name=self.collection_name,
-                    points=points
+            ids = stable_point_ids(texts, metadata, occurrences=occurrences)
+            batches = (
+                (
+                    ids[start_idx:start_idx + batch_size],
+                    texts[start_idx:start_idx + batch_size],
+                    embeddings[start_idx:start_idx + batch_size],
+                    metadata[start_idx:start_idx + batch_size],
+                    features[start_idx:start_idx + batch_size] if features is not None else None,
                 )
-                print(f"✅ Đã lưu trữ batch {start_idx // batch_size + 1}: {len(points)} vectors (từ {start_idx} đến {end_idx - 1}).")
+                for start_idx in range(0, total_vectors, batch_size)
+            )
+            self._upsert_batches(batches, parallelism, max_retries)
+            if mark_changed:
+                # Không đọc lại collection để biết điểm nào đã có sẵn: coi mọi điểm là mới
+                self.mark_changed(ids, ids)
 
-            print(f"✅ Đã lưu trữ toàn bộ {total_vectors} vectors vào Qdrant thành công.")
             # In thông tin mẫu của vector đầu tiên
             if total_vectors > 0:
                 print("\nMẫu vector đầu tiên đã lưu trữ:")
-                print(f"ID: 4")
-                print(f"Text: {texts[30][:100]}...")  # In 100 ký tự đầu tiên
-                print(f"Metadata: {metadata[30]}")
+                print(f"ID: {ids[0]}")
+                print(f"Text: {texts[0][:100]}...")  # In 100 ký tự đầu tiên
+                print(f"Metadata: {metadata[0]}")
+            return ids
         except Exception as e:
             print(f"❌ Lỗi khi lưu trữ vectors: {e}")
             raise
 
-    def search(self, query_embedding, top_k=5):
-        """Tìm kiếm vectors trong Qdrant."""
-        try:
-            results = self.client.search(
-                collection_name=self.collection_name,
-                query_vector=query_embedding.tolist(),
-                limit=top_k
+    @staticmethod
+    def _sparse_vector(vector):
+        indices, values = vector
+        return SparseVector(indices=indices, values=values)
+
+    def _build_points(self, ids, texts, embeddings, metadata, features=None):
+        # Chuyển cả batch sang list một lần thay vì gọi .tolist() cho từng vector
+        vectors = np.asarray(embeddings, dtype=np.float32).tolist()
+        if self.write_sparse:
+            vectors = [
+                {"": vector, SPARSE_VECTOR_NAME: self._sparse_vector(self.sparse_index.doc_vector(text))}
+                for vector, text in zip(vectors, texts)
+            ]
+        points = [
+            PointStruct(id=point_id, vector=vector, payload=text_payload(text, meta, point_features))
+            for point_id, text, vector, meta, point_features
+            in zip(ids, texts, vectors, metadata, features if features is not None else [None] * len(ids))
+        ]
+        if self.write_sparse:
+            # Ghi lại tham số BM25 đã dùng để sync biết khi nào cần tính lại sparse vector
+            params_key = self.sparse_index.params_key()
+            for point in points:
+                point.payload["bm25_params"] = params_key
+        return points
+
+    def _upsert_with_retry(self, points, wait_applied, max_retries):
+        for attempt in range(max_retries + 1):
+            try:
+                self.client.upsert(collection_name=self.collection_name, points=points, wait=wait_applied)
+                return len(points)
+            except Exception as e:
+                if attempt == max_retries:
+                    raise
+                delay = 0.5 * 2 ** attempt
+                print(f"⚠️ Lỗi khi lưu batch ({e}), thử lại sau {delay:.1f}s...")
+                time.sleep(delay)
+
+    def _upsert_batches(self, batches, parallelism=4, max_retries=3):
+        """Gửi các batch (ids, texts, embeddings, metadata[, features]) song song, trả về số vectors đã lưu."""
+        started = time.perf_counter()
+        stored = 0
+        last_points = None
+        with ThreadPoolExecutor(max_workers=parallelism) as executor:
+            in_flight = set()
+            for batch in batches:
+                points = self._build_points(*batch)
+                if last_points is not None:
+                    in_flight.add(executor.submit(self._upsert_with_retry, last_points, False, max_retries))
+                last_points = points
+                # Giới hạn số batch đang gửi để không tạo trước quá nhiều dữ liệu
+                if len(in_flight) >= parallelism:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    stored += sum(future.result() for future in done)
+            done, _ = wait(in_flight)
+            stored += sum(future.result() for future in done)
+        if last_points is not None:
+            # Các thao tác được Qdrant áp dụng theo thứ tự, chờ batch cuối là chờ toàn bộ
+            stored += self._upsert_with_retry(last_points, True, max_retries)
+        elapsed = time.perf_counter() - started
+        rate = stored / elapsed if elapsed > 0 else 0.0
+        print(f"✅ Đã lưu trữ toàn bộ {stored} vectors vào Qdrant thành công ({rate:.0f} vectors/giây).")
+        return stored
+
+    @property
+    def async_client(self):
+        """AsyncQdrantClient dùng cho asearch/ahybrid_search, tạo khi cần lần đầu từ cùng tham số
+        kết nối với client đồng bộ. Trả về None khi client đồng bộ được truyền vào mà không kèm
+        client async (không thể suy ra kết nối tương ứng)."""
+        if self._async_client is None and self._client_from_env:
+            self._async_client = AsyncQdrantClient(
+                url=os.getenv("QDRANT_URL"),
+                api_key=os.getenv("QDRANT_API_KEY"),
+                timeout=60
             )
+        return self._async_client
+
+    def _search_request(self, query_embedding, top_k, topics, text_terms):
+        return dict(
+            collection_name=self.collection_name,
+            query_vector=np.asarray(query_embedding, dtype=np.float32).tolist(),
+            query_filter=build_filter(topics, text_terms),
+            with_payload=SEARCH_PAYLOAD_FIELDS,
+            limit=top_k
+        )
+
+    def _hybrid_request(self, query_embedding, query_text, top_k, topics, text_terms, prefetch_limit):
+        prefetch_limit = prefetch_limit or max(top_k * 4, 20)
+        query_filter = build_filter(topics, text_terms)
+        return dict(
+            collection_name=self.collection_name,
+            prefetch=[
+                Prefetch(query=np.asarray(query_embedding, dtype=np.float32).tolist(),
+                         filter=query_filter, limit=prefetch_limit),
+                Prefetch(query=self._sparse_vector(BM25Index.query_vector(query_text)), using=SPARSE_VECTOR_NAME,
+                         filter=query_filter, limit=prefetch_limit),
+            ],
+            query=FusionQuery(fusion=Fusion.RRF),
+            with_payload=SEARCH_PAYLOAD_FIELDS,
+            with_vectors=[""],  # Vector dense (đã chuẩn hóa) để tính lại cosine cho dense_score
+            limit=top_k,
+        )
+
+    @staticmethod
+    def _fused_points(response, query_embedding):
+        query = np.asarray(query_embedding, dtype=np.float32)
+        query = query / max(float(np.linalg.norm(query)), 1e-12)
+        points = response.points
+        results = []
+        for point, score in zip(points, normalize_fused_scores([point.score for point in points])):
+            vector = point.vector.get("") if isinstance(point.vector, dict) else point.vector
+            dense_score = float(np.dot(np.asarray(vector, dtype=np.float32), query)) if vector else 0.0
+            results.append(FusedScoredPoint(point.id, score, point.payload, dense_score))
+        print(f"✅ Tìm kiếm kết hợp thành công. Tìm thấy {len(results)} kết quả.")
+        return results
+
+    def search(self, query_embedding, top_k=5, topics=None, text_terms=None):
+        """Tìm kiếm vectors trong Qdrant; topics/text_terms lọc ứng viên ngay trên server."""
+        try:
+            results = self.client.search(**self._search_request(query_embedding, top_k, topics, text_terms))
+            print(f"✅ Tìm kiếm thành công. Tìm thấy {len(results)} kết quả.")
+            return results
+        except Exception as e:
+            print(f"❌ Lỗi khi tìm kiếm: {e}")
+            return []
+
+    async def asearch(self, query_embedding, top_k=5, topics=None, text_terms=None):
+        """Phiên bản asyncio của search, dùng AsyncQdrantClient (hoặc search trong luồng riêng)."""
+        if self.async_client is None:
+            return await asyncio.to_thread(self.search, query_embedding, top_k, topics, text_terms)
+        try:
+            results = await self.async_client.search(**self._search_request(query_embedding, top_k, topics, text_terms))
             print(f"✅ Tìm kiếm thành công. Tìm thấy {len(results)} kết quả.")
             return results
         except Exception as e:
             print(f"❌ Lỗi khi tìm kiếm: {e}")
             return []
 
+    def search_batch(self, query_embeddings, top_k=5, topics=None):
+        """Tìm kiếm cho nhiều câu hỏi trong một lần gọi Qdrant; topics là danh sách chủ đề lọc
+        của từng câu hỏi (hoặc None)."""
+        topics = topics or [None] * len(query_embeddings)
+        requests = []
+        for query_embedding, query_topics in zip(query_embeddings, topics):
+            request = self._search_request(query_embedding, top_k, query_topics, None)
+            requests.append(SearchRequest(vector=request["query_vector"], filter=request["query_filter"],
+                                          with_payload=request["with_payload"], limit=top_k))
+        try:
+            results = self.client.search_batch(collection_name=self.collection_name, requests=requests)
+            print(f"✅ Tìm kiếm batch thành công cho {len(results)} câu hỏi.")
+            return results
+        except Exception as e:
+            print(f"❌ Lỗi khi tìm kiếm batch: {e}")
+            return [[] for _ in requests]
+
+    def hybrid_search_batch(self, query_embeddings, query_texts, top_k=5, topics=None, prefetch_limit=None):
+        """Tìm kiếm kết hợp dense + BM25 cho nhiều câu hỏi trong một lần gọi Qdrant."""
+        topics = topics or [None] * len(query_embeddings)
+        requests = []
+        for query_embedding, query_text, query_topics in zip(query_embeddings, query_texts, topics):
+            request = self._hybrid_request(query_embedding, query_text, top_k, query_topics, None, prefetch_limit)
+            request.pop("collection_name")
+            requests.append(QueryRequest(**request))
+        try:
+            responses = self.client.query_batch_points(collection_name=self.collection_name, requests=requests)
+            return [self._fused_points(response, query_embedding)
+                    for response, query_embedding in zip(responses, query_embeddings)]
+        except Exception as e:
+            print(f"❌ Lỗi khi tìm kiếm kết hợp batch: {e}")
+            return [[] for _ in requests]
+
+    def hybrid_search(self, query_embedding, query_text, top_k=5, topics=None, text_terms=None, prefetch_limit=None):
+        """Tìm kiếm kết hợp dense + BM25 trong một lần gọi, gộp bằng Reciprocal Rank Fusion."""
+        try:
+            return self._fused_points(self.client.query_points(
+                **self._hybrid_request(query_embedding, query_text, top_k, topics, text_terms, prefetch_limit)),
+                query_embedding)
+        except Exception as e:
+            print(f"❌ Lỗi khi tìm kiếm kết hợp: {e}")
+            return []
+
+    async def ahybrid_search(self, query_embedding, query_text, top_k=5, topics=None, text_terms=None,
+                             prefetch_limit=None):
+        """Phiên bản asyncio của hybrid_search, dùng AsyncQdrantClient (hoặc hybrid_search trong
+        luồng riêng)."""
+        if self.async_client is None:
+            return await asyncio.to_thread(self.hybrid_search, query_embedding, query_text, top_k, topics,
+                                           text_terms, prefetch_limit)
+        try:
+            return self._fused_points(await self.async_client.query_points(
+                **self._hybrid_request(query_embedding, query_text, top_k, topics, text_terms, prefetch_limit)),
+                query_embedding)
+        except Exception as e:
+            print(f"❌ Lỗi khi tìm kiếm kết hợp: {e}")
+            return []
+
+
+class _ThreadedAsyncSearch:
+    """asearch/ahybrid_search cho các store tính toán cục bộ: chạy bản đồng bộ trong luồng riêng
+    để phép nhân ma trận không chặn event loop."""
+
+    async def asearch(self, *args, **kwargs):
+        return await asyncio.to_thread(self.search, *args, **kwargs)
+
+    async def ahybrid_search(self, *args, **kwargs):
+        return await asyncio.to_thread(self.hybrid_search, *args, **kwargs)
+
+    def hybrid_search_batch(self, query_embeddings, query_texts, top_k=5, topics=None, prefetch_limit=None):
+        topics = topics or [None] * len(query_embeddings)
+        return [
+            self.hybrid_search(query_embedding, query_text, top_k, query_topics, prefetch_limit=prefetch_limit)
+            for query_embedding, query_text, query_topics in zip(query_embeddings, query_texts, topics)
+        ]
+
+
+# Kết quả tìm kiếm cục bộ, cùng dạng .id/.score/.payload với ScoredPoint của Qdrant
+LocalScoredPoint = namedtuple("LocalScoredPoint", ["id", "score", "payload"])
+# Kết quả tìm kiếm kết hợp: score là điểm RRF đã chuẩn hóa (dùng để xếp hạng, đoạn đầu luôn là 1.0),
+# dense_score là cosine thật giữa câu hỏi và đoạn văn (dùng để so với ngưỡng liên quan)
+FusedScoredPoint = namedtuple("FusedScoredPoint", ["id", "score", "payload", "dense_score"])
+
+
+class LocalVectorStore(_ThreadedAsyncSearch):
+    """Tìm kiếm cosine chính xác trong bộ nhớ bằng NumPy, cùng giao diện với VectorStore.
+
+    Dùng khi dữ liệu vừa RAM (như sổ tay ICTU) hoặc làm Qdrant giả lập khi chạy offline.
+    """
+
+    def __init__(self, collection_name="ictu_handbook", vector_size=768):
+        self.collection_name = collection_name
+        self.vector_size = vector_size
+        self.generation = 0
+        self._last_change = (None, None)  # (phiên bản trước, (ID đã đổi, ID mới)) của lần ghi gần nhất
+        self.create_collection()
+
+    @classmethod
+    def from_saved(cls, file_path='embeddings_data', collection_name="ictu_handbook"):
+        """Tạo store từ embeddings đã lưu bởi EmbeddingHandler.process_handbook."""
+        handler = EmbeddingHandler(cache_size=0)
+        texts, embeddings, metadata = handler.load_saved_embeddings(file_path)
+        store = cls(collection_name)
+        store.upsert_vectors(texts, embeddings, metadata, batch_size=max(len(texts), 1),
+                             features=handler.load_saved_features(file_path))
+        return store
+
+    def create_collection(self):
+        """Xóa toàn bộ dữ liệu hiện có."""
+        self._matrix = np.zeros((0, self.vector_size), dtype=np.float32)
+        self._pending = []
+        self._ids = []
+        self._payloads = []
+        self._id_to_row = {}
+        self._topic_rows = {}
+        self._sparse_index = None
+        self.mark_changed()
+
+    def ensure_collection(self):
+        """Giống VectorStore.ensure_collection; dữ liệu trong bộ nhớ luôn sẵn sàng."""
+
+    def mark_changed(self, changed_ids=None, added_ids=()):
+        """Giống VectorStore.mark_changed."""
+        self._last_change = (self.generation, None if changed_ids is None else (changed_ids, list(added_ids)))
+        self.generation += 1
+
+    def changes_since(self, generation):
+        """Giống VectorStore.changes_since."""
+        previous, changes = self._last_change
+        return changes if generation is not None and generation == previous else None
+
+    def _normalize(self, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return vectors / np.clip(norms, 1e-12, None)
+
+    def upsert_vectors(self, texts, embeddings, metadata, batch_size=100, occurrences=None, features=None,
+                       mark_changed=True):
+        """Thêm hoặc ghi đè vectors; ID được gán và trả về giống VectorStore.upsert_vectors.
+
+        features là đặc trưng từ khóa đã tính sẵn (ví dụ đọc từ store); mặc định tính từ văn bản.
+        """
+        if embeddings is None or len(embeddings) == 0:
+            print("❌ Không có embeddings để lưu trữ.")
+            return
+        ids = stable_point_ids(texts, metadata, occurrences=occurrences)
+        added_ids = [point_id for point_id in ids if point_id not in self._id_to_row]
+        for start_idx in range(0, len(embeddings), batch_size):
+            end_idx = min(start_idx + batch_size, len(embeddings))
+            rows = self._normalize(embeddings[start_idx:end_idx])
+            new_rows = []
+            for offset, (text, meta) in enumerate(zip(texts[start_idx:end_idx], metadata[start_idx:end_idx])):
+                point_id = ids[start_idx + offset]
+                payload = text_payload(text, meta, features[start_idx + offset] if features is not None else None)
+                row = self._id_to_row.get(point_id)
+                if row is None:
+                    row = len(self._ids)
+                    for topic in payload["topics"]:
+                        self._topic_rows.setdefault(topic, set()).add(row)
+                    self._id_to_row[point_id] = row
+                    self._ids.append(point_id)
+                    self._payloads.append(payload)
+                    new_rows.append(rows[offset])
+                else:
+                    # Ghi đè điểm đã có
+                    self._consolidate()
+                    self._matrix[row] = rows[offset]
+                    for topic in self._payloads[row]["topics"]:
+                        self._topic_rows[topic].discard(row)
+                    for topic in payload["topics"]:
+                        self._topic_rows.setdefault(topic, set()).add(row)
+                    self._payloads[row] = payload
+            if new_rows:
+                self._pending.append(np.stack(new_rows))
+        self._sparse_index = None  # Xây dựng lại BM25 ở lần tìm kiếm kết hợp tiếp theo
+        if mark_changed:
+            self.mark_changed(ids, added_ids)
+        print(f"✅ Đã lưu trữ {len(embeddings)} vectors vào bộ nhớ ({len(self._ids)} vectors).")
+        return ids
+
+    def _consolidate(self):
+        # Gộp các batch mới thêm vào ma trận chính (chỉ khi cần)
+        if self._pending:
+            self._matrix = np.vstack([self._matrix] + self._pending)
+            self._pending = []
+
+    def _filter_mask(self, topics=None, text_terms=None):
+        # Chỉ mục chủ đề -> dòng giúp lọc theo topics mà không quét payload
+        if not topics and not text_terms:
+            return None
+        mask = np.zeros(len(self._ids), dtype=bool)
+        for topic in topics or []:
+            mask[list(self._topic_rows.get(topic, ()))] = True
+        if text_terms:
+            mask |= np.fromiter((payload_matches(payload, text_terms=text_terms) for payload in self._payloads),
+                                dtype=bool, count=len(self._payloads))
+        return mask
+
+    def search(self, query_embedding, top_k=5, topics=None, text_terms=None):
+        """Tìm top_k vectors gần nhất theo cosine cho một câu hỏi."""
+        self._consolidate()
+        query = self._normalize(query_embedding)
+        scores = self._matrix @ query
+        mask = self._filter_mask(topics, text_terms)
+        if mask is not None:
+            scores = np.where(mask, scores, -np.inf)
+        results = self._top_k(scores, top_k)
+        print(f"✅ Tìm kiếm thành công. Tìm thấy {len(results)} kết quả.")
+        return results
+
+    def hybrid_search(self, query_embedding, query_text, top_k=5, topics=None, text_terms=None, prefetch_limit=None):
+        """Tìm kiếm kết hợp dense + BM25, gộp bằng Reciprocal Rank Fusion như VectorStore."""
+        self._consolidate()
+        if self._sparse_index is None:
+            self._sparse_index = BM25Index.build([payload["text"] for payload in self._payloads])
+        prefetch_limit = prefetch_limit or max(top_k * 4, 20)
+        mask = self._filter_mask(topics, text_terms)
+        scores = self._matrix @ self._normalize(query_embedding)
+        if mask is not None:
+            scores = np.where(mask, scores, -np.inf)
+        k = min(prefetch_limit, len(scores))
+        dense_rows = np.argpartition(-scores, k - 1)[:k] if k else np.array([], dtype=np.int64)
+        dense_rows = [int(row) for row in dense_rows[np.argsort(-scores[dense_rows])] if np.isfinite(scores[row])]
+        sparse_rows, _ = self._sparse_index.search(query_text, prefetch_limit if mask is None else len(scores))
+        if mask is not None:
+            sparse_rows = [row for row in sparse_rows if mask[row]][:prefetch_limit]
+        fused = reciprocal_rank_fusion([dense_rows, sparse_rows])[:top_k]
+        results = [FusedScoredPoint(self._ids[row], score, self._payloads[row], float(scores[row]))
+                   for row, score in fused]
+        print(f"✅ Tìm kiếm kết hợp thành công. Tìm thấy {len(results)} kết quả.")
+        return results
+
+    def search_batch(self, query_embeddings, top_k=5, topics=None):
+        """Tìm kiếm cho nhiều câu hỏi cùng lúc bằng một phép nhân ma trận."""
+        self._consolidate()
+        queries = self._normalize(query_embeddings)
+        scores = queries @ self._matrix.T
+        topics = topics or [None] * len(scores)
+        results = []
+        for row, query_topics in zip(scores, topics):
+            mask = self._filter_mask(query_topics)
+            results.append(self._top_k(row if mask is None else np.where(mask, row, -np.inf), top_k))
+        return results
+
+    def _top_k(self, scores, top_k):
+        k = min(top_k, len(scores))
+        if k <= 0:
+            return []
+        candidates = np.argpartition(-scores, k - 1)[:k]
+        candidates = candidates[np.argsort(-scores[candidates])]
+        return [LocalScoredPoint(self._ids[i], float(scores[i]), self._payloads[i])
+                for i in candidates if np.isfinite(scores[i])]
+
+
+class AnnVectorStore(_ThreadedAsyncSearch):
+    """Tìm kiếm gần đúng bằng chỉ mục IVF (ann_index) xây dựng từ embeddings đã lưu.
+
+    ID của kết quả là UUID ổn định (stable_point_ids) giống VectorStore/LocalVectorStore; bên trong
+    chỉ mục dùng vị trí dòng trong store embeddings. nprobe càng lớn thì recall càng cao nhưng độ
+    trễ càng lớn.
+    """
+
+    def __init__(self, index, texts, metadata, collection_name="ictu_handbook", features=None):
+        self.index = index
+        self.texts = texts
+        self.metadata = metadata
+        self.features = features
+        self.point_ids = stable_point_ids(texts, metadata)
+        self.generation = 0  # Chỉ đọc: dữ liệu không đổi trong suốt vòng đời đối tượng
+        self.collection_name = collection_name
+        self.vector_size = int(index.centroids.shape[1])
+        self._sparse_index = None
+        self._topic_rows = None  # Chủ đề -> các dòng, tạo khi tìm chính xác có lọc lần đầu
+
+    @property
+    def nprobe(self):
+        return self.index.nprobe
+
+    @nprobe.setter
+    def nprobe(self, value):
+        self.index.nprobe = value
+
+    @classmethod
+    def build(cls, embeddings_path='embeddings_data', index_dir='ivf_index', nlist=None, nprobe=8):
+        """Xây dựng chỉ mục từ embeddings đã lưu, in recall so với tìm kiếm chính xác và lưu xuống đĩa."""
+        handler = EmbeddingHandler(cache_size=0)
+        texts, embeddings, metadata = handler.load_saved_embeddings(embeddings_path)
+        index = build_index(embeddings, index_dir, nlist=nlist, nprobe=nprobe,
+                            fingerprint=cls.fingerprint(embeddings_path, embeddings))
+        return cls(index, texts, metadata, features=handler.load_saved_features(embeddings_path))
+
+    @staticmethod
+    def fingerprint(embeddings_path, embeddings):
+        # Store mới ghi sẵn fingerprint khi ghi; store cũ và file .pkl thì tính từ embeddings
+        return (saved_fingerprint(embeddings_path) if is_store(embeddings_path) else None) \
+            or embeddings_fingerprint(embeddings)
+
+    @classmethod
+    def load(cls, embeddings_path='embeddings_data', index_dir='ivf_index', nprobe=None):
+        """Mở chỉ mục đã lưu (mmap); xây dựng mới nếu chưa có hoặc không khớp với embeddings hiện tại."""
+        if not os.path.exists(os.path.join(index_dir, "index.json")):
+            return cls.build(embeddings_path, index_dir, nprobe=nprobe or 8)
+        handler = EmbeddingHandler(cache_size=0)
+        texts, embeddings, metadata = handler.load_saved_embeddings(embeddings_path)
+        try:
+            index = IVFIndex.load(index_dir, nprobe=nprobe, count=len(texts),
+                                  fingerprint=cls.fingerprint(embeddings_path, embeddings))
+        except ValueError as e:
+            print(f"⚠️ {e} Xây dựng lại chỉ mục...")
+            return cls.build(embeddings_path, index_dir, nprobe=nprobe or 8)
+        return cls(index, texts, metadata, features=handler.load_saved_features(embeddings_path))
+
+    def _payload(self, row):
+        payload = {"text": self.texts[row], "metadata": self.metadata[row]}
+        if self.features is not None:
+            payload.update(features=self.features[row], feature_version=FEATURE_VERSION)
+        return payload
+
+    def _search_rows(self, query_embedding, top_k, topics=None, text_terms=None, overfetch=4):
+        # (dòng, score) của top_k kết quả. Khi có bộ lọc thì lấy dư overfetch lần rồi lọc; nếu các
+        # cụm đã quét không đủ top_k đoạn khớp bộ lọc thì tính chính xác trên mọi đoạn khớp.
+        if not (topics or text_terms):
+            rows, scores = self.index.search(query_embedding, top_k)
+            return list(zip(rows, scores))
+        rows, scores = self.index.search(query_embedding, top_k * overfetch)
+        matched = [(row, score) for row, score in zip(rows, scores)
+                   if payload_matches(self._payload(row), topics, text_terms)]
+        if len(matched) >= top_k or len(rows) == len(self.texts):
+            return matched[:top_k]
+        rows = self._matching_rows(topics, text_terms)
+        scores = self.index.scores(query_embedding, rows)
+        return sorted(zip(rows, scores), key=lambda item: -item[1])[:top_k]
+
+    def _matching_rows(self, topics, text_terms):
+        # Các dòng khớp bộ lọc (giống payload_matches); chủ đề của từng đoạn chỉ tính một lần
+        if self._topic_rows is None:
+            self._topic_rows = {}
+            for row, text in enumerate(self.texts):
+                for topic in detect_topics(text):
+                    self._topic_rows.setdefault(topic, set()).add(row)
+        rows = set()
+        for topic in topics or []:
+            rows |= self._topic_rows.get(topic, set())
+        if text_terms:
+            terms = [term.lower() for term in text_terms]
+            rows.update(row for row, text in enumerate(self.texts) if any(term in text.lower() for term in terms))
+        return sorted(rows)
+
+    def search(self, query_embedding, top_k=5, topics=None, text_terms=None, overfetch=4):
+        """Tìm top_k vectors gần đúng theo cosine; khi có bộ lọc thì lấy dư overfetch lần rồi lọc,
+        và tìm chính xác trên các đoạn khớp bộ lọc nếu vẫn thiếu kết quả."""
+        results = [LocalScoredPoint(self.point_ids[row], score, self._payload(row))
+                   for row, score in self._search_rows(query_embedding, top_k, topics, text_terms, overfetch)]
+        print(f"✅ Tìm kiếm thành công. Tìm thấy {len(results)} kết quả.")
+        return results
+
+    def hybrid_search(self, query_embedding, query_text, top_k=5, topics=None, text_terms=None, prefetch_limit=None):
+        """Tìm kiếm kết hợp IVF + BM25, gộp bằng Reciprocal Rank Fusion."""
+        if self._sparse_index is None:
+            self._sparse_index = BM25Index.build(self.texts)
+        prefetch_limit = prefetch_limit or max(top_k * 4, 20)
+        dense_rows = [row for row, _ in self._search_rows(query_embedding, prefetch_limit, topics, text_terms)]
+        sparse_rows, _ = self._sparse_index.search(query_text, prefetch_limit * (4 if topics or text_terms else 1))
+        sparse_ranking = [row for row in sparse_rows if payload_matches(self._payload(row), topics, text_terms)]
+        fused = reciprocal_rank_fusion([dense_rows, sparse_ranking[:prefetch_limit]])[:top_k]
+        dense_scores = self.index.scores(query_embedding, [row for row, _ in fused])
+        return [FusedScoredPoint(self.point_ids[row], score, self._payload(row), dense_score)
+                for (row, score), dense_score in zip(fused, dense_scores)]
+
+    def search_batch(self, query_embeddings, top_k=5, topics=None):
+        topics = topics or [None] * len(query_embeddings)
+        return [self.search(query_embedding, top_k, query_topics)
+                for query_embedding, query_topics in zip(query_embeddings, topics)]
+
+
+def create_vector_store(backend=None, collection_name="ictu_handbook"):
+    """Tạo vector store theo VECTOR_BACKEND: 'qdrant' (mặc định), 'numpy' hoặc 'ivf'."""
+    backend = backend or os.getenv("VECTOR_BACKEND", "qdrant")
+    embeddings_path = os.getenv("EMBEDDINGS_PATH", "embeddings_data")
+    if backend == "qdrant":
+        sparse_path = os.getenv("BM25_INDEX_PATH", "bm25_index.pkl")
+        return VectorStore(collection_name, BM25Index.load(sparse_path) if os.path.exists(sparse_path) else None)
+    if backend == "numpy":
+        return LocalVectorStore.from_saved(embeddings_path, collection_name)
+    if backend == "ivf":
+        nprobe = os.getenv("IVF_NPROBE")
+        return AnnVectorStore.load(embeddings_path, os.getenv("IVF_INDEX_DIR", "ivf_index"),
+                                   nprobe=int(nprobe) if nprobe else None)
+    raise ValueError(f"Vector backend không hợp lệ: {backend}")
+
+
 if __name__ == "__main__":
     print("🚀 Bắt đầu chương trình lưu trữ vectors vào Qdrant...")
     
     # Đường dẫn đến file JSON và file embeddings đã lưu
     json_file_path = os.path.join('data', 'split_datanew.json')
-    output_file_path = 'embeddings_data.pkl'
+    output_file_path = 'embeddings_data'
+    legacy_file_path = 'embeddings_data.pkl'
 
     # Tạo hoặc tải embeddings
     handler = EmbeddingHandler()
-    if os.path.exists(output_file_path):
+    if not is_store(output_file_path) and os.path.exists(legacy_file_path):
+        convert_pickle(legacy_file_path, output_file_path)
+    if is_store(output_file_path):
         print("📂 Tải embeddings từ file đã lưu...")
         texts, embeddings, data = handler.load_saved_embeddings(output_file_path)
     else:
@@ -124,9 +929,12 @@ if __name__ == "__main__":
     if len(embeddings) > 0:
         print(f"Kích thước của embedding đầu tiên: {len(embeddings[0])} chiều.")
 
-    # Lưu trữ vào Qdrant
-    store = VectorStore()
-    store.create_collection()
-    store.upsert_vectors(texts, embeddings, data, batch_size=100)
+    # Chỉ mục BM25 cho tìm kiếm kết hợp, lưu lại để các lần ingest sau dùng cùng tham số
+    sparse_index = BM25Index.build(texts)
+    sparse_index.save('bm25_index.pkl')
+
+    # Đồng bộ vào Qdrant: chỉ ghi các đoạn mới/đã đổi và xóa các đoạn không còn
+    store = VectorStore(sparse_index=sparse_index)
+    store.sync(texts, embeddings, data, batch_size=100)
 
     print("🎉 Hoàn tất chương trình!")
\ No newline at end of file